@@ -1,11 +1,38 @@
+import hashlib
 import json
-from pathlib import Path
-import random
-import string
+import threading
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 from PIL import Image, ImageOps
 import datetime
 import re
+import tempfile
+from config import SALES_STAGES, GARAGES, GARAGE_COORDS, SALES_FILE
+from snapshot import sales_snapshot
+from archive import find_archived
+from attention import AttentionEngine
+from funnel import FunnelAnalytics
+from market import MarketStats
+from stock import load_stock, stock_signature
+from finance import payment_matrix, monthly_payment, DEFAULT_APR, DEFAULT_TERM, STANDARD_DEPOSITS
+from bonuses import load_engine as load_bonus_engine, rules_signature
+from offers import network_offers
+from valuation import estimate, history_signature, load_history as load_valuation_history
+from mot import open_store as open_mot_store, store_signature as mot_signature
+from mot import vehicle_history, next_due, normalise_registration
+from recalls import load_recalls, recalls_signature
+from mileage import screen as screen_mileage
+from providers import get_client as get_provider, ProviderError
+from bookings import BookingEngine, SlotUnavailable, HORIZON_DAYS
+from notify import Outbox
+from logistics import daily_plan
+from fleet import split_registrations, dedupe, appraise_fleet, error_row, to_csv, totals, MAX_FLEET_SIZE
+from tracking import get_allocator, parse_tracking_id, InvalidTrackingId
+from changefeed import ChangeFeed, POLL_INTERVAL as PIPELINE_REFRESH
+from journeys import JourneyStore, JourneyError
+from dedup import DedupIndex, ArchiveBloom
+from export import EXPORTS, XLSX_AVAILABLE, distinct, write_csv, write_xlsx
+from report import ReportService
 
 # ============================================================================
 # CONFIGURATION
@@ -17,67 +44,6 @@ PAGE_BG = "#e6f0fa"
 
 PLATE_REGEX = re.compile(r"[A-Z0-9]{5,10}", re.I)
 
-# Sales Pipeline Stages
-SALES_STAGES = [
-    {"name": "Deposit Taken", "icon": "💰", "color": "#4caf50"},
-    {"name": "Demands & Needs", "icon": "📋", "color": "#2196f3"},
-    {"name": "Sign/Ink Order", "icon": "✍️", "color": "#9c27b0"},
-    {"name": "Sell Option Extras", "icon": "🎁", "color": "#ff9800"},
-    {"name": "Collection Day", "icon": "🚗", "color": "#f44336"}
-]
-
-GARAGES = [
-    "Sytner BMW Cardiff - 285-287 Penarth Road",
-    "Sytner BMW Chigwell - Langston Road, Loughton",
-    "Sytner BMW Coventry - 128 Holyhead Road",
-    "Sytner BMW Harold Wood - A12 Colchester Road",
-    "Sytner BMW High Wycombe - 575-647 London Road",
-    "Sytner BMW Leicester - Meridian East",
-    "Sytner BMW Luton - 501 Dunstable Road",
-    "Sytner BMW Maidenhead - Bath Road",
-    "Sytner BMW Newport - Oak Way",
-    "Sytner BMW Nottingham - Lenton Lane",
-    "Sytner BMW Oldbury - 919 Wolverhampton Road",
-    "Sytner BMW Sheffield - Brightside Way",
-    "Sytner BMW Shrewsbury - 70 Battlefield Road",
-    "Sytner BMW Solihull - 520 Highlands Road",
-    "Sytner BMW Stevenage - Arlington Business Park",
-    "Sytner BMW Sunningdale - Station Road",
-    "Sytner BMW Swansea - 375 Carmarthen Road",
-    "Sytner BMW Tamworth - Winchester Rd",
-    "Sytner BMW Tring - Cow Roast",
-    "Sytner BMW Warwick - Fusiliers Way",
-    "Sytner BMW Wolverhampton - Lever Street",
-    "Sytner BMW Worcester - Knightsbridge Park"
-]
-
-GARAGE_COORDS = {
-    "Sytner BMW Cardiff": (51.4695, -3.1792),
-    "Sytner BMW Chigwell": (51.6460, 0.0750),
-    "Sytner BMW Coventry": (52.4162, -1.5121),
-    "Sytner BMW Harold Wood": (51.6089, 0.2458),
-    "Sytner BMW High Wycombe": (51.6248, -0.7489),
-    "Sytner BMW Leicester": (52.6111, -1.1175),
-    "Sytner BMW Luton": (51.8929, -0.4372),
-    "Sytner BMW Maidenhead": (51.5225, -0.6433),
-    "Sytner BMW Newport": (51.5665, -2.9871),
-    "Sytner BMW Nottingham": (52.9536, -1.1358),
-    "Sytner BMW Oldbury": (52.5050, -2.0150),
-    "Sytner BMW Sheffield": (53.4059, -1.4016),
-    "Sytner BMW Shrewsbury": (52.7280, -2.7350),
-    "Sytner BMW Solihull": (52.4114, -1.7869),
-    "Sytner BMW Stevenage": (51.9020, -0.2050),
-    "Sytner BMW Sunningdale": (51.3989, -0.6600),
-    "Sytner BMW Swansea": (51.6565, -3.9900),
-    "Sytner BMW Tamworth": (52.6342, -1.6950),
-    "Sytner BMW Tring": (51.7950, -0.6600),
-    "Sytner BMW Warwick": (52.2819, -1.5850),
-    "Sytner BMW Wolverhampton": (52.5867, -2.1280),
-    "Sytner BMW Worcester": (52.1936, -2.2200)
-}
-
-TIME_SLOTS = ["09:00 AM", "11:00 AM", "02:00 PM", "04:00 PM"]
-
 # ============================================================================
 # MOCK API FUNCTIONS
 # ============================================================================
@@ -115,44 +81,154 @@ def lookup_vehicle_basic(reg):
         "make": "BMW",
         "model": "3 Series",
         "year": 2018,
-        "vin": "WBA8BFAKEVIN12345",
+        # Stable per-plate mock VIN so duplicate checks can tell cars apart
+        "vin": "WBA8B" + hashlib.sha1(reg_clean.encode()).hexdigest()[:12].upper(),
         "mileage": 54000
     }
 
+@st.cache_resource
+def get_mot_store(mot_sig):
+    """Local MOT history store for one load of the bulk files"""
+    return open_mot_store()
+
+@st.cache_resource
+def get_outbox():
+    """Process-wide outbound message queue with its delivery workers running"""
+    return Outbox().start()
+
+@st.cache_resource
+def get_change_feed():
+    """Process-wide change feed over the sales and journey files"""
+    return ChangeFeed()
+
+@st.cache_resource
+def get_journey_store():
+    """Process-wide event-sourced journey store"""
+    return JourneyStore()
+
+@st.cache_resource
+def get_dedup_index():
+    """Registration/VIN index over live sales and journeys plus the archive filter"""
+    archive = ArchiveBloom()
+    archive.refresh()
+    return DedupIndex.from_feed(get_change_feed(), archive)
+
+def check_duplicates(vehicle):
+    """Live records for the same car, and whether the archive has possibly seen it"""
+    index = get_dedup_index()
+    index.sync(get_change_feed())
+    return index.check(vehicle.get("reg"), vehicle.get("vin"))
+
+@st.cache_resource
+def get_booking_engine():
+    """Process-wide workshop diary shared by every session"""
+    return BookingEngine()
+
+def lookup_tax_expiry(reg):
+    """Tax due date from the DVLA Vehicle Enquiry Service (mock when not configured)"""
+    client = get_provider("dvla_ves")
+    if client is None:
+        return (datetime.date.today() + datetime.timedelta(days=30)).isoformat()
+    try:
+        vehicle = client.post_json("/vehicle-enquiry/v1/vehicles", {"registrationNumber": normalise_registration(reg)})
+    except ProviderError:
+        return "Unavailable"
+    return (vehicle or {}).get("taxDueDate", "Unknown")
+
 def lookup_mot_and_tax(reg):
-    """Mock MOT and tax lookup"""
+    """MOT history from the local DVSA bulk store, then the MOT history API, then mock data"""
     today = datetime.date.today()
+    tax_expiry = lookup_tax_expiry(reg)
+    store = get_mot_store(mot_signature())
+    history = store.history(reg) if store else []
+    if history:
+        return {"mot_next_due": next_due(history) or "Unknown", "mot_history": history, "tax_expiry": tax_expiry}
+    client = get_provider("dvsa_mot")
+    if client is not None:
+        try:
+            vehicle = client.get_json(f"/v1/trade/vehicles/registration/{normalise_registration(reg)}")
+        except ProviderError:
+            return {"mot_next_due": "Unavailable", "mot_history": [], "tax_expiry": tax_expiry}
+        history = vehicle_history(vehicle) if vehicle else []
+        return {"mot_next_due": next_due(history) or "Unknown", "mot_history": history, "tax_expiry": tax_expiry}
     return {
         "mot_next_due": (today + datetime.timedelta(days=120)).isoformat(),
         "mot_history": [
             {"date": "2024-08-17", "result": "Pass", "mileage": 52000},
             {"date": "2023-08-10", "result": "Advisory", "mileage": 48000},
         ],
-        "tax_expiry": (today + datetime.timedelta(days=30)).isoformat(),
+        "tax_expiry": tax_expiry,
     }
 
-def lookup_recalls(reg_or_vin):
-    """Mock recall lookup"""
+@st.cache_resource
+def get_recall_index(recalls_sig):
+    """Interval-indexed recall campaigns for one version of the recalls file"""
+    return load_recalls()
+
+def lookup_recalls(reg_or_vin, vehicle=None):
+    """Recalls matched by make/model, build date and VIN (mock when there is no recalls file)"""
+    index = get_recall_index(recalls_signature())
+    if index is not None:
+        return index.match(vehicle or lookup_vehicle_basic(reg_or_vin))
     return [
         {"id": "R-2023-001", "summary": "Airbag inflator recall - replace module", "open": True},
         {"id": "R-2022-012", "summary": "Steering column check", "open": False}
     ]
 
-def get_history_flags(reg):
-    """Mock history check"""
+def get_history_flags(reg, mot_history=None, current_mileage=None):
+    """Mileage anomalies from the MOT history and current odometer; write-off/theft still mocked"""
+    readings = list(mot_history if mot_history is not None else lookup_mot_and_tax(reg)["mot_history"])
+    if current_mileage is not None:
+        readings.append({"date": datetime.date.today().isoformat(), "mileage": current_mileage})
+    mileage = screen_mileage([readings])[0]
     return {
         "write_off": False,
         "theft": False,
-        "mileage_anomaly": True,
-        "note": "Mileage shows a 5,000 jump in 2021 record"
+        "mileage_anomaly": mileage["mileage_anomaly"],
+        "note": mileage["note"],
     }
 
+@st.cache_resource
+def get_valuation_index(history_sig):
+    """Comparable-sales index for one version of the valuation history file"""
+    return load_valuation_history()
+
+def estimate_value_band(make, model, year, mileage, condition="good"):
+    """Comparable-sales valuation with confidence band"""
+    return estimate(get_valuation_index(history_signature()), make, model, year, mileage, condition)
+
 def estimate_value(make, model, year, mileage, condition="good"):
-    """Mock valuation"""
-    age = datetime.date.today().year - year
-    base = 25000 - (age * 2000) - (mileage / 10)
-    cond_multiplier = {"excellent": 1.05, "good": 1.0, "fair": 0.9, "poor": 0.8}
-    return max(100, int(base * cond_multiplier.get(condition, 1.0)))
+    """Comparable-sales valuation (formula fallback when there is no history)"""
+    return estimate_value_band(make, model, year, mileage, condition)["value"]
+
+def report_data(vehicle, mot_tax, recalls, history_flags):
+    """Everything a vehicle report shows, from lookups already made"""
+    return {
+        "vehicle": vehicle,
+        "mot_tax": mot_tax,
+        "recalls": recalls,
+        "history_flags": history_flags,
+        "valuation": estimate_value_band(vehicle["make"], vehicle["model"], vehicle["year"], vehicle["mileage"], "good"),
+        "market": get_vehicle_market(vehicle),
+    }
+
+def gather_report(reg):
+    """Look up everything a vehicle report shows (runs on the report workers)"""
+    vehicle = lookup_vehicle_basic(reg)
+    mot_tax = lookup_mot_and_tax(reg)
+    recalls = lookup_recalls(reg, vehicle)
+    history_flags = get_history_flags(reg, mot_tax["mot_history"], vehicle["mileage"])
+    return report_data(vehicle, mot_tax, recalls, history_flags)
+
+def report_data_version():
+    """Changes whenever any data a vehicle report shows could"""
+    sales = SALES_FILE.stat().st_mtime_ns if SALES_FILE.exists() else None
+    return (mot_signature(), recalls_signature(), history_signature(), sales, datetime.date.today().isoformat())
+
+@st.cache_resource
+def get_report_service():
+    """Process-wide PDF report workers and cache"""
+    return ReportService(gather_report, report_data_version)
 
 def mock_ocr_numberplate(image):
     """Mock OCR"""
@@ -225,7 +301,7 @@ def get_sytner_buyers():
 def load_sales_data():
     """Load sales check-in data from JSON file"""
     try:
-        sales_file = Path("data/sales_records.json")
+        sales_file = SALES_FILE
         if sales_file.exists():
             with open(sales_file, 'r') as f:
                 return json.load(f)
@@ -234,28 +310,50 @@ def load_sales_data():
         st.error(f"Error loading sales data: {e}")
         return []
 
+def load_sales_snapshot():
+    """Open the memory-mapped sales snapshot (rebuilt when the JSON changes)"""
+    try:
+        return sales_snapshot()
+    except Exception as e:
+        st.error(f"Error loading sales data: {e}")
+        return None
+
+@st.cache_resource
+def get_attention_engine(snapshot_signature):
+    """Attention engine for one sales snapshot generation (shared across sessions)"""
+    return AttentionEngine.from_snapshot(sales_snapshot())
+
+@st.cache_resource
+def get_funnel_analytics(snapshot_signature):
+    """Stage dwell-time funnel for one sales snapshot generation"""
+    return FunnelAnalytics.from_snapshot(sales_snapshot())
+
+@st.cache_resource
+def get_market_stats(snapshot_signature):
+    """Rolling market statistics for one sales snapshot generation"""
+    return MarketStats.from_snapshot(sales_snapshot())
+
+def get_vehicle_market(vehicle):
+    """Market statistics for a vehicle, or None when there is no sale history"""
+    sales = load_sales_snapshot()
+    if sales is None:
+        return None
+    return get_market_stats(sales.signature).stats(vehicle["make"], vehicle["model"], vehicle["year"])
+
 def generate_tracking_id():
-    """Generate unique tracking ID"""
-    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=12))
+    """Generate a time-sortable tracking ID not already used by any journey"""
+    return get_allocator().allocate(exists=lambda tracking_id: get_journey_by_tracking_id(tracking_id) is not None)
 
 def save_customer_journey(journey_data):
     """Save new customer journey"""
     try:
-        journeys_file = Path("data/customer_journeys.json")
-        journeys_file.parent.mkdir(exist_ok=True)
-        
-        if journeys_file.exists():
-            with open(journeys_file, 'r') as f:
-                journeys = json.load(f)
-        else:
-            journeys = []
-        
-        journeys.append(journey_data)
-        
-        with open(journeys_file, 'w') as f:
-            json.dump(journeys, f, indent=2)
-        
+        get_journey_store().create(journey_data, actor=journey_data.get("salesperson"))
+        # Publish straight away rather than waiting for the next dashboard poll
+        get_change_feed().sync("journeys")
         return True
+    except JourneyError as e:
+        st.error(f"🚫 {e}")
+        return False
     except Exception as e:
         st.warning(f"Could not save journey: {e}")
         return False
@@ -263,13 +361,10 @@ def save_customer_journey(journey_data):
 def get_journey_by_tracking_id(tracking_id):
     """Get journey by tracking ID"""
     try:
-        journeys_file = Path("data/customer_journeys.json")
-        if journeys_file.exists():
-            with open(journeys_file, 'r') as f:
-                journeys = json.load(f)
-            for journey in journeys:
-                if journey.get('tracking_id') == tracking_id:
-                    return journey
+        journey = get_journey_store().get(tracking_id)
+        if journey is not None:
+            return journey
+        return find_archived("journeys", tracking_id)
     except:
         pass
     return None
@@ -304,6 +399,8 @@ def init_session_state():
         "create_journey_mode": False,
         "journey_data": {},
         "journey_created": None,
+        "fleet_results": None,
+        "pipeline_live": None,
     }
     for key, value in defaults.items():
         if key not in st.session_state:
@@ -701,6 +798,90 @@ def render_input_page():
         else:
             st.error("❌ Please enter a valid registration")
 
+def appraise_vehicle(reg):
+    """Lookup and valuation for one registration as a fleet summary row"""
+    vehicle = lookup_vehicle_basic(reg)
+    mot_tax = lookup_mot_and_tax(reg)
+    recalls = lookup_recalls(reg, vehicle)
+    history_flags = get_history_flags(reg, mot_tax["mot_history"], vehicle["mileage"])
+    data = report_data(vehicle, mot_tax, recalls, history_flags)
+    valuation = data["valuation"]
+    # Render the car's PDF from these lookups in the background, ready for the bundle download
+    get_report_service().submit(reg, data)
+    return {
+        "Registration": reg,
+        "Make": vehicle["make"],
+        "Model": vehicle["model"],
+        "Year": vehicle["year"],
+        "Mileage": vehicle["mileage"],
+        "Value": valuation["value"],
+        "Low": valuation["low"],
+        "High": valuation["high"],
+        "Next MOT": mot_tax["mot_next_due"],
+        "Open Recalls": sum(1 for r in recalls if r["open"]),
+        "Mileage Anomaly": history_flags["mileage_anomaly"],
+        "Status": history_flags["note"] or "OK",
+    }
+
+def render_fleet_page():
+    """Render bulk appraisal for a list of registrations"""
+    st.markdown("### 🚚 Fleet Appraisal")
+    st.caption("Paste registrations (one per line) or upload a CSV with a registration column")
+
+    text = st.text_area("Registrations", height=160, placeholder="AB12 CDE\nKT68 XYZ", key="fleet_text")
+    upload = st.file_uploader("Upload CSV", type=["csv", "txt"], key="fleet_upload")
+    if upload is not None:
+        text = upload.getvalue().decode("utf-8-sig")
+
+    entries = split_registrations(text or "")
+    invalid = [reg for reg in entries if not validate_registration(reg)]
+    regs = dedupe([reg for reg in entries if validate_registration(reg)], normalise_registration)
+    if invalid:
+        st.warning(f"⚠️ {len(invalid)} invalid registration(s) skipped: {', '.join(invalid[:10])}")
+    if len(regs) > MAX_FLEET_SIZE:
+        st.warning(f"⚠️ Only the first {MAX_FLEET_SIZE} registrations will be appraised")
+        regs = regs[:MAX_FLEET_SIZE]
+
+    if st.button(f"🔍 Appraise {len(regs)} Vehicle(s)", disabled=not regs, type="primary", use_container_width=True):
+        rows = [None] * len(regs)
+        progress = st.progress(0.0)
+        table = st.empty()
+        ctx = get_script_run_ctx()
+        completed, last_draw = 0, 0.0
+        for idx, reg, row, error in appraise_fleet(
+                regs, appraise_vehicle, initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx)):
+            rows[idx] = row or error_row(reg, error)
+            completed += 1
+            # Redraw at most a few times a second; a table per result would dominate
+            now = datetime.datetime.now().timestamp()
+            if now - last_draw > 0.25 or completed == len(regs):
+                progress.progress(completed / len(regs), text=f"{completed}/{len(regs)} appraised")
+                table.dataframe([r for r in rows if r], hide_index=True)
+                last_draw = now
+        table.empty()
+        st.session_state.fleet_results = rows
+
+    rows = st.session_state.fleet_results
+    if rows:
+        summary = totals(rows)
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Vehicles", summary["vehicles"])
+        col2.metric("Total Value", f"£{summary['total_value']:,}")
+        col3.metric("Flagged", summary["flagged"])
+        col4.metric("Failed", summary["failed"])
+        st.dataframe(rows, hide_index=True)
+        st.download_button("📥 Download Summary (CSV)", to_csv(rows), file_name="fleet_appraisal.csv",
+                           mime="text/csv", use_container_width=True)
+        
+        def bundle_reports():
+            out = tempfile.TemporaryFile()
+            get_report_service().bundle([r["Registration"] for r in rows if r["Value"] is not None], out)
+            out.seek(0)
+            return out
+        
+        st.download_button("📄 Download Vehicle Reports (ZIP of PDFs)", bundle_reports,
+                           file_name="fleet_reports.zip", mime="application/zip", use_container_width=True)
+
 def render_sytner_buyers(vehicle, reg):
     """Render location-based buyer assignment"""
     buyers = get_sytner_buyers()
@@ -765,6 +946,12 @@ def render_sytner_buyers(vehicle, reg):
                 
                 if submitted and customer_name and customer_phone and customer_email:
                     ref = f"REQ-{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}"
+                    get_outbox().enqueue(
+                        "email", buyer['email'],
+                        f"{customer_name} ({customer_phone}, {customer_email}) would like an appraisal of "
+                        f"{reg} - {vehicle['year']} {vehicle['make']} {vehicle['model']}. Timeline: {urgency}.",
+                        subject=f"Trade-in request {ref}: {reg}",
+                    )
                     st.success(f"✅ Request Sent! Reference: {ref}")
                     st.balloons()
                     del st.session_state[f"ping_form_{buyer['email']}"]
@@ -777,12 +964,17 @@ def render_market_trends(vehicle):
     """Display market trends"""
     st.markdown("#### 📊 Market Intelligence")
     
+    market = get_vehicle_market(vehicle)
+    demand = market['demand'] if market else "N/A"
+    days_to_sell = market['days_to_sell'] if market else "N/A"
+    vehicle_share = f"{market['vehicle_share_pct']}%" if market else "N/A"
+    
     col1, col2, col3 = st.columns(3)
     with col1:
         st.markdown(f"""
         <div style='background: linear-gradient(135deg, #4caf50 0%, #45a049 100%); 
                     padding: 20px; border-radius: 12px; text-align: center; color: white;'>
-            <div style='font-size: 32px; font-weight: 700;'>HIGH</div>
+            <div style='font-size: 32px; font-weight: 700;'>{demand}</div>
             <div style='font-size: 14px; margin-top: 8px;'>Demand Level</div>
         </div>
         """, unsafe_allow_html=True)
@@ -790,19 +982,24 @@ def render_market_trends(vehicle):
         st.markdown(f"""
         <div style='background: linear-gradient(135deg, {ACCENT} 0%, #1873cc 100%); 
                     padding: 20px; border-radius: 12px; text-align: center; color: white;'>
-            <div style='font-size: 32px; font-weight: 700;'>12</div>
+            <div style='font-size: 32px; font-weight: 700;'>{days_to_sell}</div>
             <div style='font-size: 14px; margin-top: 8px;'>Days to sell</div>
         </div>
         """, unsafe_allow_html=True)
     with col3:
-        st.markdown("""
+        st.markdown(f"""
         <div style='background: linear-gradient(135deg, #ff9800 0%, #f57c00 100%); 
                     padding: 20px; border-radius: 12px; text-align: center; color: white;'>
-            <div style='font-size: 32px; font-weight: 700;'>87%</div>
-            <div style='font-size: 14px; margin-top: 8px;'>Of asking price</div>
+            <div style='font-size: 32px; font-weight: 700;'>{vehicle_share}</div>
+            <div style='font-size: 14px; margin-top: 8px;'>Car's share of deal price</div>
         </div>
         """, unsafe_allow_html=True)
     
+    if market:
+        st.caption(f"Based on {market['sales']} sale(s) in the last 12 months • {market['basis']}")
+    else:
+        st.caption("No closed sales in the last 12 months to base these figures on")
+    
     st.markdown("---")
     st.markdown("##### 📈 6-Month Price Forecast")
     
@@ -825,20 +1022,44 @@ def render_market_trends(vehicle):
         </div>
         """, unsafe_allow_html=True)
 
+@st.cache_resource
+def get_stock_index(stock_sig):
+    """Stock index for one version of the stock file (shared across sessions)"""
+    return load_stock()
+
 def render_upgrade_options(vehicle, trade_in_value):
     """Show potential upgrade options"""
     st.markdown("### 🚗 Potential Upgrades")
     
-    upgrade_options = [
-        {"model": "BMW 3 Series 320d M Sport", "year": 2023, "price": 38000},
-        {"model": "BMW X3 xDrive20d M Sport", "year": 2023, "price": 48000},
-        {"model": "BMW 5 Series 530e M Sport", "year": 2024, "price": 52000},
-    ]
+    stock = get_stock_index(stock_signature())
+    garage_name = st.session_state.get("garage_selector", GARAGES[0]).split(" - ")[0]
     
-    for car in upgrade_options:
+    col1, col2 = st.columns(2)
+    with col1:
+        monthly_budget = st.slider("Monthly budget (£)", 100, 2000, 600, step=50, key="upgrade_budget")
+    with col2:
+        body_type = st.selectbox("Body type", ["Any"] + stock.body_types, key="upgrade_body_type")
+    
+    upgrade_options = stock.recommend_for(
+        trade_in_value, monthly_budget, garage_name,
+        None if body_type == "Any" else body_type
+    )
+    
+    if not upgrade_options:
+        st.info("No matching stock available right now")
+    
+    for unit in upgrade_options:
+        car = {"model": f"{unit['make']} {unit['model']} {unit['variant']}".strip(),
+               "year": unit['year'], "price": unit['price']}
         remaining_amount = car['price'] - trade_in_value
         trade_in_percentage = int((trade_in_value / car['price']) * 100)
-        monthly_payment = int(remaining_amount * 0.023)
+        monthly = int(monthly_payment(remaining_amount))
+        if unit['garage']:
+            location = f" • 📍 {unit['garage']} ({unit['distance']:.0f} mi)"
+        else:
+            location = ""
+        if unit['over_budget']:
+            location += " • Above budget"
         
         border_color = "#4caf50" if trade_in_percentage >= 40 else ACCENT if trade_in_percentage >= 25 else "#ff9800"
         
@@ -850,7 +1071,7 @@ def render_upgrade_options(vehicle, trade_in_value):
                     <div style='font-size: 18px; font-weight: 700; color: {PRIMARY};'>
                         🚘 {car['model']}
                     </div>
-                    <div style='font-size: 13px; color: #666;'>{car['year']} Model • £{car['price']:,}</div>
+                    <div style='font-size: 13px; color: #666;'>{car['year']} Model • £{car['price']:,}{location}</div>
                 </div>
                 <div style='text-align: right;'>
                     <div style='background-color: {border_color}; color: white; padding: 4px 10px; 
@@ -892,38 +1113,89 @@ def render_upgrade_options(vehicle, trade_in_value):
                     MONTHLY
                 </div>
                 <div style='font-size: 20px; font-weight: 700; color: {ACCENT};'>
-                    £{monthly_payment}/mo
+                    £{monthly:,}/mo
                 </div>
             </div>
             """, unsafe_allow_html=True)
+    
+    if upgrade_options:
+        st.caption(f"Monthly figures are HP over {DEFAULT_TERM} months at {DEFAULT_APR}% APR with the trade-in as deposit")
+        render_finance_options(upgrade_options, trade_in_value)
 
-def render_deal_accelerator(base_value):
+def render_finance_options(upgrade_options, trade_in_value):
+    """Render the PCP/HP payment matrix for a chosen upgrade"""
+    with st.expander("💷 Finance Options"):
+        labels = [f"{u['make']} {u['model']} {u['variant']} • £{u['price']:,}" for u in upgrade_options]
+        choice = st.selectbox("Vehicle", range(len(labels)), format_func=labels.__getitem__, key="finance_vehicle")
+        col1, col2 = st.columns(2)
+        with col1:
+            product = st.radio("Product", ["PCP", "HP"], horizontal=True, key="finance_product")
+        with col2:
+            apr = st.number_input("APR (%)", 0.0, 30.0, DEFAULT_APR, step=0.1, key="finance_apr")
+        
+        price = upgrade_options[choice]['price']
+        # The trade-in goes down as deposit; the PCP final payment stays a share of the full cash price
+        quote = payment_matrix(price, apr, product, deposits=[trade_in_value + d for d in STANDARD_DEPOSITS])
+        table = {"Term": [f"{t} months" for t in quote['terms']]}
+        for col, deposit in enumerate(STANDARD_DEPOSITS):
+            table[f"+£{deposit:,} deposit"] = [f"£{m:,.2f}" for m in quote['monthly'][:, col]]
+        if product == "PCP":
+            table["Final payment"] = [f"£{b:,.0f}" for b in quote['balloon']]
+        st.dataframe(table, hide_index=True, use_container_width=True)
+
+@st.cache_resource
+def get_bonus_engine(stock_sig, rules_sig):
+    """Bonus rules engine for one version of the stock, rules and targets files"""
+    return load_bonus_engine(get_stock_index(stock_sig))
+
+def get_bonus_engine_current():
+    """Bonus engine for the current stock, rules and targets"""
+    return get_bonus_engine(stock_signature(), rules_signature())
+
+BONUS_CARD_STYLES = [
+    ("#e8f5e9", "#4caf50", "#2e7d32", "#1b5e20"),
+    ("#e3f2fd", ACCENT, "#1565c0", "#0d47a1"),
+]
+
+def get_network_offers(reg, vehicle, base_value):
+    """Ranked offers from every site, cached per registration for the session"""
+    customer_site = st.session_state.get("garage_selector", GARAGES[0]).split(" - ")[0]
+    cache = st.session_state.setdefault("network_offers", {})
+    cached = cache.get(reg)
+    if cached is None or cached["key"] != (customer_site, base_value):
+        result = network_offers(get_bonus_engine_current(), vehicle["make"], vehicle["model"],
+                                base_value, customer_site)
+        cached = cache[reg] = {"key": (customer_site, base_value), **result}
+    return cached
+
+def render_deal_accelerator(vehicle, base_value):
     """Render deal accelerator bonuses"""
     st.markdown("### 🚀 Deal Bonuses")
     
-    col1, col2 = st.columns(2)
-    with col1:
-        st.markdown("""
-        <div style='background-color: #e8f5e9; padding: 24px; border-radius: 12px; border-left: 6px solid #4caf50;'>
-            <div style='font-size: 20px; font-weight: 600; color: #2e7d32; margin-bottom: 12px;'>
-                📦 Stock Priority Bonus
-            </div>
-            <div style='font-size: 36px; font-weight: 900; color: #1b5e20; margin-bottom: 8px;'>+£500</div>
-            <div style='font-size: 14px; color: #666;'>We need this model in stock!</div>
-        </div>
-        """, unsafe_allow_html=True)
-    with col2:
-        st.markdown(f"""
-        <div style='background-color: #e3f2fd; padding: 24px; border-radius: 12px; border-left: 6px solid {ACCENT};'>
-            <div style='font-size: 20px; font-weight: 600; color: #1565c0; margin-bottom: 12px;'>
-                ⚡ Same-Day Completion
-            </div>
-            <div style='font-size: 36px; font-weight: 900; color: #0d47a1; margin-bottom: 8px;'>+£200</div>
-            <div style='font-size: 14px; color: #666;'>If completed today</div>
-        </div>
-        """, unsafe_allow_html=True)
+    garage_name = st.session_state.get("garage_selector", GARAGES[0]).split(" - ")[0]
+    applied = get_bonus_engine_current().bonuses(
+        vehicle["make"], vehicle["model"], garage_name, datetime.date.today()
+    )
+    
+    if not applied:
+        st.info(f"No bonuses currently apply at {garage_name}")
     
-    total_with_bonuses = base_value + 700
+    for row_start in range(0, len(applied), 2):
+        cols = st.columns(2)
+        for offset, bonus in enumerate(applied[row_start:row_start + 2]):
+            bg, border, title_color, amount_color = BONUS_CARD_STYLES[(row_start + offset) % 2]
+            with cols[offset]:
+                st.markdown(f"""
+                <div style='background-color: {bg}; padding: 24px; border-radius: 12px; border-left: 6px solid {border};'>
+                    <div style='font-size: 20px; font-weight: 600; color: {title_color}; margin-bottom: 12px;'>
+                        {bonus['label']}
+                    </div>
+                    <div style='font-size: 36px; font-weight: 900; color: {amount_color}; margin-bottom: 8px;'>+£{bonus['amount']:,}</div>
+                    <div style='font-size: 14px; color: #666;'>{bonus['note']}</div>
+                </div>
+                """, unsafe_allow_html=True)
+    
+    total_with_bonuses = base_value + sum(bonus['amount'] for bonus in applied)
     
     st.markdown(f"""
     <div style='background-color: #fff3cd; padding: 24px; border-radius: 12px; border-left: 4px solid #ffc107; margin-top: 24px;'>
@@ -940,11 +1212,12 @@ def render_mot_history(mot_history):
     for record in mot_history:
         result_icon = "✅" if record['result'] == "Pass" else "⚠️"
         result_color = "#4caf50" if record['result'] == "Pass" else "#ff9800"
+        mileage = f"{record['mileage']:,} miles" if record['mileage'] is not None else "Mileage not recorded"
         st.markdown(f"""
         <div style='background-color: #f5f5f5; padding: 16px; border-radius: 8px; margin-bottom: 12px; border-left: 4px solid {result_color};'>
             <div style='display: flex; justify-content: space-between; align-items: center;'>
                 <div><strong>{result_icon} {record['result']}</strong> - {record['date']}</div>
-                <div style='color: #666;'>{record['mileage']:,} miles</div>
+                <div style='color: #666;'>{mileage}</div>
             </div>
         </div>
         """, unsafe_allow_html=True)
@@ -981,28 +1254,50 @@ def render_recalls_section(recalls, vehicle, reg):
                 st.rerun()
             
             if st.session_state.booking_forms.get(recall_key):
+                engine = get_booking_engine()
+                col1, col2 = st.columns(2)
+                with col1:
+                    garage = st.selectbox("Garage", GARAGES, key=f"recall_garage_{recall_key}")
+                    from_date = st.date_input("From", min_value=datetime.date.today(),
+                                              max_value=datetime.date.today() + datetime.timedelta(days=HORIZON_DAYS - 1),
+                                              key=f"recall_from_{recall_key}")
+                with col2:
+                    max_miles = st.slider("Also search within (miles)", 0, 100, 25, 5, key=f"recall_miles_{recall_key}")
+                
+                options = engine.next_available(garage.split(" - ")[0], max_miles, from_date)
+                if not options:
+                    st.warning(f"⚠️ No free workshop slots within {max_miles} miles in the next {HORIZON_DAYS} days")
+                    choice = None
+                else:
+                    labels = [
+                        f"{o['date']:%a %d %b} • {o['slot']} • {o['site']}"
+                        + (f" ({o['distance']} mi)" if o['distance'] else "")
+                        for o in options
+                    ]
+                    picked = st.radio("Next available", labels, key=f"recall_slot_{recall_key}")
+                    choice = options[labels.index(picked)]
+                
                 with st.form(key=f"recall_form_{recall_key}"):
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        garage = st.selectbox("Garage", GARAGES)
-                        booking_date = st.date_input("Date", min_value=datetime.date.today())
-                    with col2:
-                        time_slot = st.selectbox("Time", TIME_SLOTS)
-                        customer_name = st.text_input("Name *")
-                    
+                    customer_name = st.text_input("Name *")
                     customer_phone = st.text_input("Phone *")
                     
                     col_x, col_y = st.columns(2)
                     with col_x:
-                        submitted = st.form_submit_button("✅ Confirm", type="primary")
+                        submitted = st.form_submit_button("✅ Confirm", type="primary", disabled=choice is None)
                     with col_y:
                         cancelled = st.form_submit_button("❌ Cancel")
                     
                     if submitted and customer_name and validate_phone(customer_phone):
-                        booking_ref = f"RCL-{recall['id']}-{datetime.datetime.now().strftime('%Y%m%d%H%M')}"
-                        st.success(f"✅ Booking Confirmed! Reference: {booking_ref}")
-                        del st.session_state.booking_forms[recall_key]
-                        st.balloons()
+                        try:
+                            booking = engine.book(choice["site"], choice["date"], choice["slot"], recall_id=recall['id'],
+                                                  reg=reg, name=customer_name, phone=customer_phone)
+                        except SlotUnavailable:
+                            st.error("❌ That slot has just been taken - please pick another")
+                        else:
+                            st.success(f"✅ Booking Confirmed! Reference: {booking['ref']} • "
+                                       f"{choice['site']}, {choice['date']:%a %d %b} at {choice['slot']}")
+                            del st.session_state.booking_forms[recall_key]
+                            st.balloons()
                     
                     if cancelled:
                         del st.session_state.booking_forms[recall_key]
@@ -1024,8 +1319,8 @@ def render_summary_page():
         with st.spinner("🔄 Fetching vehicle information..."):
             vehicle = lookup_vehicle_basic(reg)
             mot_tax = lookup_mot_and_tax(reg)
-            recalls = lookup_recalls(reg)
-            history_flags = get_history_flags(reg)
+            recalls = lookup_recalls(reg, vehicle)
+            history_flags = get_history_flags(reg, mot_tax["mot_history"], vehicle["mileage"])
     except Exception as e:
         st.error(f"⚠️ Error fetching vehicle data: {str(e)}")
         st.stop()
@@ -1035,27 +1330,35 @@ def render_summary_page():
     render_vehicle_summary(vehicle, mot_tax, history_flags, open_recalls)
     
     # Quick Market Snapshot
+    market = get_vehicle_market(vehicle)
     st.markdown(f"""
     <div style='background: linear-gradient(135deg, {PRIMARY} 0%, {ACCENT} 100%); 
                 padding: 20px; border-radius: 12px; margin-bottom: 20px; color: white;'>
         <h4 style='margin: 0 0 12px 0;'>📊 Quick Market Snapshot</h4>
         <div style='display: flex; justify-content: space-around; flex-wrap: wrap; gap: 16px;'>
             <div style='text-align: center;'>
-                <div style='font-size: 24px; font-weight: 700;'>HIGH</div>
+                <div style='font-size: 24px; font-weight: 700;'>{market['demand'] if market else "N/A"}</div>
                 <div style='font-size: 13px; opacity: 0.9;'>Demand</div>
             </div>
             <div style='text-align: center;'>
-                <div style='font-size: 24px; font-weight: 700;'>12 days</div>
+                <div style='font-size: 24px; font-weight: 700;'>{f"{market['days_to_sell']} days" if market else "N/A"}</div>
                 <div style='font-size: 13px; opacity: 0.9;'>To Sell</div>
             </div>
             <div style='text-align: center;'>
-                <div style='font-size: 24px; font-weight: 700;'>↑ +5%</div>
-                <div style='font-size: 13px; opacity: 0.9;'>Price Trend</div>
+                <div style='font-size: 24px; font-weight: 700;'>{f"{market['vehicle_share_pct']}%" if market else "N/A"}</div>
+                <div style='font-size: 13px; opacity: 0.9;'>Of Deal Price</div>
             </div>
         </div>
     </div>
     """, unsafe_allow_html=True)
     
+    # PDF report: starts rendering now, so it is usually ready by the time it is wanted
+    reports = get_report_service()
+    reports.submit(reg, report_data(vehicle, mot_tax, recalls, history_flags))
+    st.download_button("📄 Download Vehicle Report (PDF)", lambda: reports.report(reg),
+                       file_name=f"{normalise_registration(reg)}_report.pdf", mime="application/pdf",
+                       use_container_width=True)
+    
     # Main tabbed interface
     tab1, tab2, tab3, tab4, tab5 = st.tabs([
         "📋 MOT & Recalls",
@@ -1077,7 +1380,8 @@ def render_summary_page():
         render_sytner_buyers(vehicle, reg)
     
     with tab3:
-        base_value = estimate_value(vehicle["make"], vehicle["model"], vehicle["year"], vehicle["mileage"], "good")
+        valuation = estimate_value_band(vehicle["make"], vehicle["model"], vehicle["year"], vehicle["mileage"], "good")
+        base_value = valuation["value"]
         st.markdown("### 💰 Estimated Trade-In Value")
         
         st.markdown(f"""
@@ -1091,21 +1395,27 @@ def render_summary_page():
         </div>
         """, unsafe_allow_html=True)
         
+        if valuation["comparables"]:
+            st.caption(f"Range £{valuation['low']:,} – £{valuation['high']:,} • "
+                       f"based on {valuation['comparables']} comparable sales")
+        else:
+            st.caption("No comparable sales on record • formula estimate")
+        
         st.markdown("---")
         render_upgrade_options(vehicle, base_value)
         
         st.markdown("---")
-        render_deal_accelerator(base_value)
+        render_deal_accelerator(vehicle, base_value)
     
     with tab4:
         st.markdown("### 🏆 Best Offers Across Sytner Network")
-        total_value = base_value + 700
-        
+        network = get_network_offers(reg, vehicle, base_value)
         network_data = [
-            {"location": "Sytner BMW Solihull", "offer": total_value, "badge": "🏆 Best Offer"},
-            {"location": "Sytner BMW Birmingham", "offer": total_value - 200, "badge": ""},
-            {"location": "Sytner BMW Coventry", "offer": total_value - 400, "badge": ""},
+            {**loc, "badge": "🏆 Best Offer" if rank == 0 else ""}
+            for rank, loc in enumerate(network["offers"][:3])
         ]
+        if network["timed_out"]:
+            st.caption(f"⏱️ {len(network['timed_out'])} site(s) did not respond in time and are not shown")
         
         for loc in network_data:
             badge_html = f"<span style='color: #ffa726; margin-left: 8px;'>{loc['badge']}</span>" if loc['badge'] else ""
@@ -1117,6 +1427,7 @@ def render_summary_page():
                 </div>
                 <div style='text-align: right;'>
                     <div style='font-size: 24px; font-weight: 700; color: {PRIMARY};'>£{loc['offer']:,}</div>
+                    <div style='font-size: 12px; color: #666;'>{loc['distance']:.0f} mi • £{loc['transport_cost']:,} transport</div>
                 </div>
             </div>
             """, unsafe_allow_html=True)
@@ -1134,6 +1445,16 @@ def render_summary_page():
         st.rerun()
     
     if st.session_state.get('create_journey_mode', False):
+        duplicates = check_duplicates(vehicle)
+        existing_journeys = [rid for kind, rid in duplicates["matches"] if kind == "journeys"]
+        matching_sales = [rid for kind, rid in duplicates["matches"] if kind == "sales"]
+        if existing_journeys:
+            st.error(f"🚫 This vehicle already has a customer journey: {', '.join(existing_journeys)}")
+        if matching_sales:
+            st.warning(f"⚠️ This vehicle matches existing sale {', '.join(matching_sales)} - check it is not already in the pipeline")
+        if duplicates["archived"]:
+            st.info("ℹ️ This vehicle may have been through a journey or sale before (archived records)")
+        
         with st.form("journey_creation_form"):
             st.markdown("#### Customer & Sale Details")
             
@@ -1163,7 +1484,9 @@ def render_summary_page():
             with col_b:
                 cancelled = st.form_submit_button("❌ Cancel", use_container_width=True)
             
-            if submitted:
+            if submitted and existing_journeys:
+                st.error("⚠️ A journey already exists for this vehicle - update it from the Sales Pipeline instead")
+            elif submitted:
                 if customer_name and customer_email and customer_phone:
                     tracking_id = generate_tracking_id()
                     
@@ -1190,21 +1513,20 @@ def render_summary_page():
                         }
                     }
                     
-                    save_customer_journey(journey)
-                    
-                    # Save to session state to show share section outside form
-                    st.session_state.journey_created = {
-                        "tracking_id": tracking_id,
-                        "customer_name": customer_name,
-                        "customer_email": customer_email,
-                        "customer_phone": customer_phone,
-                        "vehicle_info": f"{vehicle['year']} {vehicle['make']} {vehicle['model']}",
-                        "tracking_url": f"https://your-app.streamlit.app/?track={tracking_id}"
-                    }
+                    if save_customer_journey(journey):
+                        # Save to session state to show share section outside form
+                        st.session_state.journey_created = {
+                            "tracking_id": tracking_id,
+                            "customer_name": customer_name,
+                            "customer_email": customer_email,
+                            "customer_phone": customer_phone,
+                            "vehicle_info": f"{vehicle['year']} {vehicle['make']} {vehicle['model']}",
+                            "tracking_url": f"https://your-app.streamlit.app/?track={tracking_id}"
+                        }
                     
-                    st.session_state.create_journey_mode = False
-                    st.balloons()
-                    st.rerun()
+                        st.session_state.create_journey_mode = False
+                        st.balloons()
+                        st.rerun()
                 else:
                     st.error("⚠️ Please fill in all required fields")
             
@@ -1264,8 +1586,8 @@ Sytner BMW Team"""
                 col_x, col_y = st.columns(2)
                 with col_x:
                     if st.form_submit_button("✉️ Send Email", type="primary"):
-                        st.success(f"✅ Email sent to {email_to}")
-                        st.info("💡 **Note:** In production, integrate with SendGrid, AWS SES, or your email service")
+                        get_outbox().enqueue("email", email_to, email_message, subject=email_subject)
+                        st.success(f"✅ Email queued for {email_to}")
                 with col_y:
                     if st.form_submit_button("Done"):
                         del st.session_state.journey_created
@@ -1285,8 +1607,8 @@ Sytner BMW Team"""
                 col_x, col_y = st.columns(2)
                 with col_x:
                     if st.form_submit_button("📲 Send SMS", type="primary"):
-                        st.success(f"✅ SMS sent to {sms_to}")
-                        st.info("💡 **Note:** In production, integrate with Twilio, AWS SNS, or your SMS service")
+                        get_outbox().enqueue("sms", sms_to, sms_message)
+                        st.success(f"✅ SMS queued for {sms_to}")
                 with col_y:
                     if st.form_submit_button("Done"):
                         del st.session_state.journey_created
@@ -1315,46 +1637,232 @@ qr.save('tracking_qr.png')
 # SALES PIPELINE PAGE
 # ============================================================================
 
+def load_pipeline_live():
+    """This session's pipeline rows, brought up to date from the change feed"""
+    feed = get_change_feed()
+    live = st.session_state.pipeline_live
+    if live is None:
+        feed.poll()
+        version, sales = feed.snapshot("sales")
+        _, journeys = feed.snapshot("journeys")
+        live = st.session_state.pipeline_live = {
+            "version": None, "sales_version": version, "journeys_version": version,
+            "sales": sales, "journeys": journeys, "flagged": set(), "attention": None,
+        }
+    live["sales_version"] = feed.apply(live["sales"], live["sales_version"], "sales")
+    live["journeys_version"] = feed.apply(live["journeys"], live["journeys_version"], "journeys")
+    version = max(live["sales_version"], live["journeys_version"])
+    if version != live["version"]:
+        # Attention flags only need recomputing when something has changed
+        sales = load_sales_snapshot()
+        live["attention"] = get_attention_engine(sales.signature) if sales is not None and len(sales) else None
+        live["flagged"] = set(live["attention"].needs_attention()) if live["attention"] else set()
+        live["version"] = version
+        live["updated"] = datetime.datetime.now()
+    return live
+
+@st.fragment(run_every=PIPELINE_REFRESH)
+def render_live_pipeline():
+    """Pipeline metrics and recent sales, re-run every few seconds for wall screens"""
+    live = load_pipeline_live()
+    sales = live["sales"]
+    attention, flagged = live["attention"], live["flagged"]
+    
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Total Active Sales", len(sales))
+    with col2:
+        total_value = sum(sale['total_price'] or 0 for sale in sales.values())
+        st.metric("Pipeline Value", f"£{total_value:,}")
+    with col3:
+        st.metric("Needs Attention", len(flagged))
+    with col4:
+        st.metric("Customer Journeys", len(live["journeys"]))
+    st.caption(f"Live - last change seen {live['updated']:%H:%M:%S}")
+    
+    st.markdown("---")
+    st.markdown("### Recent Sales")
+    
+    recent = sorted(sales.values(), key=lambda sale: sale['last_updated'], reverse=True)[:15]
+    for sale in recent:
+        progress_percentage = int((sale['stage'] + 1) / len(SALES_STAGES) * 100)
+        with st.expander(
+            f"{sale['first_name']} {sale['last_name']} - "
+            f"{sale['make']} {sale['model']} ({progress_percentage}%)"
+        ):
+            col1, col2 = st.columns(2)
+            with col1:
+                st.write(f"**Sale ID:** {sale['sale_id']}")
+                st.write(f"**Stage:** {SALES_STAGES[sale['stage']]['name']}")
+                if not sale['is_completed'] and attention is not None:
+                    days = attention.days_in_current_stage(sale['sale_id'])
+                    flag = " ⚠️" if sale['sale_id'] in flagged else ""
+                    st.write(f"**Days in Stage:** {days}{flag}")
+                st.write(f"**Salesperson:** {sale['salesperson']}")
+            with col2:
+                st.write(f"**Vehicle:** {sale['year']} {sale['make']} {sale['model']}")
+                st.write(f"**Registration:** {sale['registration']}")
+                st.write(f"**Total Price:** £{sale['total_price']:,}")
+            
+            st.progress(progress_percentage / 100)
+
 def render_sales_pipeline_page():
     """Render sales pipeline dashboard"""
     st.markdown("### 📊 Sales Pipeline Dashboard")
     st.markdown("*Track all active customer journeys*")
     
-    sales_data = load_sales_data()
+    sales = load_sales_snapshot()
     
-    if sales_data:
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            st.metric("Total Active Sales", len(sales_data))
-        with col2:
-            total_value = sum(sale['financial'].get('total_price', 0) for sale in sales_data)
-            st.metric("Pipeline Value", f"£{total_value:,}")
-        with col3:
-            needs_attention = sum(1 for sale in sales_data if sale['status'].get('needs_attention', False))
-            st.metric("Needs Attention", needs_attention)
+    if sales is not None and len(sales):
+        render_live_pipeline()
         
         st.markdown("---")
-        st.markdown("### Recent Sales")
-        
-        for sale in sales_data[:15]:
-            with st.expander(
-                f"{sale['customer']['first_name']} {sale['customer']['last_name']} - "
-                f"{sale['vehicle']['make']} {sale['vehicle']['model']} ({sale['pipeline']['progress_percentage']}%)"
-            ):
-                col1, col2 = st.columns(2)
-                with col1:
-                    st.write(f"**Sale ID:** {sale['sale_id']}")
-                    st.write(f"**Stage:** {sale['pipeline']['current_stage']}")
-                    st.write(f"**Salesperson:** {sale['salesperson']['name']}")
-                with col2:
-                    st.write(f"**Vehicle:** {sale['vehicle']['year']} {sale['vehicle']['make']} {sale['vehicle']['model']}")
-                    st.write(f"**Registration:** {sale['vehicle']['registration']}")
-                    st.write(f"**Total Price:** £{sale['financial']['total_price']:,}")
-                
-                progress = sale['pipeline']['progress_percentage'] / 100
-                st.progress(progress)
+        st.markdown("### ⏱️ Stage Dwell Times")
+        funnel = get_funnel_analytics(sales.signature)
+        view = st.selectbox("Show for", ["All salespeople"] + funnel.keys("salesperson"), key="funnel_view")
+        if view == "All salespeople":
+            st.dataframe(funnel.report(), hide_index=True, use_container_width=True)
+        else:
+            st.dataframe(funnel.report("salesperson", view), hide_index=True, use_container_width=True)
     else:
         st.info("📋 No sales data available. Create customer journeys from TradeSnap to see them here!")
+    
+    render_journey_updates()
+    render_transfer_plan()
+    render_pipeline_export()
+
+def journey_label(journey):
+    vehicle = journey.get('vehicle') or {}
+    stage = SALES_STAGES[journey.get('current_stage', 0)]['name']
+    return (f"{journey['tracking_id']} - {(journey.get('customer') or {}).get('name')} - "
+            f"{vehicle.get('make')} {vehicle.get('model')} ({stage})")
+
+def render_journey_updates():
+    """Staff controls for moving customer journeys through the pipeline"""
+    store = get_journey_store()
+    journeys = {j['tracking_id']: j for j in store.all()}
+    if not journeys:
+        return
+    
+    st.markdown("---")
+    st.markdown("### 🧭 Update Customer Journeys")
+    stage_names = [stage['name'] for stage in SALES_STAGES]
+    
+    with st.form("bulk_stage_form"):
+        selected = st.multiselect("Journeys", list(journeys), format_func=lambda t: journey_label(journeys[t]))
+        target = st.selectbox("Move to stage", stage_names, index=len(stage_names) - 1)
+        if st.form_submit_button("⏩ Advance Selected", use_container_width=True):
+            try:
+                moved = store.advance_many(selected, target, actor="pipeline")
+                get_change_feed().sync("journeys")
+                st.success(f"✅ {moved} journey(s) moved to {target}")
+            except JourneyError as e:
+                st.error(f"❌ No journeys updated: {e}")
+    
+    tracking_id = st.selectbox("Journey", list(journeys), format_func=lambda t: journey_label(journeys[t]),
+                               key="journey_update_id")
+    journey = journeys[tracking_id]
+    col1, col2 = st.columns(2)
+    with col1:
+        note = st.text_input("Add a note", key=f"journey_note_{tracking_id}")
+        if st.button("📝 Add Note", key=f"journey_note_btn_{tracking_id}"):
+            try:
+                store.add_note(tracking_id, note, actor="pipeline")
+                st.rerun()
+            except JourneyError as e:
+                st.error(f"❌ {e}")
+    with col2:
+        current = datetime.date.fromisoformat(journey['collection_date'][:10]) if journey.get('collection_date') else datetime.date.today()
+        new_date = st.date_input("Collection date", value=current, key=f"journey_date_{tracking_id}")
+        if st.button("📅 Change Date", key=f"journey_date_btn_{tracking_id}"):
+            try:
+                store.change_collection_date(tracking_id, new_date, actor="pipeline")
+                get_change_feed().sync("journeys")
+                st.rerun()
+            except JourneyError as e:
+                st.error(f"❌ {e}")
+    
+    with st.expander("🗂️ Journey history"):
+        for event in store.history(tracking_id):
+            data = event['data']
+            details = {
+                "journey_created": "Journey created",
+                "stage_advanced": f"Moved to {stage_names[data.get('stage', 0)]}",
+                "note_added": f"Note: {data.get('text')}",
+                "collection_date_changed": f"Collection date changed to {data.get('date')}",
+            }[event['type']]
+            by = f" ({event['actor']})" if event['actor'] else ""
+            st.write(f"**{event['at'][:16].replace('T', ' ')}** - {details}{by}")
+
+def render_transfer_plan():
+    """Where each trade-in handed over on a day should go to sell soonest"""
+    st.markdown("---")
+    st.markdown("### 🚚 Trade-in Transfers")
+    day = st.date_input("Handover date", value=datetime.date.today(), key="transfer_day")
+    journeys = {j['tracking_id']: j for j in get_journey_store().all()}
+    plan = daily_plan(journeys.values(), get_stock_index(stock_signature()).units, day)
+    if not plan:
+        st.caption("No trade-ins are handed over on this date")
+        return
+    rows = []
+    for move in plan:
+        vehicle = journeys[move['id']].get('vehicle') or {}
+        if move['to'] is None:
+            action = "No free slot - stays"
+        else:
+            action = "Stay" if move['to'] == move['from'] else f"Move to {move['to']}"
+        rows.append({
+            "Tracking ID": move['id'],
+            "Vehicle": f"{vehicle.get('year')} {vehicle.get('make')} {vehicle.get('model')}",
+            "At": move['from'],
+            "Plan": action,
+            "Miles": move['miles'],
+            "Cost": f"£{move['cost']:,.2f}" if move['cost'] is not None else "-",
+        })
+    moving = sum(1 for move in plan if move['to'] not in (None, move['from']))
+    st.caption(f"{len(plan)} trade-in(s), {moving} to move")
+    st.dataframe(rows, hide_index=True, use_container_width=True)
+
+def render_pipeline_export():
+    """Filtered CSV/XLSX download of sales or journeys, generated when clicked"""
+    st.markdown("---")
+    st.markdown("### 📤 Export")
+    kind = st.radio("Records", ["sales", "journeys"], format_func=str.title, horizontal=True, key="export_kind")
+    spec = EXPORTS[kind]
+    labels = list(spec["columns"])
+    columns = st.multiselect("Columns", labels, default=labels, key=f"export_columns_{kind}")
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        stages = st.multiselect("Stage", [stage['name'] for stage in SALES_STAGES], key=f"export_stages_{kind}")
+    with col2:
+        people = st.multiselect("Salesperson", distinct(kind, "Salesperson"), key=f"export_people_{kind}")
+    with col3:
+        dates = st.date_input(spec["partition_by"], value=(), key=f"export_dates_{kind}")
+    include_archive = st.checkbox("Include archived records", key="export_archive")
+    formats = ["CSV", "XLSX"] if XLSX_AVAILABLE else ["CSV"]
+    fmt = st.radio("Format", formats, horizontal=True, key="export_format")
+    if not XLSX_AVAILABLE:
+        st.caption("Install openpyxl for Excel downloads")
+    
+    filters = {"Stage": stages, "Salesperson": people}
+    if len(dates) == 2:
+        filters[spec["partition_by"]] = tuple(dates)
+    writer = write_xlsx if fmt == "XLSX" else write_csv
+    
+    def generate():
+        # Runs on its own thread when clicked; rows stream to a temp file rather than memory
+        out = tempfile.TemporaryFile()
+        writer(out, kind, columns or None, filters, include_archive)
+        out.seek(0)
+        return out
+    
+    st.download_button(
+        f"📥 Download {kind.title()} ({fmt})", generate,
+        file_name=f"{kind}_{datetime.date.today():%Y%m%d}.{fmt.lower()}",
+        mime="text/csv" if fmt == "CSV" else "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        use_container_width=True,
+    )
 
 # ============================================================================
 # CUSTOMER TRACKER PAGE
@@ -1373,12 +1881,17 @@ def render_customer_tracker_page():
     
     tracking_id = st.text_input(
         "Enter your tracking ID",
-        placeholder="ABC123XYZ456",
+        placeholder="01M5A690Z200003H461K0",
         help="You received this in your confirmation email/SMS"
     )
     
     if tracking_id:
-        journey = get_journey_by_tracking_id(tracking_id.upper())
+        try:
+            tracking_id = parse_tracking_id(tracking_id)
+        except InvalidTrackingId as e:
+            st.error(f"❌ {e}")
+            return
+        journey = get_journey_by_tracking_id(tracking_id)
         
         if journey:
             render_wheel_tracker(journey.get('current_stage', 0), SALES_STAGES)
@@ -1476,8 +1989,15 @@ def render_customer_tracker_page():
                         with col_x:
                             if st.form_submit_button("✉️ Send", type="primary"):
                                 if recipient_email:
-                                    st.success(f"✅ Tracking link sent to {recipient_email}")
-                                    st.info("💡 Email service integration required in production")
+                                    greeting = f"Hi {recipient_name}," if recipient_name else "Hi,"
+                                    get_outbox().enqueue(
+                                        "email", recipient_email,
+                                        f"{greeting}\n\n{journey['customer']['name']} has shared the progress of their "
+                                        f"{journey['vehicle']['make']} {journey['vehicle']['model']} with you:"
+                                        f"\n\n{share_url}\n\nSytner BMW",
+                                        subject="Follow a Sytner vehicle journey",
+                                    )
+                                    st.success(f"✅ Tracking link queued for {recipient_email}")
                                     del st.session_state[f"share_email_{tracking_id}"]
                         with col_y:
                             if st.form_submit_button("❌ Cancel"):
@@ -1494,8 +2014,11 @@ def render_customer_tracker_page():
                         with col_x:
                             if st.form_submit_button("📲 Send", type="primary"):
                                 if recipient_phone:
-                                    st.success(f"✅ Tracking link sent to {recipient_phone}")
-                                    st.info("💡 SMS service integration required in production")
+                                    get_outbox().enqueue(
+                                        "sms", recipient_phone,
+                                        f"{journey['customer']['name']} shared their Sytner vehicle progress: {share_url}",
+                                    )
+                                    st.success(f"✅ Tracking link queued for {recipient_phone}")
                                     del st.session_state[f"share_sms_{tracking_id}"]
                         with col_y:
                             if st.form_submit_button("❌ Cancel"):
@@ -1541,6 +2064,7 @@ def main():
         page = st.radio(
             "Select Feature",
             ["🚗 TradeSnap - Vehicle Lookup", 
+             "🚚 Fleet Appraisal",
              "📊 Sales Pipeline - Track Sales", 
              "🔍 Customer Tracker"],
             label_visibility="collapsed"
@@ -1550,6 +2074,8 @@ def main():
         st.markdown("""
         **TradeSnap**: Vehicle lookup and trade-in valuation
         
+        **Fleet Appraisal**: Bulk valuation for a list of registrations
+        
         **Sales Pipeline**: View all active sales and progress
         
         **Customer Tracker**: Customer-facing progress view
@@ -1566,6 +2092,9 @@ def main():
         else:
             render_input_page()
     
+    elif "Fleet" in page:
+        render_fleet_page()
+    
     elif "Sales Pipeline" in page:
         render_sales_pipeline_page()
     
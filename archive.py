@@ -0,0 +1,225 @@
+# archive.py
+# Hot/cold tiering for sales records and customer journeys.
+#
+# Completed or old records are moved out of the hot JSON files into
+# gzip-compressed, month-partitioned archive files:
+#
+#   data/archive/manifest.json
+#   data/archive/sales/2025-10.json.gz
+#   data/archive/journeys/2025-11.json.gz
+#
+# The manifest lists each partition and maps every archived key to its month,
+# so a lookup decompresses exactly one partition. Lookups share one parsed
+# copy of the manifest until its mtime changes. Run `python archive.py` to
+# tier the data and print hot-path latency and disk footprint before/after.
+import datetime
+import gzip
+import json
+import os
+import sys
+import time
+from functools import lru_cache
+
+from config import DATA_DIR, SALES_FILE, JOURNEYS_FILE, SALES_STAGES
+
+ARCHIVE_DIR = DATA_DIR / "archive"
+MANIFEST_FILE = ARCHIVE_DIR / "manifest.json"
+
+MAX_HOT_AGE_DAYS = 90
+
+# ============================================================================
+# TIERING POLICY
+# ============================================================================
+
+def _month(timestamp):
+    """Partition month ("YYYY-MM") for an ISO timestamp"""
+    return timestamp[:7] if timestamp else "undated"
+
+def _is_cold_sale(sale, cutoff):
+    """Completed sales, and sales untouched since the cutoff, go cold"""
+    if sale.get("status", {}).get("is_completed"):
+        return True
+    last_updated = sale.get("dates", {}).get("last_updated")
+    return bool(last_updated) and last_updated < cutoff
+
+def _is_cold_journey(journey, cutoff):
+    """Journeys at the final stage, and journeys created before the cutoff, go cold"""
+    if journey.get("current_stage", 0) >= len(SALES_STAGES) - 1:
+        return True
+    created = journey.get("created_date")
+    return bool(created) and created < cutoff
+
+TIERS = {
+    "sales": {
+        "source": SALES_FILE,
+        "key": "sale_id",
+        "is_cold": _is_cold_sale,
+        "month_of": lambda sale: _month(sale.get("dates", {}).get("deposit_date")),
+    },
+    "journeys": {
+        "source": JOURNEYS_FILE,
+        "key": "tracking_id",
+        "is_cold": _is_cold_journey,
+        "month_of": lambda journey: _month(journey.get("created_date")),
+    },
+}
+
+# ============================================================================
+# STORAGE
+# ============================================================================
+
+def _write_atomic(path, data):
+    """Write bytes to path via a temporary file and rename"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+@lru_cache(maxsize=2)
+def _read_manifest_cached(path, mtime_ns, size):
+    with open(path, "r") as f:
+        return json.load(f)
+
+def load_manifest(cache=True):
+    """Load the archive manifest
+
+    The cached copy is shared by every lookup until the file changes, so
+    callers must not modify it; the tiering job loads with cache=False.
+    """
+    if not MANIFEST_FILE.exists():
+        return {kind: {"partitions": {}, "index": {}} for kind in TIERS}
+    if not cache:
+        with open(MANIFEST_FILE, "r") as f:
+            return json.load(f)
+    stat = MANIFEST_FILE.stat()
+    return _read_manifest_cached(str(MANIFEST_FILE), stat.st_mtime_ns, stat.st_size)
+
+def _partition_path(kind, month):
+    return ARCHIVE_DIR / kind / f"{month}.json.gz"
+
+@lru_cache(maxsize=32)
+def _read_partition_cached(path, mtime_ns):
+    with gzip.open(path, "rb") as f:
+        return json.loads(f.read())
+
+def read_partition(kind, month, cache=True):
+    """Decompress one archive partition (cache=False for one-off scans such as exports)"""
+    path = _partition_path(kind, month)
+    if not path.exists():
+        return []
+    if not cache:
+        with gzip.open(path, "rb") as f:
+            return json.loads(f.read())
+    return _read_partition_cached(str(path), path.stat().st_mtime_ns)
+
+def _write_partition(kind, month, records):
+    data = json.dumps(records, separators=(",", ":")).encode()
+    path = _partition_path(kind, month)
+    _write_atomic(path, gzip.compress(data, compresslevel=6))
+    return path.stat().st_size
+
+# ============================================================================
+# TIERING JOB
+# ============================================================================
+
+def tier(kind, now=None, max_age_days=MAX_HOT_AGE_DAYS, manifest=None):
+    """Move cold records of one kind from the hot file into the archive"""
+    spec = TIERS[kind]
+    source = spec["source"]
+    if not source.exists():
+        return {"moved": 0, "kept": 0}
+    now = now or datetime.datetime.now()
+    cutoff = (now - datetime.timedelta(days=max_age_days)).isoformat()
+
+    with open(source, "rb") as f:
+        records = json.loads(f.read())
+    hot, cold_by_month = [], {}
+    for record in records:
+        if spec["is_cold"](record, cutoff):
+            cold_by_month.setdefault(spec["month_of"](record), []).append(record)
+        else:
+            hot.append(record)
+    if not cold_by_month:
+        return {"moved": 0, "kept": len(hot)}
+
+    manifest = manifest if manifest is not None else load_manifest(cache=False)
+    section = manifest.setdefault(kind, {"partitions": {}, "index": {}})
+    key = spec["key"]
+    for month, cold in cold_by_month.items():
+        merged = {r[key]: r for r in read_partition(kind, month)}
+        merged.update((r[key], r) for r in cold)
+        size = _write_partition(kind, month, list(merged.values()))
+        section["partitions"][month] = {
+            "file": f"{kind}/{month}.json.gz",
+            "records": len(merged),
+            "bytes": size,
+        }
+        section["index"].update((r[key], month) for r in cold)
+
+    # Archive first, then shrink the hot file, so a crash never loses records
+    _write_atomic(MANIFEST_FILE, json.dumps(manifest, indent=2).encode())
+    _write_atomic(source, json.dumps(hot, indent=2).encode())
+    return {"moved": sum(len(c) for c in cold_by_month.values()), "kept": len(hot)}
+
+def run_tiering(now=None, max_age_days=MAX_HOT_AGE_DAYS):
+    """Tier every kind of record and return per-kind move counts"""
+    manifest = load_manifest(cache=False)
+    return {kind: tier(kind, now, max_age_days, manifest) for kind in TIERS}
+
+# ============================================================================
+# LOOKUP
+# ============================================================================
+
+def find_archived(kind, key):
+    """Find an archived record by key, decompressing only its partition"""
+    month = load_manifest().get(kind, {}).get("index", {}).get(key)
+    if month is None:
+        return None
+    key_field = TIERS[kind]["key"]
+    for record in read_partition(kind, month):
+        if record.get(key_field) == key:
+            return record
+    return None
+
+def archived_records(kind, months=None):
+    """Iterate archived records, optionally restricted to some months"""
+    partitions = load_manifest().get(kind, {}).get("partitions", {})
+    for month in sorted(partitions):
+        if months is None or month in months:
+            yield from read_partition(kind, month)
+
+# ============================================================================
+# MEASUREMENT
+# ============================================================================
+
+def _footprint():
+    """Bytes on disk for hot files and archive partitions"""
+    hot = sum(spec["source"].stat().st_size for spec in TIERS.values() if spec["source"].exists())
+    cold = sum(p.stat().st_size for p in ARCHIVE_DIR.rglob("*.json.gz")) if ARCHIVE_DIR.exists() else 0
+    return hot, cold
+
+def _hot_load_seconds(repeat=20):
+    """Mean time to parse every hot file"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for spec in TIERS.values():
+            if spec["source"].exists():
+                with open(spec["source"], "rb") as f:
+                    json.loads(f.read())
+    return (time.perf_counter() - start) / repeat
+
+def measure():
+    """Snapshot of hot-path load latency and disk footprint"""
+    hot, cold = _footprint()
+    return {"hot_load_ms": _hot_load_seconds() * 1000, "hot_bytes": hot, "archive_bytes": cold}
+
+if __name__ == "__main__":
+    max_age = int(sys.argv[1]) if len(sys.argv) > 1 else MAX_HOT_AGE_DAYS
+    before = measure()
+    moved = run_tiering(max_age_days=max_age)
+    after = measure()
+    for kind, counts in moved.items():
+        print(f"{kind}: moved {counts['moved']}, kept {counts['kept']} hot")
+    for metric in before:
+        print(f"{metric:>14}: {before[metric]:>12,.2f} -> {after[metric]:>12,.2f}")
@@ -0,0 +1,149 @@
+# attention.py
+# Derives `days_in_current_stage` and `needs_attention` from stage history.
+#
+# The status block baked into sales_records.json goes stale as soon as the
+# file is written. The engine instead tracks when each deal entered its
+# current stage and keeps a min-heap of upcoming SLA breach times (from
+# STAGE_SLA_DAYS). Answering "which deals need attention now" pops only the
+# entries that have fallen due; a stage change pushes one entry and leaves
+# the superseded one to be discarded lazily when it surfaces.
+import heapq
+import threading
+import time
+
+import numpy as np
+
+from config import STAGE_SLA_DAYS
+from records import STAGE_NAMES, NO_TIME, now_timestamp
+
+DAY_US = 86_400 * 1_000_000
+
+STAGE_SLA_US = tuple(
+    None if STAGE_SLA_DAYS.get(name) is None else STAGE_SLA_DAYS[name] * DAY_US
+    for name in STAGE_NAMES
+)
+
+class AttentionEngine:
+    """Tracks SLA breach deadlines for open deals"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._deals = {}      # deal_id -> (stage, entered_at, version)
+        self._heap = []       # (breach_at, version, deal_id)
+        self._flagged = set()
+        self._version = 0
+
+    def __len__(self):
+        return len(self._deals)
+
+    def _push(self, deal_id, stage, entered_at):
+        self._version += 1
+        self._deals[deal_id] = (stage, entered_at, self._version)
+        self._flagged.discard(deal_id)
+        sla = STAGE_SLA_US[stage]
+        if sla is not None and entered_at != NO_TIME:
+            heapq.heappush(self._heap, (entered_at + sla, self._version, deal_id))
+
+    def record_stage_change(self, deal_id, stage, entered_at):
+        """Register that a deal entered `stage` at epoch microseconds `entered_at`"""
+        with self._lock:
+            self._push(deal_id, stage, entered_at)
+            if len(self._heap) > 2 * len(self._deals) + 64:
+                self._compact()
+
+    def complete(self, deal_id):
+        """Stop tracking a completed or cancelled deal"""
+        with self._lock:
+            self._deals.pop(deal_id, None)
+            self._flagged.discard(deal_id)
+
+    def _compact(self):
+        """Drop superseded heap entries"""
+        deals = self._deals
+        self._heap = [e for e in self._heap if deals.get(e[2], (None, None, None))[2] == e[1]]
+        heapq.heapify(self._heap)
+
+    def _pop_due(self, now):
+        heap, deals = self._heap, self._deals
+        while heap and heap[0][0] <= now:
+            _, version, deal_id = heapq.heappop(heap)
+            current = deals.get(deal_id)
+            if current is not None and current[2] == version:
+                self._flagged.add(deal_id)
+
+    def needs_attention(self, now=None):
+        """Return the set of deal ids currently past their stage SLA"""
+        with self._lock:
+            self._pop_due(now_timestamp() if now is None else now)
+            return set(self._flagged)
+
+    def is_flagged(self, deal_id, now=None):
+        """Whether one deal is currently past its stage SLA"""
+        return deal_id in self.needs_attention(now)
+
+    def days_in_current_stage(self, deal_id, now=None):
+        """Whole days since the deal entered its current stage"""
+        deal = self._deals.get(deal_id)
+        if deal is None or deal[1] == NO_TIME:
+            return 0
+        now = now_timestamp() if now is None else now
+        return max(0, (now - deal[1]) // DAY_US)
+
+    def next_breach(self):
+        """Epoch microseconds of the next pending SLA breach, or None"""
+        with self._lock:
+            while self._heap:
+                breach_at, version, deal_id = self._heap[0]
+                current = self._deals.get(deal_id)
+                if current is not None and current[2] == version:
+                    return breach_at
+                heapq.heappop(self._heap)
+            return None
+
+    @classmethod
+    def from_records(cls, records):
+        """Build an engine from decoded SaleRecords, skipping completed deals"""
+        engine = cls()
+        for rec in records:
+            if not rec.is_completed:
+                engine._push(rec.sale_id, rec.stage, rec.stage_times[rec.stage])
+        return engine
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """Build an engine from a sales snapshot in one vectorised pass"""
+        engine = cls()
+        if snapshot is None or not len(snapshot):
+            return engine
+        stages = np.asarray(snapshot.column("stage"))
+        entered = np.asarray(snapshot.column("stage_times"))[np.arange(len(stages)), stages]
+        open_rows = ~np.asarray(snapshot.column("is_completed"))
+        ids = snapshot.values("sale_id")
+        sla = np.array([-1 if s is None else s for s in STAGE_SLA_US], dtype=np.int64)[stages]
+        heap = []
+        for idx in np.flatnonzero(open_rows).tolist():
+            engine._version += 1
+            engine._deals[ids[idx]] = (int(stages[idx]), int(entered[idx]), engine._version)
+            if sla[idx] >= 0 and entered[idx] != NO_TIME:
+                heap.append((int(entered[idx] + sla[idx]), engine._version, ids[idx]))
+        heapq.heapify(heap)
+        engine._heap = heap
+        return engine
+
+if __name__ == "__main__":
+    import random
+    engine = AttentionEngine()
+    deals, events = 20_000, 200_000
+    base = now_timestamp() - 30 * DAY_US
+    start = time.perf_counter()
+    for n in range(events):
+        engine.record_stage_change(f"D{n % deals}", random.randrange(len(STAGE_NAMES)),
+                                   base + random.randrange(30 * DAY_US))
+    elapsed = time.perf_counter() - start
+    print(f"stage changes: {events / elapsed:,.0f} events/sec")
+    start = time.perf_counter()
+    flagged = engine.needs_attention()
+    print(f"needs_attention: {len(flagged):,} deals in {(time.perf_counter() - start) * 1000:.1f} ms (first call)")
+    start = time.perf_counter()
+    engine.needs_attention()
+    print(f"needs_attention: {(time.perf_counter() - start) * 1000:.3f} ms (nothing newly due)")
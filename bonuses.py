@@ -0,0 +1,129 @@
+# bonuses.py
+# Rules-driven deal accelerator bonuses.
+#
+# Each rule names the make, model and garage it applies to ("*" for any)
+# and optional conditions on the site's stock level and stock age for that
+# model, the day of the month and the site's target attainment. Rules are
+# compiled into a decision table keyed by (make, model, garage); a lookup
+# probes the eight wildcard combinations and evaluates only the rules found
+# there, so cost grows with the rules matched rather than the rule count.
+# Results are cached per (make, model, garage, day).
+#
+# Rules can be overridden with data/bonus_rules.json (same shape as
+# DEFAULT_RULES) and site targets supplied in data/site_targets.json:
+#   {"Sytner BMW Cardiff": {"target": 40, "sold": 31}}
+import datetime
+import json
+from functools import lru_cache
+from itertools import product
+
+from config import DATA_DIR, GARAGE_COORDS
+
+RULES_FILE = DATA_DIR / "bonus_rules.json"
+TARGETS_FILE = DATA_DIR / "site_targets.json"
+
+ANY = "*"
+
+DEFAULT_RULES = [
+    {"id": "stock-priority", "label": "📦 Stock Priority Bonus", "note": "We need this model in stock!",
+     "amount": 500, "max_site_stock": 1},
+    {"id": "same-day", "label": "⚡ Same-Day Completion", "note": "If completed today",
+     "amount": 200},
+    {"id": "month-end", "label": "📅 Month-End Target Push", "note": "Site is behind its monthly target",
+     "amount": 250, "days_of_month": [25, 31], "max_target_attainment": 0.9},
+    {"id": "fast-seller", "label": "🔥 Fast Seller", "note": "This model leaves our forecourt quickly",
+     "amount": 150, "min_site_stock": 1, "max_stock_age_days": 21},
+]
+
+def _load_json(path, default):
+    if not path.exists():
+        return default
+    with open(path, "r") as f:
+        return json.load(f)
+
+def _compile_conditions(rule):
+    """Turn a rule's optional conditions into a tuple of (context key, low, high)"""
+    checks = []
+    if "min_site_stock" in rule or "max_site_stock" in rule:
+        checks.append(("site_stock", rule.get("min_site_stock"), rule.get("max_site_stock")))
+    if "max_stock_age_days" in rule or "min_stock_age_days" in rule:
+        checks.append(("stock_age_days", rule.get("min_stock_age_days"), rule.get("max_stock_age_days")))
+    if "days_of_month" in rule:
+        low, high = rule["days_of_month"]
+        checks.append(("day_of_month", low, high))
+    if "max_target_attainment" in rule or "min_target_attainment" in rule:
+        checks.append(("target_attainment", rule.get("min_target_attainment"), rule.get("max_target_attainment")))
+    return tuple(checks)
+
+class BonusEngine:
+    """Evaluates compiled bonus rules against site stock and targets"""
+
+    def __init__(self, rules=None, stock=None, targets=None):
+        self.stock = stock
+        self.targets = targets or {}
+        self.table = {}
+        for rule in rules if rules is not None else DEFAULT_RULES:
+            key = (rule.get("make", ANY), rule.get("model", ANY), rule.get("garage", ANY))
+            self.table.setdefault(key, []).append((rule, _compile_conditions(rule)))
+        self.bonuses = lru_cache(maxsize=8192)(self._bonuses)
+
+    def context(self, make, model, garage, day):
+        """Facts the rule conditions are evaluated against"""
+        site_stock, stock_age = (0, None)
+        if self.stock is not None:
+            # Age on the day being priced, which is also what the result is cached under
+            site_stock, stock_age = self.stock.site_stock(make, model, garage, today=day)
+        target = self.targets.get(garage)
+        attainment = target["sold"] / target["target"] if target and target.get("target") else None
+        return {
+            "site_stock": site_stock,
+            "stock_age_days": stock_age,
+            "day_of_month": day.day,
+            "target_attainment": attainment,
+        }
+
+    def _bonuses(self, make, model, garage, day):
+        facts = None
+        applied = []
+        for key in product((make, ANY), (model, ANY), (garage, ANY)):
+            for rule, checks in self.table.get(key, ()):
+                if checks and facts is None:
+                    facts = self.context(make, model, garage, day)
+                if all(_within(facts[name], low, high) for name, low, high in checks):
+                    applied.append(rule)
+        return tuple(applied)
+
+    def total(self, make, model, garage, day=None):
+        """Sum of bonuses for a vehicle at one site on a day"""
+        return sum(rule["amount"] for rule in self.bonuses(make, model, garage, day or datetime.date.today()))
+
+def _within(value, low, high):
+    if value is None:
+        return False
+    return (low is None or value >= low) and (high is None or value <= high)
+
+def load_engine(stock=None):
+    """Build an engine from the rules and targets files (or the defaults)"""
+    return BonusEngine(_load_json(RULES_FILE, DEFAULT_RULES), stock, _load_json(TARGETS_FILE, {}))
+
+def rules_signature():
+    """Cache key that changes whenever the rules or targets files do"""
+    return tuple(
+        (p.stat().st_size, p.stat().st_mtime_ns) if p.exists() else None
+        for p in (RULES_FILE, TARGETS_FILE)
+    )
+
+if __name__ == "__main__":
+    import random
+    import time
+    rules = DEFAULT_RULES + [
+        {"id": f"r{n}", "label": "Rule", "note": "", "amount": 100,
+         "make": random.choice(["BMW", "Audi", "MINI", ANY]), "model": f"M{n % 50}",
+         "garage": random.choice(list(GARAGE_COORDS)), "max_site_stock": 3}
+        for n in range(10_000)
+    ]
+    engine = BonusEngine(rules)
+    start = time.perf_counter()
+    for n in range(10_000):
+        engine._bonuses("BMW", f"M{n % 50}", random.choice(list(GARAGE_COORDS)), datetime.date.today())
+    print(f"{len(rules):,} rules: {(time.perf_counter() - start) / 10_000 * 1e6:.1f} us per uncached lookup")
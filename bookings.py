@@ -0,0 +1,209 @@
+# bookings.py
+# Capacity-aware recall repair booking across the Sytner workshops.
+#
+# Capacity is a (site, slot) array of workshop bays and bookings are a
+# (site, day, slot) counter array covering HORIZON_DAYS from today, so
+# checking a slot is one array read and "next available within N miles"
+# is a vectorised comparison over the nearby sites' block of the array,
+# ordered by logistics.SITE_DISTANCES. Workshops are closed on
+# CLOSED_WEEKDAYS.
+#
+# Bookings are taken under a lock: the counter is checked, incremented and
+# the booking appended to data/recall_bookings.jsonl as one step, so two
+# sessions can never both take the last bay. The counters are rebuilt from
+# that log on start-up and when the day rolls over.
+#
+# Bays per slot can be set per site in data/workshop_capacity.json:
+#   {"Sytner BMW Cardiff": 3, "Sytner BMW Luton": [2, 2, 1, 1]}
+import datetime
+import json
+import threading
+import uuid
+
+import numpy as np
+
+from config import DATA_DIR, TIME_SLOTS
+from logistics import SITE_DISTANCES, SITE_INDEX, SITE_NAMES
+
+BOOKINGS_FILE = DATA_DIR / "recall_bookings.jsonl"
+CAPACITY_FILE = DATA_DIR / "workshop_capacity.json"
+
+HORIZON_DAYS = 90
+DEFAULT_BAYS = 2
+CLOSED_WEEKDAYS = {6}
+
+SLOT_TIMES = [datetime.datetime.strptime(slot, "%I:%M %p").time() for slot in TIME_SLOTS]
+
+class SlotUnavailable(Exception):
+    """The requested slot is full, closed or outside the booking horizon"""
+
+def load_capacity(path=CAPACITY_FILE):
+    """(site, slot) bay counts from the capacity file, or DEFAULT_BAYS everywhere"""
+    capacity = np.full((len(SITE_NAMES), len(TIME_SLOTS)), DEFAULT_BAYS, dtype=np.int16)
+    if path.exists():
+        with open(path, "r") as f:
+            for site, bays in json.load(f).items():
+                if site in SITE_INDEX:
+                    capacity[SITE_INDEX[site]] = bays
+    return capacity
+
+class BookingEngine:
+    """Per-site, per-day, per-slot workshop capacity with atomic bookings"""
+
+    def __init__(self, capacity=None, path=BOOKINGS_FILE, today=None):
+        self.capacity = load_capacity() if capacity is None else np.asarray(capacity, dtype=np.int16)
+        self.path = path
+        self._lock = threading.RLock()
+        self._load(today or datetime.date.today())
+
+    def _load(self, today):
+        self.start = today
+        self.booked = np.zeros((len(SITE_NAMES), HORIZON_DAYS, len(TIME_SLOTS)), dtype=np.int16)
+        weekdays = np.array([(today + datetime.timedelta(days=d)).weekday() for d in range(HORIZON_DAYS)])
+        self.open_days = ~np.isin(weekdays, list(CLOSED_WEEKDAYS))
+        self.bookings = {}
+        if self.path.exists():
+            with open(self.path, "r") as f:
+                for line in f:
+                    entry = json.loads(line)
+                    if "cancelled" in entry:
+                        self.bookings.pop(entry["cancelled"], None)
+                    else:
+                        self.bookings[entry["ref"]] = entry
+        for booking in self.bookings.values():
+            cell = self._cell(booking["site"], datetime.date.fromisoformat(booking["date"]), booking["slot"])
+            if cell is not None:
+                self.booked[cell] += 1
+
+    def _roll(self):
+        """Rebuild the counters when the booking window has moved on a day"""
+        today = datetime.date.today()
+        if today != self.start:
+            with self._lock:
+                if today != self.start:
+                    self._load(today)
+
+    def _slots_left_today(self):
+        """Mask of today's slots that have not started yet"""
+        now = datetime.datetime.now().time()
+        return np.array([t > now for t in SLOT_TIMES])
+
+    def _bookable(self, cell):
+        return cell is not None and self.open_days[cell[1]] and (cell[1] > 0 or self._slots_left_today()[cell[2]])
+
+    def _cell(self, site, date, slot):
+        day = (date - self.start).days
+        if site not in SITE_INDEX or slot not in TIME_SLOTS or not 0 <= day < HORIZON_DAYS:
+            return None
+        return SITE_INDEX[site], day, TIME_SLOTS.index(slot)
+
+    def free_bays(self, site, date, slot):
+        """Bays left in one slot (0 when closed or outside the horizon)"""
+        self._roll()
+        cell = self._cell(site, date, slot)
+        if not self._bookable(cell):
+            return 0
+        return int(self.capacity[cell[0], cell[2]] - self.booked[cell])
+
+    def free_slots(self, site, date):
+        """Slots with a bay free at a site on a date"""
+        return [slot for slot in TIME_SLOTS if self.free_bays(site, date, slot) > 0]
+
+    def next_available(self, site, max_miles=0, earliest=None, limit=5):
+        """Earliest free slot at each site within max_miles, soonest first then nearest"""
+        self._roll()
+        origin = SITE_INDEX[site]
+        distances = SITE_DISTANCES[origin]
+        nearby = np.flatnonzero(distances <= max_miles)
+        nearby = nearby[np.argsort(distances[nearby])]
+        first_day = max((earliest - self.start).days, 0) if earliest else 0
+
+        free = (self.booked[nearby, first_day:] < self.capacity[nearby, None, :]) \
+            & self.open_days[None, first_day:, None]
+        if first_day == 0:
+            free[:, 0, :] &= self._slots_left_today()
+        flat = free.reshape(len(nearby), -1)
+        has_free = flat.any(axis=1)
+        first = flat.argmax(axis=1)
+
+        options = []
+        for idx in np.flatnonzero(has_free).tolist():
+            day, slot = divmod(int(first[idx]), len(TIME_SLOTS))
+            s = int(nearby[idx])
+            options.append({
+                "site": SITE_NAMES[s],
+                "date": self.start + datetime.timedelta(days=first_day + day),
+                "slot": TIME_SLOTS[slot],
+                "distance": round(float(distances[s]), 1),
+                "free_bays": int(self.capacity[s, slot] - self.booked[s, first_day + day, slot]),
+            })
+        options.sort(key=lambda o: (o["date"], TIME_SLOTS.index(o["slot"]), o["distance"]))
+        return options[:limit]
+
+    def book(self, site, date, slot, **details):
+        """Take a bay in a slot; raises SlotUnavailable if it has gone"""
+        with self._lock:
+            self._roll()
+            cell = self._cell(site, date, slot)
+            if not self._bookable(cell):
+                raise SlotUnavailable(f"{site} is not taking bookings for {date} {slot}")
+            if self.booked[cell] >= self.capacity[cell[0], cell[2]]:
+                raise SlotUnavailable(f"{site} {date} {slot} is fully booked")
+            booking = {
+                "ref": f"RCL-{uuid.uuid4().hex[:8].upper()}",
+                "site": site,
+                "date": date.isoformat(),
+                "slot": slot,
+                "created": datetime.datetime.now().isoformat(timespec="seconds"),
+                **details,
+            }
+            self._append(booking)
+            self.booked[cell] += 1
+            self.bookings[booking["ref"]] = booking
+            return booking
+
+    def cancel(self, ref):
+        """Release a booking's bay"""
+        with self._lock:
+            booking = self.bookings.pop(ref, None)
+            if booking is None:
+                return False
+            self._append({"cancelled": ref})
+            cell = self._cell(booking["site"], datetime.date.fromisoformat(booking["date"]), booking["slot"])
+            if cell is not None:
+                self.booked[cell] -= 1
+            return True
+
+    def _append(self, entry):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+
+if __name__ == "__main__":
+    import tempfile
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    from pathlib import Path
+
+    engine = BookingEngine(path=Path(tempfile.mkdtemp()) / "bookings.jsonl")
+    rng = np.random.default_rng()
+    # Fill most of the workshop diary
+    engine.booked[:] = rng.integers(0, DEFAULT_BAYS + 1, engine.booked.shape)
+    start = time.perf_counter()
+    for n in range(10_000):
+        engine.next_available(SITE_NAMES[n % len(SITE_NAMES)], max_miles=60)
+    print(f"next_available within 60 miles: {(time.perf_counter() - start) / 10_000 * 1e6:.0f} us")
+
+    # Twenty sessions race for one two-bay slot
+    day = engine.start + datetime.timedelta(days=1 if engine.start.weekday() != 5 else 2)
+    engine.booked[0, (day - engine.start).days, 0] = 0
+
+    def attempt(n):
+        try:
+            return engine.book(SITE_NAMES[0], day, TIME_SLOTS[0], name=f"Customer {n}")["ref"]
+        except SlotUnavailable:
+            return None
+
+    with ThreadPoolExecutor(20) as pool:
+        won = [ref for ref in pool.map(attempt, range(20)) if ref]
+    print(f"20 concurrent bookings for a {DEFAULT_BAYS}-bay slot: {len(won)} confirmed")
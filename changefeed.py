@@ -0,0 +1,304 @@
+# changefeed.py
+# Versioned change feed over the sales and journey files.
+#
+# data/changes.sqlite keeps, for each kind of record:
+#
+#   current  the latest flattened row for every key, plus a hash of its raw
+#            JSON, so a new screen loads the whole table without parsing
+#            the source file
+#   changes  an append-only delta log (version, kind, key, op, row); version
+#            is a single counter that only ever increases
+#
+# When a source file's size or mtime changes, sync() parses it once, diffs
+# the row hashes against `current` and appends one change per added,
+# edited or removed record. Dashboards hold the version they have applied
+# and ask for changes_since() it. ChangeFeed.poll() rate-limits the stat and
+# version check across every session in a process, so a wall screen
+# polling when nothing has changed costs one dictionary read.
+#
+# The log is trimmed to RETAIN_CHANGES entries; a reader that has fallen
+# further behind than that gets None from changes_since() and reloads
+# snapshot().
+# `python changefeed.py` compares polling the feed with re-parsing the file.
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from config import DATA_DIR, SALES_FILE, JOURNEYS_FILE
+from records import SalesDecoder, parse_timestamp
+
+CHANGES_DB = DATA_DIR / "changes.sqlite"
+
+POLL_INTERVAL = 5.0
+RETAIN_CHANGES = 50_000
+
+# Bump when the flattened row fields change so every row is republished once
+ROW_LAYOUT = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    kind TEXT PRIMARY KEY,
+    signature TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS current (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    row TEXT NOT NULL,
+    PRIMARY KEY (kind, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS changes (
+    version INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    op TEXT NOT NULL,
+    row TEXT
+);
+"""
+
+# ============================================================================
+# ROW FLATTENING
+# ============================================================================
+
+def sale_row(raw, decoder=None):
+    """Pipeline dashboard fields for one raw sale"""
+    rec = (decoder or SalesDecoder()).decode(raw)
+    return {
+        "sale_id": rec.sale_id,
+        "first_name": rec.first_name,
+        "last_name": rec.last_name,
+        "registration": rec.registration,
+        "vin": rec.vin,
+        "make": rec.make,
+        "model": rec.model,
+        "year": rec.year,
+        "stage": rec.stage,
+        "salesperson": rec.salesperson,
+        "total_price": rec.total_price,
+        "is_completed": rec.is_completed,
+        "last_updated": rec.last_updated,
+    }
+
+def journey_row(raw, decoder=None):
+    """Pipeline dashboard fields for one raw customer journey"""
+    vehicle = raw.get("vehicle") or {}
+    return {
+        "tracking_id": raw.get("tracking_id"),
+        "customer_name": (raw.get("customer") or {}).get("name"),
+        "registration": vehicle.get("reg"),
+        "vin": vehicle.get("vin"),
+        "make": vehicle.get("make"),
+        "model": vehicle.get("model"),
+        "year": vehicle.get("year"),
+        "garage": raw.get("garage"),
+        "salesperson": raw.get("salesperson"),
+        "current_stage": raw.get("current_stage", 0),
+        "created_date": parse_timestamp(raw.get("created_date")),
+    }
+
+FEEDS = {
+    "sales": {"source": SALES_FILE, "key": "sale_id", "row": sale_row},
+    "journeys": {"source": JOURNEYS_FILE, "key": "tracking_id", "row": journey_row},
+}
+
+def _signature(source):
+    if not source.exists():
+        return "missing"
+    stat = source.stat()
+    return f"v{ROW_LAYOUT}-{stat.st_size}-{stat.st_mtime_ns}"
+
+def _hash(raw):
+    data = f"v{ROW_LAYOUT}".encode() + json.dumps(raw, sort_keys=True).encode()
+    return hashlib.blake2b(data, digest_size=8).hexdigest()
+
+# ============================================================================
+# FEED
+# ============================================================================
+
+class ChangeFeed:
+    """Version counter and delta log for the sales and journey files"""
+
+    def __init__(self, path=CHANGES_DB, feeds=None, poll_interval=POLL_INTERVAL):
+        self.path = path
+        self.feeds = FEEDS if feeds is None else feeds
+        self.poll_interval = poll_interval
+        self._local = threading.local()
+        self._poll_lock = threading.Lock()
+        self._polled_at = 0.0
+        self._version = 0
+        self._seen = {}
+        path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.executescript(SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def version(self):
+        """Latest change version (0 for an empty feed)"""
+        row = self._conn().execute("SELECT MAX(version) FROM changes").fetchone()
+        return row[0] or 0
+
+    def sync(self, kind):
+        """Append changes for a source file that has changed since the last sync; returns how many"""
+        spec = self.feeds[kind]
+        signature = _signature(spec["source"])
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            stored = conn.execute("SELECT signature FROM sources WHERE kind = ?", (kind,)).fetchone()
+            if stored and stored[0] == signature:
+                conn.execute("COMMIT")
+                return 0
+            raw_records = []
+            if signature != "missing":
+                with open(spec["source"], "rb") as f:
+                    raw_records = json.loads(f.read())
+            known = dict(conn.execute("SELECT key, hash FROM current WHERE kind = ?", (kind,)).fetchall())
+            decoder = SalesDecoder()
+            upserts, seen = [], set()
+            for raw in raw_records:
+                key = raw.get(spec["key"])
+                if key is None:
+                    continue
+                seen.add(key)
+                digest = _hash(raw)
+                if known.get(key) != digest:
+                    upserts.append((key, digest, json.dumps(spec["row"](raw, decoder))))
+            deleted = [key for key in known if key not in seen]
+
+            conn.executemany("INSERT OR REPLACE INTO current (kind, key, hash, row) VALUES (?, ?, ?, ?)",
+                             [(kind, key, digest, row) for key, digest, row in upserts])
+            conn.executemany("DELETE FROM current WHERE kind = ? AND key = ?", [(kind, key) for key in deleted])
+            conn.executemany("INSERT INTO changes (kind, key, op, row) VALUES (?, ?, ?, ?)",
+                             [(kind, key, "upsert", row) for key, _, row in upserts]
+                             + [(kind, key, "delete", None) for key in deleted])
+            conn.execute("INSERT OR REPLACE INTO sources (kind, signature) VALUES (?, ?)", (kind, signature))
+            conn.execute("DELETE FROM changes WHERE version <= (SELECT MAX(version) FROM changes) - ?",
+                         (RETAIN_CHANGES,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return len(upserts) + len(deleted)
+
+    def poll(self):
+        """Current version, syncing changed sources at most once per poll_interval per process"""
+        with self._poll_lock:
+            now = time.monotonic()
+            if now - self._polled_at < self.poll_interval:
+                return self._version
+            for kind, spec in self.feeds.items():
+                signature = _signature(spec["source"])
+                if self._seen.get(kind) != signature:
+                    self.sync(kind)
+                    self._seen[kind] = signature
+            self._version = self.version()
+            self._polled_at = now
+            return self._version
+
+    def snapshot(self, kind):
+        """(version, {key: row}) for every current record of a kind"""
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            version = self.version()
+            rows = {key: json.loads(row) for key, row in
+                    conn.execute("SELECT key, row FROM current WHERE kind = ?", (kind,))}
+        finally:
+            conn.execute("COMMIT")
+        return version, rows
+
+    def changes_since(self, version, kind=None):
+        """[(version, kind, key, op, row)] after `version`, or None if the log no longer reaches back that far"""
+        conn = self._conn()
+        oldest = conn.execute("SELECT MIN(version) FROM changes").fetchone()[0]
+        if oldest is not None and oldest > version + 1:
+            return None
+        sql = "SELECT version, kind, key, op, row FROM changes WHERE version > ?"
+        params = [version]
+        if kind is not None:
+            sql += " AND kind = ?"
+            params.append(kind)
+        return [(v, k, key, op, json.loads(row) if row else None)
+                for v, k, key, op, row in conn.execute(sql + " ORDER BY version", params)]
+
+    def apply(self, rows, version, kind):
+        """Bring a {key: row} view up to date in place; returns the new version"""
+        latest = self.poll()
+        if latest == version:
+            return version
+        changes = self.changes_since(version, kind)
+        if changes is None:
+            latest, fresh = self.snapshot(kind)
+            rows.clear()
+            rows.update(fresh)
+            return latest
+        for _, _, key, op, row in changes:
+            if op == "delete":
+                rows.pop(key, None)
+            else:
+                rows[key] = row
+        return max(latest, changes[-1][0]) if changes else latest
+
+if __name__ == "__main__":
+    import copy
+    import random
+    import tempfile
+    from pathlib import Path
+
+    tmp = Path(tempfile.mkdtemp())
+    source = tmp / "sales.json"
+    with open(SALES_FILE, "r") as f:
+        template = json.load(f)
+    sales = []
+    for n in range(5000):
+        sale = copy.deepcopy(template[n % len(template)])
+        sale["sale_id"] = f"SALE{n:06d}"
+        sales.append(sale)
+    with open(source, "w") as f:
+        json.dump(sales, f)
+
+    feed = ChangeFeed(tmp / "changes.sqlite", {"sales": dict(FEEDS["sales"], source=source)}, poll_interval=0)
+    start = time.perf_counter()
+    feed.poll()
+    print(f"initial sync of {len(sales):,} sales: {time.perf_counter() - start:.2f}s")
+
+    version, rows = feed.snapshot("sales")
+    start = time.perf_counter()
+    for _ in range(1000):
+        version = feed.apply(rows, version, "sales")
+    idle = (time.perf_counter() - start) / 1000
+    start = time.perf_counter()
+    for _ in range(10):
+        with open(source, "rb") as f:
+            [sale_row(raw) for raw in json.loads(f.read())]
+    reparse = (time.perf_counter() - start) / 10
+    print(f"idle poll: {idle * 1e6:.0f} us vs re-parsing the file: {reparse * 1000:.1f} ms")
+
+    for sale in random.sample(sales, 25):
+        sale["pipeline"]["stage_index"] = 4
+        sale["pipeline"]["current_stage"] = "Collection Day"
+    del sales[:5]
+    with open(source, "w") as f:
+        json.dump(sales, f)
+    start = time.perf_counter()
+    before = version
+    version = feed.apply(rows, version, "sales")
+    print(f"edit 25, remove 5: {version - before} changes applied in {(time.perf_counter() - start) * 1000:.1f} ms, "
+          f"{len(rows):,} rows")
+    assert rows == feed.snapshot("sales")[1]
+
+    feed.poll_interval = POLL_INTERVAL
+    start = time.perf_counter()
+    for _ in range(100_000):
+        feed.poll()
+    print(f"throttled poll shared by every session: {(time.perf_counter() - start) / 100_000 * 1e6:.2f} us")
@@ -0,0 +1,78 @@
+# config.py
+# Shared domain configuration for the TradeSnap app and its data modules.
+# Kept free of Streamlit imports so the data layer can be used from scripts.
+from pathlib import Path
+
+DATA_DIR = Path("data")
+SALES_FILE = DATA_DIR / "sales_records.json"
+JOURNEYS_FILE = DATA_DIR / "customer_journeys.json"
+
+# Sales Pipeline Stages
+SALES_STAGES = [
+    {"name": "Deposit Taken", "icon": "💰", "color": "#4caf50"},
+    {"name": "Demands & Needs", "icon": "📋", "color": "#2196f3"},
+    {"name": "Sign/Ink Order", "icon": "✍️", "color": "#9c27b0"},
+    {"name": "Sell Option Extras", "icon": "🎁", "color": "#ff9800"},
+    {"name": "Collection Day", "icon": "🚗", "color": "#f44336"}
+]
+
+GARAGES = [
+    "Sytner BMW Cardiff - 285-287 Penarth Road",
+    "Sytner BMW Chigwell - Langston Road, Loughton",
+    "Sytner BMW Coventry - 128 Holyhead Road",
+    "Sytner BMW Harold Wood - A12 Colchester Road",
+    "Sytner BMW High Wycombe - 575-647 London Road",
+    "Sytner BMW Leicester - Meridian East",
+    "Sytner BMW Luton - 501 Dunstable Road",
+    "Sytner BMW Maidenhead - Bath Road",
+    "Sytner BMW Newport - Oak Way",
+    "Sytner BMW Nottingham - Lenton Lane",
+    "Sytner BMW Oldbury - 919 Wolverhampton Road",
+    "Sytner BMW Sheffield - Brightside Way",
+    "Sytner BMW Shrewsbury - 70 Battlefield Road",
+    "Sytner BMW Solihull - 520 Highlands Road",
+    "Sytner BMW Stevenage - Arlington Business Park",
+    "Sytner BMW Sunningdale - Station Road",
+    "Sytner BMW Swansea - 375 Carmarthen Road",
+    "Sytner BMW Tamworth - Winchester Rd",
+    "Sytner BMW Tring - Cow Roast",
+    "Sytner BMW Warwick - Fusiliers Way",
+    "Sytner BMW Wolverhampton - Lever Street",
+    "Sytner BMW Worcester - Knightsbridge Park"
+]
+
+GARAGE_COORDS = {
+    "Sytner BMW Cardiff": (51.4695, -3.1792),
+    "Sytner BMW Chigwell": (51.6460, 0.0750),
+    "Sytner BMW Coventry": (52.4162, -1.5121),
+    "Sytner BMW Harold Wood": (51.6089, 0.2458),
+    "Sytner BMW High Wycombe": (51.6248, -0.7489),
+    "Sytner BMW Leicester": (52.6111, -1.1175),
+    "Sytner BMW Luton": (51.8929, -0.4372),
+    "Sytner BMW Maidenhead": (51.5225, -0.6433),
+    "Sytner BMW Newport": (51.5665, -2.9871),
+    "Sytner BMW Nottingham": (52.9536, -1.1358),
+    "Sytner BMW Oldbury": (52.5050, -2.0150),
+    "Sytner BMW Sheffield": (53.4059, -1.4016),
+    "Sytner BMW Shrewsbury": (52.7280, -2.7350),
+    "Sytner BMW Solihull": (52.4114, -1.7869),
+    "Sytner BMW Stevenage": (51.9020, -0.2050),
+    "Sytner BMW Sunningdale": (51.3989, -0.6600),
+    "Sytner BMW Swansea": (51.6565, -3.9900),
+    "Sytner BMW Tamworth": (52.6342, -1.6950),
+    "Sytner BMW Tring": (51.7950, -0.6600),
+    "Sytner BMW Warwick": (52.2819, -1.5850),
+    "Sytner BMW Wolverhampton": (52.5867, -2.1280),
+    "Sytner BMW Worcester": (52.1936, -2.2200)
+}
+
+TIME_SLOTS = ["09:00 AM", "11:00 AM", "02:00 PM", "04:00 PM"]
+
+# Days a deal may sit in each stage before it needs attention (None = no SLA)
+STAGE_SLA_DAYS = {
+    "Deposit Taken": 3,
+    "Demands & Needs": 5,
+    "Sign/Ink Order": 5,
+    "Sell Option Extras": 7,
+    "Collection Day": None
+}
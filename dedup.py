@@ -0,0 +1,297 @@
+# dedup.py
+# Duplicate detection for registrations and VINs across sales and journeys.
+#
+# The hot tier is a hash index from normalised key ("REG:AB12CDE",
+# "VIN:WBA...") to the records that carry it, so a check is a dictionary
+# lookup rather than a scan of both files. It is kept up to date from the
+# change feed (see changefeed.py): each upsert or delete moves just that
+# record's keys, and the index never rebuilds after its first load.
+#
+# The archive tier is a Bloom filter over the keys of every archived
+# record, saved next to the archive and extended one partition at a time
+# as tiering writes them. It never misses an archived car. The occasional
+# false positive is reported as "possibly seen before", never as a clash.
+#
+# `python dedup.py check FILE` screens an import file (a JSON list of sales
+# or journeys) against both tiers and within itself before it is loaded;
+# `python dedup.py` benchmarks checks against a full scan.
+import hashlib
+import json
+import math
+import re
+import sys
+import threading
+
+import numpy as np
+
+from archive import ARCHIVE_DIR, load_manifest, read_partition
+from mot import normalise_registration
+
+BLOOM_FILE = ARCHIVE_DIR / "dedup_bloom.npz"
+BLOOM_ERROR_RATE = 0.001
+BLOOM_MIN_CAPACITY = 100_000
+
+def normalise_vin(vin):
+    """Upper-case VIN with anything but letters and digits removed"""
+    return re.sub(r"[^A-Z0-9]", "", vin.upper())
+
+def record_keys(registration=None, vin=None):
+    """Index keys for a vehicle's registration and VIN"""
+    keys = []
+    if registration and normalise_registration(registration):
+        keys.append("REG:" + normalise_registration(registration))
+    if vin and normalise_vin(vin):
+        keys.append("VIN:" + normalise_vin(vin))
+    return tuple(keys)
+
+def raw_vehicle(raw):
+    """(registration, vin) from a raw sale or journey dict"""
+    vehicle = raw.get("vehicle") or {}
+    return vehicle.get("registration") or vehicle.get("reg"), vehicle.get("vin")
+
+# ============================================================================
+# BLOOM FILTER
+# ============================================================================
+
+class BloomFilter:
+    """Fixed-size Bloom filter over string keys"""
+
+    def __init__(self, capacity=BLOOM_MIN_CAPACITY, error_rate=BLOOM_ERROR_RATE, bits=None, hashes=None):
+        if bits is None:
+            size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+            bits = np.zeros((size + 7) // 8, dtype=np.uint8)
+            hashes = max(1, round(size / capacity * math.log(2)))
+        self.bits = bits
+        self.size = len(bits) * 8
+        self.hashes = hashes
+
+    def _positions(self, key):
+        # Kirsch-Mitzenmacher: k positions from two 64-bit hashes
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+class ArchiveBloom:
+    """Bloom filter over archived records' keys, extended partition by partition"""
+
+    def __init__(self, path=BLOOM_FILE, capacity=BLOOM_MIN_CAPACITY):
+        self.path = path
+        self.capacity = capacity
+        self.covered = {}
+        self.bloom = None
+        if path.exists():
+            with np.load(path, allow_pickle=False) as saved:
+                self.bloom = BloomFilter(bits=saved["bits"].copy(), hashes=int(saved["hashes"]))
+                self.covered = json.loads(str(saved["covered"]))
+
+    def refresh(self, manifest=None):
+        """Add any archive partition written since the filter was saved; returns how many"""
+        manifest = manifest or load_manifest()
+        pending = [(kind, month, info["records"]) for kind, section in manifest.items()
+                   for month, info in section.get("partitions", {}).items()
+                   if self.covered.get(f"{kind}/{month}") != info["records"]]
+        if not pending:
+            return 0
+        if self.bloom is None:
+            total = sum(info["records"] for section in manifest.values()
+                        for info in section.get("partitions", {}).values())
+            self.bloom = BloomFilter(capacity=max(self.capacity, total * 4))
+        for kind, month, records in pending:
+            for raw in read_partition(kind, month):
+                for key in record_keys(*raw_vehicle(raw)):
+                    self.bloom.add(key)
+            self.covered[f"{kind}/{month}"] = records
+        self.save()
+        return len(pending)
+
+    def add(self, keys):
+        if self.bloom is None:
+            self.bloom = BloomFilter(capacity=self.capacity)
+        for key in keys:
+            self.bloom.add(key)
+
+    def __contains__(self, key):
+        return self.bloom is not None and key in self.bloom
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f".{self.path.name}.tmp.npz")
+        np.savez(tmp, bits=self.bloom.bits, hashes=self.bloom.hashes, covered=json.dumps(self.covered))
+        tmp.replace(self.path)
+
+# ============================================================================
+# HOT INDEX
+# ============================================================================
+
+class DedupIndex:
+    """Registration/VIN -> records index over live sales and journeys"""
+
+    def __init__(self, archive=None):
+        self.keys = {}
+        self.owners = {}
+        self.archive = archive
+        self.version = 0
+        self._lock = threading.Lock()
+
+    def update(self, kind, record_id, registration=None, vin=None):
+        """Add or re-key one record"""
+        owner = (kind, record_id)
+        with self._lock:
+            self._drop(owner)
+            keys = record_keys(registration, vin)
+            for key in keys:
+                self.keys.setdefault(key, set()).add(owner)
+            self.owners[owner] = keys
+
+    def remove(self, kind, record_id):
+        """Drop a record; its keys move to the archive filter, where tiering sends it"""
+        with self._lock:
+            keys = self._drop((kind, record_id))
+        if self.archive is not None and keys:
+            self.archive.add(keys)
+
+    def _drop(self, owner):
+        keys = self.owners.pop(owner, ())
+        for key in keys:
+            holders = self.keys.get(key)
+            if holders is not None:
+                holders.discard(owner)
+                if not holders:
+                    del self.keys[key]
+        return keys
+
+    def find(self, registration=None, vin=None, exclude=None):
+        """Records sharing the registration or VIN: [(kind, record_id)]"""
+        found = set()
+        with self._lock:
+            for key in record_keys(registration, vin):
+                found |= self.keys.get(key, set())
+        found.discard(exclude)
+        return sorted(found)
+
+    def check(self, registration=None, vin=None, exclude=None):
+        """{"matches": live records with the same car, "archived": possibly seen in the archive}"""
+        keys = record_keys(registration, vin)
+        return {
+            "matches": self.find(registration, vin, exclude),
+            "archived": self.archive is not None and any(key in self.archive for key in keys),
+        }
+
+    def check_batch(self, records):
+        """Duplicates in a list of (record_id, registration, vin), within it and against the index"""
+        seen, clashes = {}, []
+        for record_id, registration, vin in records:
+            result = self.check(registration, vin)
+            earlier = sorted({seen[key] for key in record_keys(registration, vin) if key in seen})
+            if result["matches"] or result["archived"] or earlier:
+                clashes.append({"record": record_id, "batch": earlier, **result})
+            for key in record_keys(registration, vin):
+                seen.setdefault(key, record_id)
+        return clashes
+
+    # Change feed
+
+    def apply_changes(self, changes):
+        for version, kind, key, op, row in changes:
+            if op == "delete":
+                self.remove(kind, key)
+            else:
+                self.update(kind, key, row.get("registration"), row.get("vin"))
+            self.version = max(self.version, version)
+
+    def sync(self, feed):
+        """Apply the feed's changes since the last sync"""
+        # poll() is throttled; the log itself also holds changes synced directly by writers
+        feed.poll()
+        changes = feed.changes_since(self.version)
+        if changes is None:
+            # Fell behind the trimmed log: reload the live records, then swap them in
+            fresh = DedupIndex.from_feed(feed)
+            with self._lock:
+                self.keys, self.owners = fresh.keys, fresh.owners
+                self.version = max(self.version, fresh.version)
+            return
+        self.apply_changes(changes)
+
+    @classmethod
+    def from_feed(cls, feed, archive=None):
+        index = cls(archive)
+        feed.poll()
+        for kind in feed.feeds:
+            version, rows = feed.snapshot(kind)
+            for key, row in rows.items():
+                index.update(kind, key, row.get("registration"), row.get("vin"))
+            index.version = max(index.version, version)
+        return index
+
+def open_index():
+    """Index over the live files (via the change feed) plus the archive filter"""
+    from changefeed import ChangeFeed
+    archive = ArchiveBloom()
+    archive.refresh()
+    return DedupIndex.from_feed(ChangeFeed(), archive), archive
+
+def check_import(path):
+    """Clashes for every record in a JSON import file"""
+    with open(path, "r") as f:
+        raws = json.load(f)
+    index, _ = open_index()
+    records = [(raw.get("sale_id") or raw.get("tracking_id") or f"row {n + 1}", *raw_vehicle(raw))
+               for n, raw in enumerate(raws)]
+    return index.check_batch(records)
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "check":
+        clashes = check_import(sys.argv[2])
+        for clash in clashes:
+            where = [f"{kind} {rid}" for kind, rid in clash["matches"]] + [f"{r} earlier in the file" for r in clash["batch"]]
+            if clash["archived"]:
+                where.append("possibly the archive")
+            print(f"{clash['record']}: duplicate of {', '.join(where)}")
+        print(f"{len(clashes)} duplicate(s)")
+        sys.exit(1 if clashes else 0)
+
+    import random
+    import string
+    import tempfile
+    import time
+    from pathlib import Path
+
+    def plate():
+        return "".join(random.choices(string.ascii_uppercase, k=2)) + f"{random.randint(10, 99)} " + \
+            "".join(random.choices(string.ascii_uppercase, k=3))
+
+    n = 200_000
+    records = [(f"SALE{i:07d}", plate(), "".join(random.choices(string.ascii_uppercase + string.digits, k=17)))
+               for i in range(n)]
+    start = time.perf_counter()
+    index = DedupIndex(ArchiveBloom(Path(tempfile.mkdtemp()) / "bloom.npz", capacity=2 * n))
+    for record_id, reg, vin in records:
+        index.update("sales", record_id, reg, vin)
+    print(f"index {n:,} records: {time.perf_counter() - start:.2f}s")
+
+    probes = [random.choice(records)[1].lower() for _ in range(1000)] + [plate() for _ in range(1000)]
+    start = time.perf_counter()
+    hits = sum(bool(index.find(p)) for p in probes)
+    indexed = (time.perf_counter() - start) / len(probes)
+    start = time.perf_counter()
+    for p in probes[:20]:
+        key = normalise_registration(p)
+        [r for r in records if normalise_registration(r[1]) == key]
+    scan = (time.perf_counter() - start) / 20
+    print(f"check: {indexed * 1e6:.1f} us indexed vs {scan * 1000:.0f} ms scanning ({hits} hits in {len(probes)})")
+
+    # Archive half the records: they leave the hot index for the Bloom filter
+    for record_id, _, _ in records[: n // 2]:
+        index.remove("sales", record_id)
+    archived = sum(index.check(reg)["archived"] for _, reg, _ in records[: n // 2])
+    false_positive = sum(index.check(plate())["archived"] for _ in range(20_000)) / 20_000
+    print(f"archive filter: {archived:,}/{n // 2:,} archived cars found, "
+          f"{false_positive:.3%} false positives, {index.archive.bloom.bits.nbytes / 1e6:.1f} MB")
@@ -0,0 +1,365 @@
+# export.py
+# Streaming CSV/XLSX export of the sales pipeline and customer journeys.
+#
+# Rows come from the memory-mapped snapshots (see snapshot.py), CHUNK_ROWS
+# at a time, so an export holds one chunk of decoded values however many
+# rows it writes:
+#
+#   - filters are pushed down to the snapshot columns as NumPy masks, so
+#     rows that are filtered out are never decoded; string filters compare
+#     dictionary codes, not strings
+#   - only the selected columns are read
+#   - archived records are read one month partition at a time, and a date
+#     filter on the partition column skips whole months
+#
+# CSV is produced as a generator of byte chunks. XLSX uses an openpyxl
+# write-only workbook, which streams rows to disk rather than building the
+# sheet in memory; openpyxl is optional and only needed for XLSX.
+# `python export.py` exports a synthetic 1M-row pipeline and reports time
+# and peak memory.
+import csv
+import datetime
+import io
+
+import numpy as np
+
+from archive import load_manifest, read_partition
+from records import NO_TIME, STAGE_INDEX, STAGE_NAMES, SalesDecoder, parse_timestamp, to_datetime
+from snapshot import journey_fields, journeys_snapshot, sales_snapshot
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+XLSX_AVAILABLE = openpyxl is not None
+
+CHUNK_ROWS = 10_000
+FILTER_BLOCK_ROWS = 100_000
+MAX_SHEET_ROWS = 1_048_575  # Excel's row limit less the header
+
+def _sale_fields(raw, decoder):
+    rec = decoder.decode(raw)
+    return {name: getattr(rec, name) for name in rec.__slots__}
+
+def _journey_fields(raw, decoder):
+    return journey_fields(raw)
+
+# label: (snapshot column, format)
+EXPORTS = {
+    "sales": {
+        "snapshot": sales_snapshot,
+        "flatten": _sale_fields,
+        "partition_by": "Deposit Date",
+        "columns": {
+            "Sale ID": ("sale_id", "str"),
+            "First Name": ("first_name", "str"),
+            "Last Name": ("last_name", "str"),
+            "Registration": ("registration", "str"),
+            "VIN": ("vin", "str"),
+            "Make": ("make", "str"),
+            "Model": ("model", "str"),
+            "Variant": ("variant", "str"),
+            "Year": ("year", "int"),
+            "Stage": ("stage", "stage"),
+            "Salesperson": ("salesperson", "str"),
+            "Payment Method": ("payment_method", "str"),
+            "Vehicle Price": ("vehicle_price", "int"),
+            "Total Price": ("total_price", "int"),
+            "Deposit Paid": ("deposit_paid", "int"),
+            "Outstanding Balance": ("outstanding_balance", "int"),
+            "Deposit Date": ("deposit_date", "timestamp"),
+            "Expected Collection": ("expected_collection", "timestamp"),
+            "Last Updated": ("last_updated", "timestamp"),
+            "Completed": ("is_completed", "bool"),
+        },
+    },
+    "journeys": {
+        "snapshot": journeys_snapshot,
+        "flatten": _journey_fields,
+        "partition_by": "Created",
+        "columns": {
+            "Tracking ID": ("tracking_id", "str"),
+            "Created": ("created_date", "timestamp"),
+            "Customer": ("customer_name", "str"),
+            "Registration": ("registration", "str"),
+            "VIN": ("vin", "str"),
+            "Make": ("make", "str"),
+            "Model": ("model", "str"),
+            "Year": ("year", "int"),
+            "Garage": ("garage", "str"),
+            "Salesperson": ("salesperson", "str"),
+            "Stage": ("current_stage", "stage"),
+            "Collection Date": ("collection_date", "timestamp"),
+            "Deposit": ("deposit", "int"),
+            "Trade-in Value": ("trade_in_value", "int"),
+        },
+    },
+}
+
+# ============================================================================
+# FILTERS
+# ============================================================================
+#
+# A filter maps a column label to a value (equality), a list or set
+# (membership) or a (low, high) tuple (inclusive range, either end None).
+# Stages may be given by name; timestamps by date or datetime.
+
+def _encode_value(fmt, value):
+    """Filter value in the column's stored representation"""
+    if value is None:
+        return None
+    if fmt == "stage" and isinstance(value, str):
+        return STAGE_INDEX[value]
+    if fmt == "timestamp":
+        if isinstance(value, datetime.datetime):
+            return parse_timestamp(value.isoformat())
+        if isinstance(value, datetime.date):
+            return parse_timestamp(datetime.datetime.combine(value, datetime.time()).isoformat())
+    return value
+
+def _normalise_filter(fmt, cond):
+    if isinstance(cond, tuple):
+        low, high = cond
+        if fmt == "timestamp" and isinstance(high, datetime.date) and not isinstance(high, datetime.datetime):
+            # An end date includes the whole of that day
+            high = datetime.datetime.combine(high, datetime.time.max)
+        return "range", (_encode_value(fmt, low), _encode_value(fmt, high))
+    if isinstance(cond, (list, set, frozenset)):
+        return "in", [_encode_value(fmt, v) for v in cond]
+    return "in", [_encode_value(fmt, cond)]
+
+def _string_codes(snapshot, values):
+    """Dictionary codes of the given strings (a scan, not a reverse dict: the dictionary holds every ID)"""
+    wanted = set(values)
+    return [code for code, string in enumerate(snapshot.strings) if string in wanted]
+
+def _column_mask(snapshot, column, op, value, block):
+    array = snapshot.column(column)[block]
+    if op == "in":
+        return np.isin(array, value)
+    low, high = value
+    mask = np.ones(len(array), dtype=bool)
+    if low is not None:
+        mask &= array >= low
+    if high is not None:
+        mask &= array <= high
+    if snapshot.schema[column] == "int":
+        mask &= array != NO_TIME
+    return mask
+
+def _matches(value, op, cond):
+    if op == "in":
+        return value in cond
+    low, high = cond
+    if value is None or value == NO_TIME:
+        return False
+    return (low is None or value >= low) and (high is None or value <= high)
+
+def _months(low, high):
+    """Partition months ("YYYY-MM") a timestamp range can touch, or None if open-ended"""
+    if low is None or high is None:
+        return None
+    start, end = to_datetime(low), to_datetime(high)
+    months, year, month = set(), start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        months.add(f"{year:04d}-{month:02d}")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+# ============================================================================
+# ROWS
+# ============================================================================
+
+def _format(fmt, value, text=False):
+    """Export value for one archived field"""
+    if fmt == "timestamp":
+        value = to_datetime(value) if value is not None else None
+        if text:
+            return value.isoformat(sep=" ", timespec="seconds") if value else ""
+        return value
+    if fmt == "stage":
+        return STAGE_NAMES[value] if value is not None else None
+    if fmt == "bool":
+        return bool(value)
+    return value
+
+_STAGE_LOOKUP = np.array(STAGE_NAMES, dtype=object)
+
+def _column_values(snapshot, column, fmt, rows, text=False):
+    """Export values for one snapshot column over a chunk of rows, formatted a column at a time"""
+    if fmt == "timestamp":
+        array = snapshot.column(column)[rows]
+        missing = array == NO_TIME
+        stamps = array.astype("datetime64[us]")
+        if text:
+            values = np.char.replace(np.datetime_as_string(stamps, unit="s"), "T", " ").astype(object)
+            values[missing] = ""
+            return values.tolist()
+        values = stamps.astype(object)
+        values[missing] = None
+        return values.tolist()
+    if fmt == "stage":
+        return _STAGE_LOOKUP[snapshot.column(column)[rows]].tolist()
+    if fmt == "int":
+        # Missing ints are stored as NO_TIME; export them blank, as archived rows are
+        array = snapshot.column(column)[rows]
+        values = array.tolist()
+        for idx in np.flatnonzero(array == NO_TIME).tolist():
+            values[idx] = None
+        return values
+    return snapshot.values(column, rows)
+
+def distinct(kind, label, snapshot=None):
+    """Sorted distinct values of a string column, for filter pickers"""
+    snapshot = snapshot or EXPORTS[kind]["snapshot"]()
+    if snapshot is None or not len(snapshot):
+        return []
+    column, _ = EXPORTS[kind]["columns"][label]
+    codes = np.unique(snapshot.column(column))
+    return sorted(snapshot.strings[c] for c in codes.tolist() if c >= 0)
+
+def iter_rows(kind, columns=None, filters=None, include_archive=False, snapshot=None, text=False):
+    """Yield export rows (tuples in `columns` order) for live and optionally archived records
+
+    text=True renders timestamps as "YYYY-MM-DD HH:MM:SS" strings for CSV.
+    """
+    spec = EXPORTS[kind]
+    columns = columns or list(spec["columns"])
+    fields = [spec["columns"][label] for label in columns]
+    conditions = [(spec["columns"][label], *_normalise_filter(spec["columns"][label][1], cond))
+                  for label, cond in (filters or {}).items() if cond not in (None, [], (None, None))]
+
+    snapshot = snapshot or spec["snapshot"]()
+    if snapshot is not None and len(snapshot):
+        # String filters resolve to dictionary codes once, then masks are built a
+        # block at a time so filtering a huge snapshot stays in bounded memory
+        coded = [(column, op, _string_codes(snapshot, value) if op == "in" and snapshot.schema[column] == "str"
+                  else value) for (column, _), op, value in conditions]
+        for block_start in range(0, len(snapshot), FILTER_BLOCK_ROWS):
+            block = slice(block_start, min(block_start + FILTER_BLOCK_ROWS, len(snapshot)))
+            mask = np.ones(block.stop - block.start, dtype=bool)
+            for column, op, value in coded:
+                mask &= _column_mask(snapshot, column, op, value, block)
+            rows = np.flatnonzero(mask) + block_start
+            for start in range(0, len(rows), CHUNK_ROWS):
+                chunk = rows[start:start + CHUNK_ROWS]
+                yield from zip(*[_column_values(snapshot, column, fmt, chunk, text) for column, fmt in fields])
+
+    if not include_archive:
+        return
+    months = None
+    partition_column = spec["columns"][spec["partition_by"]]
+    for field, op, value in conditions:
+        if field == partition_column and op == "range":
+            months = _months(*value)
+    decoder = SalesDecoder()
+    partitions = load_manifest().get(kind, {}).get("partitions", {})
+    for month in sorted(partitions):
+        if months is not None and month not in months and month != "undated":
+            continue
+        for raw in read_partition(kind, month, cache=False):
+            flat = spec["flatten"](raw, decoder)
+            if all(_matches(flat[column], op, value) for (column, _), op, value in conditions):
+                yield tuple(_format(fmt, flat[column], text) for column, fmt in fields)
+
+# ============================================================================
+# WRITERS
+# ============================================================================
+
+def iter_csv(kind, columns=None, filters=None, include_archive=False, snapshot=None):
+    """CSV as a stream of UTF-8 byte chunks"""
+    columns = columns or list(EXPORTS[kind]["columns"])
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for n, row in enumerate(iter_rows(kind, columns, filters, include_archive, snapshot, text=True), 1):
+        writer.writerow(row)
+        if n % CHUNK_ROWS == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+def write_csv(out, kind, columns=None, filters=None, include_archive=False, snapshot=None):
+    """Stream a CSV export into a binary file object"""
+    for chunk in iter_csv(kind, columns, filters, include_archive, snapshot):
+        out.write(chunk)
+
+def write_xlsx(out, kind, columns=None, filters=None, include_archive=False, snapshot=None):
+    """Stream an XLSX export into a path or binary file object (needs openpyxl)"""
+    if openpyxl is None:
+        raise RuntimeError("XLSX export needs openpyxl: pip install openpyxl")
+    columns = columns or list(EXPORTS[kind]["columns"])
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet, rows = None, MAX_SHEET_ROWS
+    for row in iter_rows(kind, columns, filters, include_archive, snapshot):
+        if rows == MAX_SHEET_ROWS:
+            # Carry on in a new sheet past Excel's row limit
+            sheet = workbook.create_sheet(f"{kind.title()} {len(workbook.worksheets) + 1}")
+            sheet.append(columns)
+            rows = 0
+        sheet.append(row)
+        rows += 1
+    if sheet is None:
+        workbook.create_sheet(kind.title()).append(columns)
+    workbook.save(out)
+
+if __name__ == "__main__":
+    import tempfile
+    import time
+    import tracemalloc
+    from pathlib import Path
+
+    import snapshot as snapshots
+    from config import SALES_FILE
+    from snapshot import Snapshot, sales_columns, source_signature, write_snapshot
+
+    n = 1_000_000
+    tmp = Path(tempfile.mkdtemp())
+    snapshots.SNAPSHOT_DIR = tmp / "snapshots"
+    signature = source_signature(SALES_FILE)
+    base = sales_columns(SALES_FILE)
+    repeat = -(-n // len(base["sale_id"]))
+    columns = {name: (values * repeat)[:n] for name, values in base.items()}
+    columns["sale_id"] = [f"SALE{i:07d}" for i in range(n)]
+    start = time.perf_counter()
+    snap = Snapshot(write_snapshot("bench-sales", SALES_FILE, columns, signature))
+    del columns, base
+    print(f"built a {n:,}-row snapshot in {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    with open(tmp / "pipeline.csv", "wb") as f:
+        write_csv(f, "sales", snapshot=snap)
+    elapsed = time.perf_counter() - start
+    # Peak memory measured on a separate pass, as tracing slows the export
+    tracemalloc.start()
+    for _ in iter_csv("sales", snapshot=snap):
+        pass
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"CSV, all columns: {n:,} rows in {elapsed:.1f}s, "
+          f"{(tmp / 'pipeline.csv').stat().st_size / 1e6:.0f} MB written, peak Python memory {peak / 1e6:.1f} MB")
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    salesperson = distinct("sales", "Salesperson", snap)[0]
+    lines = -1
+    for chunk in iter_csv("sales", ["Sale ID", "Salesperson", "Stage", "Total Price"],
+                          {"Salesperson": salesperson, "Stage": ["Collection Day"]}, snapshot=snap):
+        lines += chunk.count(b"\n")
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"CSV, 4 columns, filtered to {salesperson} at Collection Day: {lines:,} rows in "
+          f"{time.perf_counter() - start:.2f}s, peak {peak / 1e6:.1f} MB")
+
+    if XLSX_AVAILABLE:
+        tracemalloc.start()
+        start = time.perf_counter()
+        write_xlsx(tmp / "pipeline.xlsx", "sales", ["Sale ID", "Make", "Model", "Stage", "Total Price",
+                                                    "Deposit Date"], snapshot=snap)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"XLSX, 6 columns: {n:,} rows in {time.perf_counter() - start:.1f}s, peak {peak / 1e6:.1f} MB")
+    else:
+        print("XLSX skipped (openpyxl is not installed)")
@@ -0,0 +1,101 @@
+# finance.py
+# PCP and HP finance quotes from precomputed annuity tables.
+#
+# Annuity factors r / (1 - (1 + r)^-n) and discount factors (1 + r)^-n are
+# precomputed once for every APR on a 0.1% grid and every term in months,
+# so a quote is a table lookup and a multiply. payment_matrix() returns the
+# monthly payment for every term and deposit combination in one vectorised
+# call, letting staff flip between quotes without recomputing anything.
+#
+#   HP:  (price - deposit) * annuity
+#   PCP: (price - deposit - balloon * discount) * annuity, balloon due at the end
+import numpy as np
+
+APR_STEP = 0.1
+MAX_APR = 30.0
+MIN_TERM = 6
+MAX_TERM = 72
+
+STANDARD_TERMS = [24, 36, 48, 60]
+STANDARD_DEPOSITS = [0, 1000, 2500, 5000, 10000]
+
+DEFAULT_APR = 9.9
+DEFAULT_TERM = 48
+DEFAULT_PRODUCT = "HP"
+
+# Guaranteed future value as a share of the cash price, by term
+PCP_BALLOON = {24: 0.55, 36: 0.45, 48: 0.38, 60: 0.32}
+
+APR_GRID = np.round(np.arange(0, MAX_APR + APR_STEP / 2, APR_STEP), 1)
+TERM_GRID = np.arange(MIN_TERM, MAX_TERM + 1)
+
+def _monthly_rate(apr):
+    """Monthly rate equivalent to an annual percentage rate"""
+    return (1 + np.asarray(apr, dtype=float) / 100) ** (1 / 12) - 1
+
+def _factors(apr, term):
+    """Annuity and discount factors for arrays of APR and term"""
+    r = _monthly_rate(apr)
+    n = np.asarray(term, dtype=float)
+    discount = (1 + r) ** -n
+    with np.errstate(divide="ignore", invalid="ignore"):
+        annuity = np.where(r > 0, r / (1 - discount), 1 / n)
+    return annuity, discount
+
+ANNUITY_TABLE, DISCOUNT_TABLE = _factors(APR_GRID[:, None], TERM_GRID[None, :])
+
+def factors(apr, terms):
+    """Look up (annuity, discount) factor arrays for one APR and several terms"""
+    terms = np.atleast_1d(np.asarray(terms))
+    apr_idx = round(apr / APR_STEP)
+    on_grid = abs(apr_idx * APR_STEP - apr) < 1e-9 and 0 <= apr_idx < len(APR_GRID)
+    if on_grid and terms.min() >= MIN_TERM and terms.max() <= MAX_TERM:
+        cols = terms - MIN_TERM
+        return ANNUITY_TABLE[apr_idx, cols], DISCOUNT_TABLE[apr_idx, cols]
+    return _factors(apr, terms)
+
+def balloon_share(term):
+    """PCP balloon as a share of price for a term, interpolated between standard terms"""
+    known = sorted(PCP_BALLOON)
+    return float(np.interp(term, known, [PCP_BALLOON[t] for t in known]))
+
+def payment_matrix(price, apr=DEFAULT_APR, product=DEFAULT_PRODUCT,
+                   terms=STANDARD_TERMS, deposits=STANDARD_DEPOSITS):
+    """Monthly payments for every term (rows) and deposit (columns)"""
+    terms = np.asarray(terms)
+    deposits = np.asarray(deposits, dtype=float)
+    annuity, discount = factors(apr, terms)
+    if product == "PCP":
+        balloon = price * np.array([balloon_share(t) for t in terms])
+    else:
+        balloon = np.zeros(len(terms))
+    financed = np.maximum(price - deposits[None, :] - (balloon * discount)[:, None], 0)
+    monthly = financed * annuity[:, None]
+    total = monthly * terms[:, None] + deposits[None, :] + balloon[:, None]
+    return {
+        "terms": terms.tolist(),
+        "deposits": deposits.astype(int).tolist(),
+        "monthly": np.round(monthly, 2),
+        "balloon": np.round(balloon, 2),
+        "total_payable": np.round(total, 2),
+    }
+
+def monthly_payment(amount, apr=DEFAULT_APR, term=DEFAULT_TERM):
+    """HP monthly payment on a financed amount"""
+    annuity, _ = factors(apr, term)
+    return float(max(amount, 0) * annuity[0])
+
+def max_financed(monthly_budget, apr=DEFAULT_APR, term=DEFAULT_TERM):
+    """Largest amount an HP monthly budget can finance"""
+    annuity, _ = factors(apr, term)
+    return float(monthly_budget / annuity[0])
+
+if __name__ == "__main__":
+    import time
+    start = time.perf_counter()
+    for _ in range(10_000):
+        payment_matrix(45_000, 7.9, "PCP")
+    print(f"payment_matrix: {(time.perf_counter() - start) / 10_000 * 1e6:.0f} us")
+    quote = payment_matrix(45_000, 7.9, "PCP")
+    print("terms", quote["terms"], "deposits", quote["deposits"])
+    print(quote["monthly"])
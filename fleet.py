@@ -0,0 +1,108 @@
+# fleet.py
+# Bulk trade-in appraisal for fleet and lease-return lists.
+#
+# A pasted list or CSV is split into registrations, each one is appraised on
+# a bounded thread pool and results are yielded as they complete, so the
+# page can stream them into a table. With FLEET_WORKERS lookups in flight,
+# a 500-car list finishes in roughly the time of its slowest waves rather
+# than 500 sequential lookups; per-provider rate limits still apply in
+# providers.py. A failed lookup is reported against its registration and
+# never stops the rest of the batch.
+import csv
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+FLEET_WORKERS = 64
+MAX_FLEET_SIZE = 1000
+
+REG_COLUMNS = ("registration", "reg", "vrm", "plate")
+
+SUMMARY_COLUMNS = ["Registration", "Make", "Model", "Year", "Mileage", "Value", "Low", "High",
+                   "Next MOT", "Open Recalls", "Mileage Anomaly", "Status"]
+
+def split_registrations(text):
+    """Registrations from a pasted list or CSV (a registration column, else the first column)"""
+    lines = [line for line in text.strip().splitlines() if line.strip()]
+    if not lines:
+        return []
+    delimiter = "\t" if "\t" in lines[0] else "," if "," in lines[0] else None
+    if delimiter is None:
+        # One registration per line (plates can contain spaces)
+        return [cell.strip() for line in lines for cell in line.split(";") if cell.strip()]
+    rows = list(csv.reader(lines, delimiter=delimiter))
+    header = [cell.strip().lower() for cell in rows[0]]
+    column = next((header.index(name) for name in REG_COLUMNS if name in header), None)
+    if column is not None:
+        rows = rows[1:]
+    elif len(rows) == 1:
+        return [cell.strip() for cell in rows[0] if cell.strip()]
+    else:
+        column = 0
+    return [row[column].strip() for row in rows if len(row) > column and row[column].strip()]
+
+def dedupe(registrations, normalise):
+    """Unique registrations in input order"""
+    seen = set()
+    unique = []
+    for reg in registrations:
+        key = normalise(reg)
+        if key not in seen:
+            seen.add(key)
+            unique.append(key)
+    return unique
+
+def appraise_fleet(registrations, appraise, workers=FLEET_WORKERS, initializer=None):
+    """Yield (index, registration, result or None, error or None) as appraisals complete"""
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fleet", initializer=initializer)
+    try:
+        futures = {pool.submit(appraise, reg): (idx, reg) for idx, reg in enumerate(registrations)}
+        for future in as_completed(futures):
+            idx, reg = futures[future]
+            try:
+                yield idx, reg, future.result(), None
+            except Exception as e:
+                yield idx, reg, None, str(e) or type(e).__name__
+    finally:
+        # A rerun that abandons the stream must not wait for queued lookups
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def error_row(reg, error):
+    """Summary row for a registration that could not be appraised"""
+    row = dict.fromkeys(SUMMARY_COLUMNS)
+    row.update({"Registration": reg, "Status": f"Failed: {error}"})
+    return row
+
+def to_csv(rows):
+    """Downloadable CSV of the fleet summary"""
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=SUMMARY_COLUMNS, extrasaction="ignore")
+    writer.writeheader()
+    writer.writerows(rows)
+    return out.getvalue().encode("utf-8")
+
+def totals(rows):
+    """Headline figures for a fleet summary"""
+    valued = [r for r in rows if r.get("Value") is not None]
+    return {
+        "vehicles": len(rows),
+        "appraised": len(valued),
+        "failed": len(rows) - len(valued),
+        "total_value": sum(r["Value"] for r in valued),
+        "flagged": sum(1 for r in valued if r.get("Mileage Anomaly") or r.get("Open Recalls")),
+    }
+
+if __name__ == "__main__":
+    import random
+
+    def slow_appraisal(reg):
+        time.sleep(random.uniform(0.05, 0.3))
+        if random.random() < 0.02:
+            raise TimeoutError("provider timeout")
+        return {"Registration": reg, "Value": random.randint(5_000, 30_000)}
+
+    regs = [f"FL{n:03d}ABC" for n in range(500)]
+    start = time.perf_counter()
+    rows = [r or error_row(reg, err) for _, reg, r, err in appraise_fleet(regs, slow_appraisal)]
+    elapsed = time.perf_counter() - start
+    print(f"{len(rows)} cars in {elapsed:.2f}s (sequential ~{500 * 0.175:.0f}s), {totals(rows)}")
@@ -0,0 +1,232 @@
+# funnel.py
+# Streaming stage-duration and conversion analytics for the sales funnel.
+#
+# Stage transitions are consumed one at a time. The only per-deal state kept
+# is the stage each open deal is in and when it entered it; finished dwell
+# times go straight into DDSketch-style quantile sketches (logarithmic
+# buckets with a fixed relative accuracy). Sketches are kept per stage, per
+# salesperson and stage, and per garage and stage. Two funnels, e.g. from
+# different sites, merge by adding bucket counts.
+import math
+import time
+
+from records import STAGE_NAMES, NO_TIME
+
+HOUR_US = 3_600 * 1_000_000
+
+# ============================================================================
+# QUANTILE SKETCH
+# ============================================================================
+
+class QuantileSketch:
+    """Mergeable quantile sketch with bounded relative error (DDSketch-style)"""
+
+    __slots__ = ("alpha", "_log_gamma", "bins", "zero_count", "count", "total")
+
+    def __init__(self, alpha=0.01):
+        self.alpha = alpha
+        self._log_gamma = math.log((1 + alpha) / (1 - alpha))
+        self.bins = {}
+        self.zero_count = 0
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value, weight=1):
+        """Add a non-negative value"""
+        self.count += weight
+        self.total += value * weight
+        if value <= 1e-9:
+            self.zero_count += weight
+            return
+        key = math.ceil(math.log(value) / self._log_gamma)
+        self.bins[key] = self.bins.get(key, 0) + weight
+
+    def quantile(self, q):
+        """Approximate value at quantile q (0..1), or None when empty"""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        gamma = math.exp(self._log_gamma)
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if seen > rank:
+                return 2 * gamma ** key / (gamma + 1)
+        return 2 * gamma ** max(self.bins) / (gamma + 1)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def merge(self, other):
+        """Fold another sketch with the same accuracy into this one"""
+        if other.alpha != self.alpha:
+            raise ValueError("Cannot merge sketches with different accuracy")
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.total += other.total
+        return self
+
+    def to_dict(self):
+        return {
+            "alpha": self.alpha,
+            "bins": {str(k): v for k, v in self.bins.items()},
+            "zero_count": self.zero_count,
+            "count": self.count,
+            "total": self.total,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["alpha"])
+        sketch.bins = {int(k): v for k, v in data["bins"].items()}
+        sketch.zero_count = data["zero_count"]
+        sketch.count = data["count"]
+        sketch.total = data["total"]
+        return sketch
+
+# ============================================================================
+# FUNNEL
+# ============================================================================
+
+def _days(sketch, q):
+    """Quantile of an hours sketch expressed in days"""
+    return None if sketch is None else round(sketch.quantile(q) / 24, 1)
+
+class FunnelAnalytics:
+    """Per-stage dwell-time distributions and conversion counts"""
+
+    def __init__(self, alpha=0.01):
+        self.alpha = alpha
+        self.sketches = {}                        # (dimension, key, stage) -> sketch
+        self.counts = {}                          # (dimension, key) -> [entered, advanced] per stage
+        self._open = {}                           # deal_id -> (stage, entered_at, salesperson, garage)
+
+    def _sketch(self, dimension, key, stage):
+        sketch = self.sketches.get((dimension, key, stage))
+        if sketch is None:
+            sketch = self.sketches[(dimension, key, stage)] = QuantileSketch(self.alpha)
+        return sketch
+
+    def _counts(self, dimension, key):
+        counts = self.counts.get((dimension, key))
+        if counts is None:
+            counts = self.counts[(dimension, key)] = [[0] * len(STAGE_NAMES), [0] * len(STAGE_NAMES)]
+        return counts
+
+    def observe(self, deal_id, stage, at, salesperson=None, garage=None):
+        """Consume one transition: `deal_id` entered `stage` at epoch microseconds `at`"""
+        previous = self._open.pop(deal_id, None)
+        if previous is not None:
+            salesperson = salesperson or previous[2]
+            garage = garage or previous[3]
+        dimensions = [("stage", None)]
+        if salesperson:
+            dimensions.append(("salesperson", salesperson))
+        if garage:
+            dimensions.append(("garage", garage))
+
+        if previous is not None and stage > previous[0]:
+            prev_stage = previous[0]
+            hours = max(0, at - previous[1]) / HOUR_US
+            for dimension, key in dimensions:
+                self._sketch(dimension, key, prev_stage).add(hours)
+                self._counts(dimension, key)[1][prev_stage] += 1
+        for dimension, key in dimensions:
+            self._counts(dimension, key)[0][stage] += 1
+        if stage < len(STAGE_NAMES) - 1:
+            self._open[deal_id] = (stage, at, salesperson, garage)
+
+    def observe_history(self, deal_id, stage_times, salesperson=None, garage=None):
+        """Replay one deal's stage history (epoch microseconds per stage)"""
+        for stage, at in enumerate(stage_times):
+            if at == NO_TIME:
+                break
+            self.observe(deal_id, stage, at, salesperson, garage)
+
+    def merge(self, other):
+        """Fold another site's funnel into this one"""
+        for key, sketch in other.sketches.items():
+            mine = self.sketches.get(key)
+            if mine is None:
+                self.sketches[key] = QuantileSketch(sketch.alpha).merge(sketch)
+            else:
+                mine.merge(sketch)
+        for key, (entered, advanced) in other.counts.items():
+            mine = self._counts(*key)
+            mine[0] = [a + b for a, b in zip(mine[0], entered)]
+            mine[1] = [a + b for a, b in zip(mine[1], advanced)]
+        self._open.update(other._open)
+        return self
+
+    def keys(self, dimension):
+        """Distinct salespeople or garages seen"""
+        return sorted(k for d, k in self.counts if d == dimension)
+
+    def report(self, dimension="stage", key=None):
+        """Rows of dwell-time quantiles (days) and conversion rate per stage"""
+        rows = []
+        entered_counts, advanced_counts = self.counts.get((dimension, key), ([0] * len(STAGE_NAMES),) * 2)
+        for stage, name in enumerate(STAGE_NAMES[:-1]):
+            sketch = self.sketches.get((dimension, key, stage))
+            entered = entered_counts[stage]
+            rows.append({
+                "stage": name,
+                "deals": entered,
+                "p50_days": _days(sketch, 0.5),
+                "p90_days": _days(sketch, 0.9),
+                "p99_days": _days(sketch, 0.99),
+                "conversion": round(advanced_counts[stage] / entered, 3) if entered else None,
+            })
+        return rows
+
+    def to_dict(self):
+        """Serialisable form for shipping between sites (open deals excluded)"""
+        return {
+            "alpha": self.alpha,
+            "counts": [[d, k, entered, advanced] for (d, k), (entered, advanced) in self.counts.items()],
+            "sketches": [[d, k, s, sketch.to_dict()] for (d, k, s), sketch in self.sketches.items()],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        funnel = cls(data["alpha"])
+        funnel.counts = {(d, k): [list(e), list(a)] for d, k, e, a in data["counts"]}
+        funnel.sketches = {(d, k, s): QuantileSketch.from_dict(sk) for d, k, s, sk in data["sketches"]}
+        return funnel
+
+    @classmethod
+    def from_snapshot(cls, snapshot, garage_column=None):
+        """Replay every deal's stage history from a sales or journeys snapshot"""
+        funnel = cls()
+        if snapshot is None or not len(snapshot):
+            return funnel
+        key = "sale_id" if "sale_id" in snapshot.schema else "tracking_id"
+        ids = snapshot.values(key)
+        people = snapshot.values("salesperson")
+        garages = snapshot.values(garage_column) if garage_column else [None] * len(ids)
+        for deal_id, times, person, garage in zip(ids, snapshot.column("stage_times").tolist(), people, garages):
+            funnel.observe_history(deal_id, times, person, garage)
+        return funnel
+
+if __name__ == "__main__":
+    import random
+    funnel = FunnelAnalytics()
+    deals = 100_000
+    start = time.perf_counter()
+    for n in range(deals):
+        at = 0
+        for stage in range(len(STAGE_NAMES)):
+            if stage and random.random() < 0.1:
+                break
+            funnel.observe(n, stage, at, f"SP{n % 5}", f"G{n % 22}")
+            at += int(random.expovariate(1 / 4) * 24 * HOUR_US)
+    events = sum(funnel.counts[("stage", None)][0])
+    print(f"{events:,} transitions at {events / (time.perf_counter() - start):,.0f}/sec, "
+          f"{len(funnel.sketches)} sketches")
+    for row in funnel.report():
+        print(row)
@@ -0,0 +1,437 @@
+# journeys.py
+# Event-sourced customer journeys.
+#
+# Every change to a journey is an event in data/journey_events.sqlite:
+#
+#   journey_created          {journey}
+#   stage_advanced           {stage}
+#   note_added               {text}
+#   collection_date_changed  {date}
+#
+# The log is the source of truth. customer_journeys.json is the materialised
+# state, and JourneyStore also keeps it in memory keyed by tracking ID, so a
+# read is one dictionary lookup. Each journey records the sequence number of
+# the last event folded into it ("version"). Folding is therefore
+# idempotent, and a store that finds the file stale (another process, a
+# crash between commit and write, archive tiering) catches up by replaying
+# only the newer events. The sequence number the file reflects is kept in
+# the log's meta table, written with the file under the log's write lock,
+# rather than inferred from the journeys left in it. Journeys that archive
+# tiering has moved out (archive.py) stay out: their events are skipped
+# when catching up, and their tracking IDs cannot be created again.
+#
+# A live journey per car is enforced here rather than in the form: create()
+# checks the registration and VIN against the journeys already folded, in
+# the same transaction as the write, so two salespeople starting a journey
+# for one trade-in cannot both succeed. The check uses a DedupIndex of its
+# own rather than the app's shared one: that index follows the change feed,
+# which is published after the write commits and polled on a throttle, so
+# it can lag the log; this one is folded from exactly the state the write
+# lock protects.
+#
+# Commands take the log's write lock (BEGIN IMMEDIATE), validate against the
+# caught-up state and append their events in one transaction. A bulk stage
+# update for 200 deals is therefore all-or-nothing and rewrites the file
+# once. replay() rebuilds every journey from the log alone for audit.
+# Journeys saved before the log existed are imported as journey_created
+# events the first time the store opens.
+# `python journeys.py` benchmarks reads, bulk updates and a full replay.
+import datetime
+import json
+import os
+import sqlite3
+import threading
+
+from archive import load_manifest
+from config import DATA_DIR, JOURNEYS_FILE, SALES_STAGES
+from dedup import DedupIndex, raw_vehicle
+from records import STAGE_INDEX, STAGE_NAMES
+
+EVENTS_DB = DATA_DIR / "journey_events.sqlite"
+
+EVENT_TYPES = ("journey_created", "stage_advanced", "note_added", "collection_date_changed")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    tracking_id TEXT NOT NULL,
+    type TEXT NOT NULL,
+    data TEXT NOT NULL,
+    at TEXT NOT NULL,
+    actor TEXT
+);
+CREATE INDEX IF NOT EXISTS events_journey ON events (tracking_id, seq);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+class JourneyError(Exception):
+    """A journey command could not be applied"""
+
+class JourneyNotFound(JourneyError):
+    """No journey has this tracking ID"""
+
+class InvalidTransition(JourneyError):
+    """The command is not valid for the journey's current state"""
+
+class DuplicateVehicle(InvalidTransition):
+    """Another live journey has the same registration or VIN"""
+
+def stage_index(stage):
+    """Stage index from an index or a SALES_STAGES name"""
+    if isinstance(stage, str):
+        if stage not in STAGE_INDEX:
+            raise InvalidTransition(f"Unknown stage: {stage}")
+        return STAGE_INDEX[stage]
+    if not 0 <= stage < len(SALES_STAGES):
+        raise InvalidTransition(f"Stage {stage} is out of range")
+    return int(stage)
+
+# ============================================================================
+# FOLDING
+# ============================================================================
+
+def apply_event(journeys, seq, tracking_id, kind, data, at):
+    """Fold one event into a {tracking_id: journey} state (no-op if already applied)"""
+    journey = journeys.get(tracking_id)
+    if kind == "journey_created":
+        if journey is None or journey.get("version", 0) < seq:
+            journeys[tracking_id] = dict(data["journey"], version=seq)
+        return
+    if journey is None or journey.get("version", 0) >= seq:
+        return
+    if kind == "stage_advanced":
+        history = journey.setdefault("stage_history", {})
+        for stage in range(journey.get("current_stage", 0) + 1, data["stage"] + 1):
+            history.setdefault(STAGE_NAMES[stage], at)
+        journey["current_stage"] = data["stage"]
+    elif kind == "note_added":
+        journey.setdefault("notes", []).append({"text": data["text"], "at": at, "by": data.get("by")})
+    elif kind == "collection_date_changed":
+        journey["collection_date"] = data["date"]
+    journey["version"] = seq
+
+def _signature(path):
+    if not path.exists():
+        return None
+    stat = path.stat()
+    return [stat.st_size, stat.st_mtime_ns]
+
+def archived_ids():
+    """Tracking IDs archive tiering has moved out of the journeys file"""
+    return load_manifest().get("journeys", {}).get("index", {})
+
+# ============================================================================
+# STORE
+# ============================================================================
+
+class JourneyStore:
+    """Materialised journey state backed by the event log"""
+
+    def __init__(self, path=EVENTS_DB, journeys_file=JOURNEYS_FILE):
+        self.path = path
+        self.journeys_file = journeys_file
+        self.journeys = {}
+        self.seq = 0
+        self._signature = None
+        self._data_version = None
+        self._vehicles = None
+        self._lock = threading.RLock()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        self._conn.executescript(SCHEMA)
+        with self._lock:
+            self._import_legacy()
+            self._refresh()
+
+    def _load_file(self):
+        self._signature = _signature(self.journeys_file)
+        if self._signature is None:
+            return {}
+        with open(self.journeys_file, "rb") as f:
+            return {j["tracking_id"]: j for j in json.loads(f.read())}
+
+    def _import_legacy(self):
+        """Give journeys saved before the event log a journey_created event"""
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM events LIMIT 1").fetchone():
+                conn.execute("COMMIT")
+                return
+            journeys = self._load_file()
+            for tracking_id, journey in journeys.items():
+                conn.execute("INSERT INTO events (tracking_id, type, data, at, actor) VALUES (?, ?, ?, ?, ?)",
+                             (tracking_id, "journey_created", json.dumps({"journey": journey}),
+                              journey.get("created_date") or datetime.datetime.now().isoformat(), "import"))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _file_seq(self):
+        """Sequence number the journeys file reflects, or None when it is not one this log wrote"""
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'file'").fetchone()
+        if row is None:
+            return None
+        saved = json.loads(row[0])
+        return saved["seq"] if saved["signature"] == self._signature else None
+
+    def _refresh(self):
+        """Catch up with the file and with events committed by other processes"""
+        reloaded = _signature(self.journeys_file) != self._signature
+        if reloaded:
+            self.journeys = self._load_file()
+            self._vehicles = None
+            self.seq = self._file_seq()
+            if self.seq is None:
+                # Rewritten outside the store (archive tiering): every event up to the
+                # newest version left in the file is in it
+                self.seq = max((j.get("version", 0) for j in self.journeys.values()), default=0)
+        data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if not reloaded and data_version == self._data_version:
+            return
+        self._data_version = data_version
+        caught_up, archived = False, None
+        for seq, tracking_id, kind, data, at in self._conn.execute(
+                "SELECT seq, tracking_id, type, data, at FROM events WHERE seq > ? ORDER BY seq", (self.seq,)):
+            if archived is None:
+                archived = archived_ids()
+            if tracking_id not in archived:
+                self._fold(seq, tracking_id, kind, json.loads(data), at)
+            self.seq = seq
+            caught_up = True
+        if caught_up and reloaded:
+            self._save()
+
+    def _fold(self, seq, tracking_id, kind, data, at):
+        apply_event(self.journeys, seq, tracking_id, kind, data, at)
+        if kind == "journey_created" and self._vehicles is not None:
+            self._vehicles.update("journeys", tracking_id, *raw_vehicle(self.journeys[tracking_id]))
+
+    def _vehicle_owner(self, journey):
+        """Tracking ID of a live journey for the same car, or None"""
+        if self._vehicles is None:
+            self._vehicles = DedupIndex()
+            for tracking_id, existing in self.journeys.items():
+                self._vehicles.update("journeys", tracking_id, *raw_vehicle(existing))
+        matches = self._vehicles.find(*raw_vehicle(journey))
+        return matches[0][1] if matches else None
+
+    def _write(self):
+        self.journeys_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.journeys_file.with_name(f".{self.journeys_file.name}.{os.getpid()}.tmp")
+        with open(tmp, "w") as f:
+            # Compact output keeps json on its C encoder; indent forces the pure-Python one
+            f.write(json.dumps(list(self.journeys.values()), separators=(",", ":")))
+        os.replace(tmp, self.journeys_file)
+        self._signature = _signature(self.journeys_file)
+
+    def _save(self):
+        """Write the file and record the sequence number it reflects, under the log's write lock"""
+        conn = self._conn
+        own = not conn.in_transaction
+        if own:
+            conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._write()
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('file', ?)",
+                         (json.dumps({"seq": self.seq, "signature": self._signature}),))
+            if own:
+                conn.execute("COMMIT")
+        except Exception:
+            if own:
+                conn.execute("ROLLBACK")
+            raise
+
+    def _execute(self, build, actor=None):
+        """Validate and append the events `build()` returns as one transaction"""
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._refresh()
+                events = build()
+                at = datetime.datetime.now().isoformat()
+                committed = []
+                for tracking_id, kind, data in events:
+                    seq = conn.execute(
+                        "INSERT INTO events (tracking_id, type, data, at, actor) VALUES (?, ?, ?, ?, ?)",
+                        (tracking_id, kind, json.dumps(data), at, actor)).lastrowid
+                    committed.append((seq, tracking_id, kind, data, at))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            for event in committed:
+                self._fold(*event)
+                self.seq = event[0]
+            if committed:
+                self._save()
+            return len(committed)
+
+    def _require(self, tracking_id):
+        journey = self.journeys.get(tracking_id)
+        if journey is None:
+            raise JourneyNotFound(tracking_id)
+        return journey
+
+    # Reads
+
+    def get(self, tracking_id):
+        """Current state of a journey, or None"""
+        with self._lock:
+            self._refresh()
+            return self.journeys.get(tracking_id)
+
+    def all(self):
+        with self._lock:
+            self._refresh()
+            return list(self.journeys.values())
+
+    def history(self, tracking_id):
+        """Every event for one journey, oldest first"""
+        rows = self._conn.execute(
+            "SELECT seq, type, data, at, actor FROM events WHERE tracking_id = ? ORDER BY seq", (tracking_id,))
+        return [{"seq": seq, "type": kind, "data": json.loads(data), "at": at, "actor": actor}
+                for seq, kind, data, at, actor in rows]
+
+    # Commands
+
+    def create(self, journey, actor=None):
+        tracking_id = journey["tracking_id"]
+
+        def build():
+            if tracking_id in self.journeys or tracking_id in archived_ids():
+                raise InvalidTransition(f"Journey {tracking_id} already exists")
+            owner = self._vehicle_owner(journey)
+            if owner is not None:
+                raise DuplicateVehicle(f"This vehicle already has a customer journey: {owner}")
+            return [(tracking_id, "journey_created", {"journey": journey})]
+        self._execute(build, actor)
+        return self.journeys[tracking_id]
+
+    def advance(self, tracking_id, stage, actor=None):
+        """Move a journey forward to a stage"""
+        return self.advance_many([tracking_id], stage, actor)
+
+    def advance_many(self, tracking_ids, stage, actor=None):
+        """Move many journeys forward to a stage in one transaction; returns how many moved
+
+        Journeys already at the stage are left alone; any unknown ID, or a
+        journey already past the stage, rejects the whole batch.
+        """
+        stage = stage_index(stage)
+
+        def build():
+            events = []
+            for tracking_id in dict.fromkeys(tracking_ids):
+                current = self._require(tracking_id).get("current_stage", 0)
+                if current > stage:
+                    raise InvalidTransition(
+                        f"Journey {tracking_id} is already at {STAGE_NAMES[current]}")
+                if current < stage:
+                    events.append((tracking_id, "stage_advanced", {"stage": stage}))
+            return events
+        return self._execute(build, actor)
+
+    def add_note(self, tracking_id, text, actor=None):
+        text = text.strip()
+
+        def build():
+            self._require(tracking_id)
+            if not text:
+                raise InvalidTransition("Note is empty")
+            return [(tracking_id, "note_added", {"text": text, "by": actor})]
+        self._execute(build, actor)
+
+    def change_collection_date(self, tracking_id, date, actor=None):
+        date = date.isoformat() if hasattr(date, "isoformat") else date
+
+        def build():
+            if self._require(tracking_id).get("collection_date") == date:
+                return []
+            return [(tracking_id, "collection_date_changed", {"date": date})]
+        self._execute(build, actor)
+
+    # Audit
+
+    def replay(self, until=None):
+        """Rebuild every journey from the event log alone, optionally up to a sequence number"""
+        journeys = {}
+        sql, params = "SELECT seq, tracking_id, type, data, at FROM events", ()
+        if until is not None:
+            sql, params = sql + " WHERE seq <= ?", (until,)
+        for seq, tracking_id, kind, data, at in self._conn.execute(sql + " ORDER BY seq", params):
+            apply_event(journeys, seq, tracking_id, kind, json.loads(data), at)
+        return journeys
+
+    def audit(self):
+        """Tracking IDs whose materialised state differs from a replay of the log"""
+        replayed = self.replay()
+        with self._lock:
+            self._refresh()
+            return [tid for tid, journey in self.journeys.items() if replayed.get(tid) != journey]
+
+if __name__ == "__main__":
+    import random
+    import tempfile
+    import time
+    from pathlib import Path
+
+    tmp = Path(tempfile.mkdtemp())
+    n = 20_000
+    journeys = [{
+        "tracking_id": f"J{i:07d}",
+        "created_date": datetime.datetime(2025, 1, 1).isoformat(),
+        "customer": {"name": f"Customer {i}", "email": f"c{i}@example.com", "phone": "07700900000"},
+        "vehicle": {"reg": f"AB{i % 100:02d}CDE", "make": "BMW", "model": "3 Series", "year": 2021},
+        "garage": "Sytner BMW Cardiff",
+        "collection_date": "2025-02-01",
+        "current_stage": 0,
+        "stage_history": {STAGE_NAMES[0]: datetime.datetime(2025, 1, 1).isoformat()},
+    } for i in range(n)]
+    with open(tmp / "journeys.json", "w") as f:
+        json.dump(journeys, f)
+
+    start = time.perf_counter()
+    store = JourneyStore(tmp / "events.sqlite", tmp / "journeys.json")
+    print(f"import {n:,} legacy journeys: {time.perf_counter() - start:.2f}s")
+
+    ids = [j["tracking_id"] for j in journeys]
+    timings = []
+    for stage in range(1, len(SALES_STAGES)):
+        for _ in range(5):
+            batch = random.sample(ids, 200)
+            current = max(store.get(t)["current_stage"] for t in batch)
+            start = time.perf_counter()
+            store.advance_many(batch, max(stage, current), actor="bench")
+            timings.append(time.perf_counter() - start)
+    print(f"bulk advance of 200 deals (one transaction + one file write): "
+          f"{sum(timings) / len(timings) * 1000:.0f} ms")
+
+    for tracking_id in random.sample(ids, 50):
+        store._execute(lambda t=tracking_id: [(t, "note_added", {"text": "Called customer"})])
+    try:
+        store.advance_many(ids[:199] + ["MISSING"], "Collection Day")
+    except JourneyNotFound:
+        pass
+    assert store.get(ids[0])["current_stage"] < len(SALES_STAGES) - 1 or ids[0] in batch
+
+    start = time.perf_counter()
+    for tracking_id in ids:
+        store.get(tracking_id)
+    print(f"read from materialised state: {(time.perf_counter() - start) / n * 1e6:.1f} us")
+
+    events = store._conn.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+    start = time.perf_counter()
+    replayed = store.replay()
+    print(f"replay {events:,} events: {time.perf_counter() - start:.2f}s, "
+          f"{len(store.audit())} mismatches")
+
+    reopened = JourneyStore(tmp / "events.sqlite", tmp / "journeys.json")
+    assert reopened.journeys == replayed
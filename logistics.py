@@ -0,0 +1,222 @@
+# logistics.py
+# Site-to-site distances and the daily trade-in transfer plan.
+#
+# The full distance matrix between Sytner sites is computed once with a
+# vectorised haversine, optionally scaled by a road factor to approximate
+# driving miles. plan_transfers() assigns each traded-in car to the site
+# where it is cheapest to sell: transport cost for the move plus a holding
+# cost for the days it is expected to sit at the destination. Site capacity
+# is modelled by repeating each site's column once per free slot and the
+# resulting assignment problem is solved exactly with a vectorised
+# shortest-augmenting-path Hungarian algorithm.
+#
+# daily_plan() builds the day's problem from the customer journeys (trade-ins
+# handed over on their collection date) and the stock file (free forecourt
+# slots, and how long stock sits at each site as its demand). The sales
+# pipeline page shows it, and `python logistics.py plan [YYYY-MM-DD]` prints
+# it for a scheduled job; `python logistics.py` benchmarks the solver.
+import datetime
+import sys
+import time
+
+import numpy as np
+
+from config import GARAGE_COORDS
+
+EARTH_RADIUS_MILES = 3959
+ROAD_FACTOR = 1.25
+
+TRANSPORT_COST_PER_MILE = 1.20
+HOLDING_COST_PER_DAY = 25.0
+DEFAULT_DAYS_TO_SELL = 30.0
+FORECOURT_SLOTS = 40
+
+SITE_NAMES = list(GARAGE_COORDS)
+SITE_INDEX = {name: idx for idx, name in enumerate(SITE_NAMES)}
+
+# ============================================================================
+# DISTANCES
+# ============================================================================
+
+def haversine_matrix(coords_a, coords_b):
+    """Great-circle miles between every point in coords_a and every point in coords_b"""
+    a = np.radians(np.asarray(coords_a, dtype=float))
+    b = np.radians(np.asarray(coords_b, dtype=float))
+    lat1, lon1 = a[:, 0:1], a[:, 1:2]
+    lat2, lon2 = b[None, :, 0], b[None, :, 1]
+    h = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return EARTH_RADIUS_MILES * 2 * np.arctan2(np.sqrt(h), np.sqrt(1 - h))
+
+_SITE_COORDS = np.array(list(GARAGE_COORDS.values()))
+SITE_DISTANCES = haversine_matrix(_SITE_COORDS, _SITE_COORDS)
+SITE_DISTANCES.setflags(write=False)
+
+def site_distance(site_a, site_b, road_factor=1.0):
+    """Miles between two sites by name"""
+    return float(SITE_DISTANCES[SITE_INDEX[site_a], SITE_INDEX[site_b]] * road_factor)
+
+def distances_from(lat, lon, road_factor=1.0):
+    """Miles from a point to every site, in SITE_NAMES order"""
+    return haversine_matrix([(lat, lon)], _SITE_COORDS)[0] * road_factor
+
+# ============================================================================
+# ASSIGNMENT
+# ============================================================================
+
+def solve_assignment(cost):
+    """Minimum-cost assignment of every row to a distinct column (rows <= columns)"""
+    cost = np.asarray(cost, dtype=float)
+    n, m = cost.shape
+    if n > m:
+        raise ValueError("More rows than columns to assign them to")
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    p = np.zeros(m + 1, dtype=np.int64)     # p[j] = row assigned to column j (1-based, 0 = free)
+    way = np.zeros(m + 1, dtype=np.int64)
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            free = ~used[1:]
+            reduced = cost[i0 - 1] - u[i0] - v[1:]
+            better = free & (reduced < minv[1:])
+            minv[1:][better] = reduced[better]
+            way[1:][better] = j0
+            candidates = np.where(free, minv[1:], np.inf)
+            j1 = int(np.argmin(candidates)) + 1
+            delta = candidates[j1 - 1]
+            u[p[used]] += delta
+            v[used] -= delta
+            minv[1:][free] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+    assignment = np.full(n, -1, dtype=np.int64)
+    cols = np.flatnonzero(p[1:])
+    assignment[p[1:][cols] - 1] = cols
+    return assignment
+
+def plan_transfers(cars, capacity, days_to_sell=None, road_factor=ROAD_FACTOR,
+                   cost_per_mile=TRANSPORT_COST_PER_MILE, holding_cost=HOLDING_COST_PER_DAY):
+    """Assign traded-in cars to destination sites at minimum total cost
+
+    cars:         list of {"id", "site"} with the site each car is at now
+    capacity:     {site: free forecourt slots}
+    days_to_sell: {site: expected days} or an array of shape (cars, sites)
+                  in SITE_NAMES order for per-car demand
+    """
+    n = len(cars)
+    if not n:
+        return []
+    origins = np.array([SITE_INDEX[car["site"]] for car in cars])
+    if days_to_sell is None:
+        days = np.full((n, len(SITE_NAMES)), DEFAULT_DAYS_TO_SELL)
+    elif isinstance(days_to_sell, dict):
+        row = np.array([days_to_sell.get(s, DEFAULT_DAYS_TO_SELL) for s in SITE_NAMES], dtype=float)
+        days = np.broadcast_to(row, (n, len(SITE_NAMES)))
+    else:
+        days = np.asarray(days_to_sell, dtype=float)
+
+    miles = SITE_DISTANCES[origins] * road_factor
+    site_cost = miles * cost_per_mile + days * holding_cost
+
+    # One column per free slot (never more slots per site than cars), plus
+    # one "unplaced" column per car for when capacity runs out
+    slots = np.array([min(int(capacity.get(s, 0)), n) for s in SITE_NAMES])
+    column_site = np.repeat(np.arange(len(SITE_NAMES)), slots)
+    unplaced = np.full((n, n), site_cost.max() * 10 + 1e6)
+    cost = np.hstack([site_cost[:, column_site], unplaced])
+
+    assignment = solve_assignment(cost)
+    plan = []
+    for row, (car, col) in enumerate(zip(cars, assignment.tolist())):
+        if col >= len(column_site):
+            plan.append({"id": car["id"], "from": car["site"], "to": None, "miles": 0.0, "cost": None})
+            continue
+        dest = column_site[col]
+        plan.append({
+            "id": car["id"],
+            "from": car["site"],
+            "to": SITE_NAMES[dest],
+            "miles": round(float(miles[row, dest]), 1),
+            "cost": round(float(site_cost[row, dest]), 2),
+        })
+    return plan
+
+# ============================================================================
+# DAILY PLAN
+# ============================================================================
+
+def site_of(garage):
+    """Site name for a garage as stored on stock ("Sytner BMW Luton") or journeys ("... - 501 Dunstable Road")"""
+    name = (garage or "").split(" - ")[0]
+    return name if name in SITE_INDEX else None
+
+def traded_in_cars(journeys, day):
+    """Trade-ins handed over on `day`: [{"id", "site"}] at the garage collecting them"""
+    cars = []
+    for journey in journeys:
+        site = site_of(journey.get("garage"))
+        collection = (journey.get("collection_date") or "")[:10]
+        if site and collection == day.isoformat() and (journey.get("financial") or {}).get("trade_in_value"):
+            cars.append({"id": journey["tracking_id"], "site": site})
+    return cars
+
+def site_demand(units, today, slots=FORECOURT_SLOTS):
+    """({site: free slots}, {site: expected days to sell}) from the stock on each forecourt
+
+    A site's expected days to sell is the mean time its current stock has
+    been waiting; sites with no dated stock get DEFAULT_DAYS_TO_SELL.
+    """
+    counts, ages = {}, {}
+    for unit in units:
+        site = site_of(unit.get("garage"))
+        if site is None:
+            continue
+        counts[site] = counts.get(site, 0) + 1
+        if unit.get("arrived"):
+            ages.setdefault(site, []).append((today - datetime.date.fromisoformat(unit["arrived"][:10])).days)
+    capacity = {site: max(0, slots - counts.get(site, 0)) for site in SITE_NAMES}
+    days = {site: sum(ages[site]) / len(ages[site]) if site in ages else DEFAULT_DAYS_TO_SELL for site in SITE_NAMES}
+    return capacity, days
+
+def daily_plan(journeys, units, day=None, slots=FORECOURT_SLOTS):
+    """Transfer plan for the trade-ins handed over on `day` (default today)"""
+    day = day or datetime.date.today()
+    capacity, days = site_demand(units, day, slots)
+    return plan_transfers(traded_in_cars(journeys, day), capacity, days)
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "plan":
+        from journeys import JourneyStore
+        from stock import load_stock
+
+        day = datetime.date.fromisoformat(sys.argv[2]) if len(sys.argv) > 2 else datetime.date.today()
+        plan = daily_plan(JourneyStore().all(), load_stock().units, day)
+        for move in plan:
+            if move["to"] is None:
+                print(f"{move['id']}: no free slot, stays at {move['from']}")
+            elif move["to"] == move["from"]:
+                print(f"{move['id']}: stays at {move['from']}")
+            else:
+                print(f"{move['id']}: {move['from']} -> {move['to']} ({move['miles']} mi, £{move['cost']:,.2f})")
+        print(f"{len(plan)} trade-in(s) on {day}, {sum(1 for m in plan if m['to'] not in (None, m['from']))} to move")
+        sys.exit(0)
+
+    import random
+    cars = [{"id": f"TI{n}", "site": random.choice(SITE_NAMES)} for n in range(400)]
+    capacity = {site: random.randint(10, 40) for site in SITE_NAMES}
+    days = np.random.uniform(10, 60, size=(len(cars), len(SITE_NAMES)))
+    start = time.perf_counter()
+    plan = plan_transfers(cars, capacity, days)
+    elapsed = time.perf_counter() - start
+    moved = sum(1 for p in plan if p["to"] and p["to"] != p["from"])
+    print(f"{len(cars)} cars, {sum(capacity.values())} slots: planned in {elapsed:.2f}s, {moved} transfers")
@@ -0,0 +1,153 @@
+# market.py
+# Market statistics derived from closed sales instead of fixed tiles.
+#
+# Every closed sale is added to rolling-window aggregates at four levels of
+# detail: make/model/age band, make/model, make, and the whole market. Each
+# window holds running sums (count, days to sell, the car's share of the
+# deal price) plus a queue of contributions to subtract once they age out,
+# so recording a sale and querying a vehicle are both amortised O(1).
+# Queries fall back to the next broader level when a narrower one has too
+# few sales. One instance is shared by every session, and queries expire
+# old contributions as they go, so both recording and querying hold the
+# instance's lock.
+import datetime
+import threading
+from collections import deque
+
+import numpy as np
+
+from records import NO_TIME, now_timestamp, to_datetime
+
+DAY_US = 86_400 * 1_000_000
+
+WINDOW_DAYS = 365
+MIN_SALES = 3
+
+AGE_BANDS = ((1, "0-1 yrs"), (3, "2-3 yrs"), (6, "4-6 yrs"), (None, "7+ yrs"))
+
+def age_band(age):
+    """Label for a vehicle age in years"""
+    for limit, label in AGE_BANDS:
+        if limit is None or age <= limit:
+            return label
+
+class _Window:
+    """Running sums over one rolling window"""
+
+    __slots__ = ("events", "count", "days", "share")
+
+    def __init__(self):
+        self.events = deque()
+        self.count = 0
+        self.days = 0.0
+        self.share = 0.0
+
+    def add(self, closed_at, days, share):
+        self.events.append((closed_at, days, share))
+        self.count += 1
+        self.days += days
+        self.share += share
+
+    def expire(self, cutoff):
+        events = self.events
+        while events and events[0][0] < cutoff:
+            _, days, share = events.popleft()
+            self.count -= 1
+            self.days -= days
+            self.share -= share
+
+class MarketStats:
+    """Rolling demand, days-to-sell and vehicle share of the deal per vehicle segment"""
+
+    def __init__(self, window_days=WINDOW_DAYS, min_sales=MIN_SALES):
+        self.window_us = window_days * DAY_US
+        self.min_sales = min_sales
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def _keys(self, make, model, band):
+        return ((make, model, band), (make, model), (make,), ())
+
+    def record_sale(self, make, model, year, closed_at, days_to_sell, share):
+        """Add one closed sale (closed_at in epoch microseconds; sales must arrive in time order)"""
+        band = age_band(to_datetime(closed_at).year - year)
+        with self._lock:
+            for key in self._keys(make, model, band):
+                window = self._windows.get(key)
+                if window is None:
+                    window = self._windows[key] = _Window()
+                window.add(closed_at, days_to_sell, share)
+
+    def _window(self, key, cutoff):
+        # Called with the lock held
+        window = self._windows.get(key)
+        if window is not None:
+            window.expire(cutoff)
+        return window
+
+    def stats(self, make, model, year, now=None):
+        """Demand level, mean days to sell and vehicle share of the deal for a vehicle"""
+        now = now_timestamp() if now is None else now
+        cutoff = now - self.window_us
+        band = age_band(to_datetime(now).year - year)
+        with self._lock:
+            market = self._window((), cutoff)
+            if market is None or not market.count:
+                return None
+
+            labels = (f"{make} {model} ({band})", f"{make} {model}", make, "All makes")
+            for key, label in zip(self._keys(make, model, band), labels):
+                window = self._window(key, cutoff)
+                if window is not None and window.count >= min(self.min_sales, market.count):
+                    break
+
+            days = window.days / window.count
+            market_days = market.days / market.count
+            pace = market_days / days if days else 1.0
+            return {
+                "demand": "HIGH" if pace >= 1.15 else "MEDIUM" if pace >= 0.85 else "LOW",
+                "days_to_sell": round(days),
+                "vehicle_share_pct": round(100 * window.share / window.count),
+                "sales": window.count,
+                "basis": label,
+            }
+
+    @classmethod
+    def from_snapshot(cls, snapshot, **kwargs):
+        """Build from the closed sales in a sales snapshot"""
+        market = cls(**kwargs)
+        if snapshot is None or not len(snapshot):
+            return market
+        closed_at = np.asarray(snapshot.column("stage_times"))[:, -1]
+        deposit = np.asarray(snapshot.column("deposit_date"))
+        rows = np.flatnonzero((closed_at != NO_TIME) & (deposit != NO_TIME))
+        rows = rows[np.argsort(closed_at[rows], kind="stable")]
+        days = (closed_at[rows] - deposit[rows]) / DAY_US
+        # Vehicle share: the car's price as a share of the total the customer agreed to pay, extras included
+        total = np.asarray(snapshot.column("total_price"))[rows].astype(float)
+        price = np.asarray(snapshot.column("vehicle_price"))[rows].astype(float)
+        share = np.divide(price, total, out=np.ones_like(price), where=total > 0)
+        makes = snapshot.values("make", rows)
+        models = snapshot.values("model", rows)
+        years = snapshot.column("year")[rows].tolist()
+        for args in zip(makes, models, years, closed_at[rows].tolist(), days.tolist(), share.tolist()):
+            market.record_sale(*args)
+        return market
+
+if __name__ == "__main__":
+    import random
+    import time
+    market = MarketStats()
+    now = now_timestamp()
+    makes = [("BMW", "3 Series"), ("BMW", "X5"), ("Audi", "A4"), ("Porsche", "Macan")]
+    start = time.perf_counter()
+    for n in range(200_000):
+        make, model = random.choice(makes)
+        market.record_sale(make, model, random.randint(2015, 2024), now - (200_000 - n) * 60_000_000,
+                           random.uniform(5, 40), random.uniform(0.85, 1.0))
+    print(f"record_sale: {200_000 / (time.perf_counter() - start):,.0f}/sec")
+    start = time.perf_counter()
+    for _ in range(10_000):
+        market.stats("BMW", "3 Series", 2018, now)
+    print(f"stats: {(time.perf_counter() - start) / 10_000 * 1e6:.1f} us/query")
+    print(market.stats("BMW", "3 Series", 2018, now))
@@ -0,0 +1,137 @@
+# mileage.py
+# Odometer anomaly screening over MOT mileage histories.
+#
+# A fleet's readings are flattened into three arrays (vehicle, day, miles)
+# and sorted once, so every check below is a vectorised comparison between
+# consecutive readings of the same vehicle:
+#
+#   rollback  mileage falls by more than ROLLBACK_TOLERANCE
+#   jump      mileage rises by more than MIN_JUMP_MILES at an implausible
+#             average of over MAX_MILES_PER_DAY
+#   stale     the odometer reads the same across STUCK_DAYS or more, or the
+#             latest reading is older than STALE_DAYS
+#
+# screen() takes a list of per-vehicle histories; screen_mot_store() reads
+# every test in the local MOT store (see mot.py) in one query for the
+# nightly run: `python mileage.py [mot_history.sqlite]`.
+import datetime
+import sqlite3
+import sys
+import time
+
+import numpy as np
+
+ROLLBACK = 1
+JUMP = 2
+STALE = 4
+
+ROLLBACK_TOLERANCE = 100
+MIN_JUMP_MILES = 10_000
+MAX_MILES_PER_DAY = 200
+STUCK_DAYS = 540
+STALE_DAYS = 2 * 365 + 30
+
+def screen_arrays(vehicle, day, miles, n_vehicles, today=None):
+    """Anomaly bitmask per vehicle plus a note for each flagged vehicle
+
+    vehicle: int vehicle index per reading, day: date ordinal, miles: float
+    (NaN where the odometer was not read)
+    """
+    today = (today or datetime.date.today()).toordinal()
+    keep = ~np.isnan(miles)
+    order = np.lexsort((day[keep], vehicle[keep]))
+    vehicle, day, miles = vehicle[keep][order], day[keep][order], miles[keep][order]
+
+    same = vehicle[1:] == vehicle[:-1]
+    gained = np.diff(miles)
+    elapsed = np.diff(day)
+    codes = np.zeros(len(gained), dtype=np.uint8)
+    codes[same & (gained < -ROLLBACK_TOLERANCE)] |= ROLLBACK
+    codes[same & (gained > MIN_JUMP_MILES) & (gained > MAX_MILES_PER_DAY * np.maximum(elapsed, 1))] |= JUMP
+    codes[same & (gained == 0) & (elapsed >= STUCK_DAYS)] |= STALE
+
+    flags = np.zeros(n_vehicles, dtype=np.uint8)
+    np.bitwise_or.at(flags, vehicle[1:], codes)
+    last = np.flatnonzero(np.r_[~same, True]) if len(vehicle) else np.array([], dtype=np.int64)
+    out_of_date = last[today - day[last] > STALE_DAYS]
+    flags[vehicle[out_of_date]] |= STALE
+
+    # Notes only for the few flagged vehicles, first anomaly wins
+    notes = {}
+    for i in np.flatnonzero(codes).tolist():
+        v = int(vehicle[i + 1])
+        if v not in notes:
+            notes[v] = _describe(int(codes[i]), day[i], day[i + 1], miles[i], miles[i + 1])
+    for i in out_of_date.tolist():
+        notes.setdefault(int(vehicle[i]), f"No mileage recorded since {_iso(day[i])}")
+    return flags, notes
+
+def _iso(ordinal):
+    return datetime.date.fromordinal(int(ordinal)).isoformat()
+
+def _describe(code, day_a, day_b, miles_a, miles_b):
+    change = abs(int(miles_b - miles_a))
+    if code & ROLLBACK:
+        return f"Mileage fell by {change:,} between {_iso(day_a)} and {_iso(day_b)}"
+    if code & JUMP:
+        return f"Mileage rose by {change:,} in {int(day_b - day_a)} days ({_iso(day_a)} to {_iso(day_b)})"
+    return f"Mileage unchanged at {int(miles_b):,} from {_iso(day_a)} to {_iso(day_b)}"
+
+def _flag_dict(code, note):
+    return {
+        "mileage_anomaly": bool(code),
+        "rollback": bool(code & ROLLBACK),
+        "jump": bool(code & JUMP),
+        "stale": bool(code & STALE),
+        "note": note,
+    }
+
+def screen(histories, today=None):
+    """Screen a list of histories (each a list of {"date", "mileage"}) in one batch"""
+    vehicle, day, miles = [], [], []
+    for idx, history in enumerate(histories):
+        for reading in history:
+            if not reading.get("date"):
+                continue
+            vehicle.append(idx)
+            day.append(datetime.date.fromisoformat(reading["date"][:10]).toordinal())
+            miles.append(np.nan if reading.get("mileage") is None else reading["mileage"])
+    flags, notes = screen_arrays(np.array(vehicle, dtype=np.int64), np.array(day, dtype=np.int64),
+                                 np.array(miles, dtype=float), len(histories), today)
+    return [_flag_dict(int(code), notes.get(idx)) for idx, code in enumerate(flags.tolist())]
+
+def screen_mot_store(db_path, today=None):
+    """Flagged registrations across every vehicle in the MOT store: {reg: flags}"""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        rows = conn.execute(
+            "SELECT registration, julianday(completed) - 1721424.5, mileage FROM tests "
+            "WHERE completed IS NOT NULL").fetchall()
+    finally:
+        conn.close()
+    if not rows:
+        return {}
+    regs, days, miles = zip(*rows)
+    names, vehicle = np.unique(np.array(regs, dtype=object), return_inverse=True)
+    miles = np.array([np.nan if m is None else m for m in miles], dtype=float)
+    flags, notes = screen_arrays(vehicle.astype(np.int64), np.array(days, dtype=np.int64), miles,
+                                 len(names), today)
+    return {names[v]: _flag_dict(int(flags[v]), notes.get(int(v))) for v in np.flatnonzero(flags).tolist()}
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        start = time.perf_counter()
+        flagged = screen_mot_store(sys.argv[1])
+        print(f"{len(flagged):,} vehicles flagged in {time.perf_counter() - start:.1f}s")
+        sys.exit()
+    rng = np.random.default_rng()
+    n, tests = 500_000, 8
+    vehicle = np.repeat(np.arange(n), tests)
+    day = (datetime.date(2016, 6, 1).toordinal() + np.tile(np.arange(tests) * 365, n)
+           + rng.integers(-20, 20, n * tests))
+    miles = np.cumsum(rng.normal(8000, 2500, (n, tests)).clip(0), axis=1).ravel()
+    miles[rng.integers(0, len(miles), n // 100)] -= 20_000
+    start = time.perf_counter()
+    flags, notes = screen_arrays(vehicle, day, miles, n, datetime.date(2024, 6, 1))
+    print(f"{n:,} vehicles ({len(miles):,} readings) screened in {time.perf_counter() - start:.2f}s, "
+          f"{np.count_nonzero(flags):,} flagged")
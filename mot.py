@@ -0,0 +1,284 @@
+# mot.py
+# Local MOT history store built from the DVSA bulk downloads.
+#
+# Bulk files are stream-parsed a row at a time and written to SQLite in
+# fixed-size batches, so memory stays flat however large the dump is. Both
+# of the DVSA shapes are accepted, optionally gzip-compressed:
+#
+#   *.json / *.jsonl  one vehicle per line as returned by the MOT history API
+#                     {"registration", "make", "model", "firstUsedDate",
+#                      "motTests": [{"motTestNumber", "completedDate", "testResult",
+#                                    "expiryDate", "odometerValue", "odometerUnit",
+#                                    "defects": [{"type": "ADVISORY", ...}]}]}
+#   *.csv             one test per row with registration, test_number,
+#                     completed_date, test_result, expiry_date, odometer_value
+#                     (and optional make, model, first_used_date, advisories)
+#
+# Tests are keyed by (registration, test number) in a WITHOUT ROWID table,
+# so a vehicle's history sits together on disk and a lookup is one index
+# range scan. Monthly delta files are loaded the same way: rows upsert on
+# their key and each file is recorded so re-running a load is a no-op.
+#
+#   python mot.py load data/mot/mot-2025-09.jsonl.gz data/mot/delta-2025-10.csv
+#   python mot.py bench
+import csv
+import datetime
+import gzip
+import json
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+
+from config import DATA_DIR
+
+MOT_DB = DATA_DIR / "mot_history.sqlite"
+
+BATCH_SIZE = 10_000
+KM_PER_MILE = 1.609344
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS vehicles (
+    registration TEXT PRIMARY KEY,
+    make TEXT,
+    model TEXT,
+    first_used TEXT
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS tests (
+    registration TEXT NOT NULL,
+    test_number TEXT NOT NULL,
+    completed TEXT,
+    result TEXT,
+    mileage INTEGER,
+    expiry TEXT,
+    advisories INTEGER DEFAULT 0,
+    PRIMARY KEY (registration, test_number)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS loads (
+    source TEXT PRIMARY KEY,
+    size INTEGER,
+    loaded_at TEXT,
+    tests INTEGER
+);
+"""
+
+def normalise_registration(reg):
+    """Upper-case registration with spaces removed"""
+    return reg.upper().replace(" ", "")
+
+# ============================================================================
+# PARSING
+# ============================================================================
+
+def _open_text(path):
+    path = Path(path)
+    if path.suffix == ".gz":
+        return gzip.open(path, "rt", newline="")
+    return open(path, "r", newline="")
+
+def _result(raw, advisories):
+    """Map a DVSA result to Pass / Advisory / Fail"""
+    raw = (raw or "").upper()
+    if raw.startswith("F"):
+        return "Fail"
+    if raw.startswith("P"):
+        return "Advisory" if advisories else "Pass"
+    return raw.title() or "Unknown"
+
+def _miles(value, unit):
+    try:
+        value = int(float(value))
+    except (TypeError, ValueError):
+        return None
+    return round(value / KM_PER_MILE) if (unit or "").upper() == "KM" else value
+
+def _date(value):
+    """ISO date from either "2024-08-17..." or "2024.08.17 ..." forms"""
+    return value[:10].replace(".", "-") if value else None
+
+def parse_vehicle(vehicle):
+    """(vehicle row, test rows) from one vehicle in the MOT history API shape"""
+    reg = normalise_registration(vehicle.get("registration", ""))
+    vehicle_row = (reg, vehicle.get("make"), vehicle.get("model"), _date(vehicle.get("firstUsedDate")))
+    tests = []
+    for test in vehicle.get("motTests") or []:
+        advisories = sum(1 for d in test.get("defects") or [] if d.get("type") == "ADVISORY")
+        tests.append((
+            reg,
+            str(test.get("motTestNumber") or test.get("completedDate")),
+            _date(test.get("completedDate")),
+            _result(test.get("testResult"), advisories),
+            _miles(test.get("odometerValue"), test.get("odometerUnit")),
+            _date(test.get("expiryDate")),
+            advisories,
+        ))
+    return vehicle_row, tests
+
+def _iter_json(f):
+    for line in f:
+        line = line.strip()
+        if not line:
+            continue
+        vehicle_row, tests = parse_vehicle(json.loads(line))
+        if vehicle_row[0]:
+            yield vehicle_row, tests
+
+def _iter_csv(f):
+    for row in csv.DictReader(f):
+        reg = normalise_registration(row.get("registration", ""))
+        if not reg:
+            continue
+        advisories = int(row.get("advisories") or 0)
+        vehicle_row = (reg, row.get("make") or None, row.get("model") or None, _date(row.get("first_used_date")))
+        yield vehicle_row, [(
+            reg,
+            row.get("test_number") or row.get("completed_date"),
+            _date(row.get("completed_date")),
+            _result(row.get("test_result"), advisories),
+            _miles(row.get("odometer_value"), row.get("odometer_unit")),
+            _date(row.get("expiry_date")),
+            advisories,
+        )]
+
+def iter_records(path):
+    """Stream (vehicle row, test rows) pairs from a bulk file"""
+    name = Path(path).name.removesuffix(".gz")
+    parse = _iter_csv if name.endswith(".csv") else _iter_json
+    with _open_text(path) as f:
+        yield from parse(f)
+
+# ============================================================================
+# STORE
+# ============================================================================
+
+def connect(path=MOT_DB):
+    """Open (creating if needed) the MOT store"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    return conn
+
+def load_file(path, db_path=MOT_DB, force=False):
+    """Load a bulk or delta file; returns tests written (0 if already loaded)"""
+    path = Path(path)
+    conn = connect(db_path)
+    try:
+        size = path.stat().st_size
+        if not force and conn.execute(
+                "SELECT 1 FROM loads WHERE source = ? AND size = ?", (path.name, size)).fetchone():
+            return 0
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        written = 0
+        vehicles, tests = [], []
+
+        def flush():
+            # Keep existing make/model when a delta row leaves them blank
+            conn.executemany(
+                "INSERT INTO vehicles VALUES (?, ?, ?, ?) ON CONFLICT(registration) DO UPDATE SET "
+                "make = COALESCE(excluded.make, make), model = COALESCE(excluded.model, model), "
+                "first_used = COALESCE(excluded.first_used, first_used)", vehicles)
+            conn.executemany("INSERT OR REPLACE INTO tests VALUES (?, ?, ?, ?, ?, ?, ?)", tests)
+            vehicles.clear()
+            tests.clear()
+
+        with conn:
+            for vehicle_row, test_rows in iter_records(path):
+                vehicles.append(vehicle_row)
+                tests.extend(test_rows)
+                written += len(test_rows)
+                if len(tests) >= BATCH_SIZE:
+                    flush()
+            flush()
+            conn.execute("INSERT OR REPLACE INTO loads VALUES (?, ?, ?, ?)",
+                         (path.name, size, datetime.datetime.now().isoformat(timespec="seconds"), written))
+        return written
+    finally:
+        conn.close()
+
+class MotStore:
+    """Read side of the MOT store, one SQLite connection per thread"""
+
+    def __init__(self, path=MOT_DB):
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            self._local.conn = conn
+        return conn
+
+    def history(self, reg):
+        """MOT tests for a registration, newest first (empty if unknown)"""
+        rows = self._conn().execute(
+            "SELECT completed, result, mileage, expiry FROM tests WHERE registration = ? "
+            "ORDER BY completed DESC", (normalise_registration(reg),)).fetchall()
+        return [{"date": d, "result": r, "mileage": m, "expiry": e} for d, r, m, e in rows]
+
+def vehicle_history(vehicle):
+    """MOT tests, newest first, from an MOT history API response"""
+    _, tests = parse_vehicle(vehicle)
+    history = [{"date": t[2], "result": t[3], "mileage": t[4], "expiry": t[5]} for t in tests]
+    return sorted(history, key=lambda t: t["date"] or "", reverse=True)
+
+def next_due(history):
+    """Latest expiry date across a vehicle's tests"""
+    expiries = [t["expiry"] for t in history if t["expiry"]]
+    return max(expiries) if expiries else None
+
+def open_store(path=MOT_DB):
+    """Read-only store, or None until a bulk file has been loaded"""
+    return MotStore(path) if path.exists() else None
+
+def store_signature(path=MOT_DB):
+    """Cache key that changes whenever the store is reloaded"""
+    if not path.exists():
+        return None
+    stat = path.stat()
+    return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+# ============================================================================
+# CLI
+# ============================================================================
+
+def _bench(vehicles=200_000, lookups=10_000):
+    import random
+    import resource
+    import tempfile
+    tmp = Path(tempfile.mkdtemp())
+    source = tmp / "mot-bulk.jsonl.gz"
+    regs = [f"{random.choice('ABCDEFGHJK')}{random.choice('LMNOPRSTU')}{n % 100:02d}"
+            f"{n // 100:05d}" for n in range(vehicles)]
+    with gzip.open(source, "wt") as f:
+        for reg in regs:
+            tests = [{"motTestNumber": f"{reg}{y}", "completedDate": f"{2015 + y}-06-01T10:00:00",
+                      "testResult": random.choice(["PASSED", "PASSED", "FAILED"]),
+                      "expiryDate": f"{2016 + y}-05-31", "odometerValue": str(8000 * (y + 1)),
+                      "odometerUnit": "MI", "defects": []} for y in range(8)]
+            f.write(json.dumps({"registration": reg, "make": "BMW", "model": "3 Series",
+                                "firstUsedDate": "2014-06-01", "motTests": tests}) + "\n")
+    db = tmp / "mot.sqlite"
+    start = time.perf_counter()
+    written = load_file(source, db)
+    elapsed = time.perf_counter() - start
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"loaded {written:,} tests in {elapsed:.1f}s ({written / elapsed:,.0f}/s), peak RSS {peak_mb:.0f} MB, "
+          f"store {db.stat().st_size / 1e6:.0f} MB")
+    store = MotStore(db)
+    sample = random.sample(regs, lookups)
+    start = time.perf_counter()
+    for reg in sample:
+        store.history(reg)
+    print(f"lookup: {(time.perf_counter() - start) / lookups * 1e6:.0f} us")
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["load"]:
+        for name in sys.argv[2:]:
+            print(f"{name}: {load_file(name):,} tests")
+    elif sys.argv[1:2] == ["bench"]:
+        _bench()
+    else:
+        print("usage: python mot.py load FILE... | bench")
@@ -0,0 +1,389 @@
+# notify.py
+# Outbound email/SMS queue drained by background workers.
+#
+# enqueue() is a single SQLite insert, so a share form returns as soon as
+# the message is on disk. Each channel has a worker thread, so a slow SMTP
+# server never holds up texts; it claims due messages in batches of
+# BATCH_SIZE and hands each batch to its channel's transport: one SMTP
+# connection per email batch, one gateway request per SMS batch. Failed
+# messages are retried with exponential backoff and jitter up to
+# MAX_ATTEMPTS; an identical message (channel, recipient, subject, body)
+# queued again within DEDUP_WINDOW returns the original instead. A claim is
+# a lease: messages left "sending" for CLAIM_LEASE by a worker that died
+# are claimed again, while those held by live workers in other processes
+# sharing the outbox are left alone.
+#
+# Transports are configured from the environment:
+#   SYTNER_SMTP_HOST, SYTNER_SMTP_PORT, SYTNER_SMTP_USER, SYTNER_SMTP_PASSWORD,
+#   SYTNER_SMTP_FROM, SYTNER_SMTP_STARTTLS=1
+#   SYTNER_SMS_URL (POST {"messages": [{"to", "body"}]} -> {"results": [{"ok"}]}),
+#   SYTNER_SMS_KEY
+# A channel with no transport is written to the log and marked "logged".
+#
+# `python notify.py` runs the queue against a local SMTP sink and a fake SMS
+# gateway with injected failures and prints enqueue latency and throughput.
+import datetime
+import hashlib
+import logging
+import os
+import random
+import smtplib
+import sqlite3
+import threading
+import time
+from email.message import EmailMessage
+
+from config import DATA_DIR
+
+OUTBOX_DB = DATA_DIR / "outbox.sqlite"
+
+BATCH_SIZE = 50
+MAX_ATTEMPTS = 6
+FIRST_RETRY = 5.0
+BACKOFF_MAX = 600.0
+DEDUP_WINDOW = 600.0
+POLL_INTERVAL = 1.0
+CLAIM_LEASE = 300.0  # well beyond the slowest batch send
+
+CHANNELS = ("email", "sms")
+
+log = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    channel TEXT NOT NULL,
+    recipient TEXT NOT NULL,
+    subject TEXT,
+    body TEXT NOT NULL,
+    dedup_key TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,
+    created REAL NOT NULL,
+    sent_at REAL,
+    claimed_at REAL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS messages_due ON messages (status, next_attempt);
+CREATE INDEX IF NOT EXISTS messages_dedup ON messages (dedup_key, created);
+"""
+
+# ============================================================================
+# TRANSPORTS
+# ============================================================================
+
+class SmtpTransport:
+    """Sends a batch of emails over one SMTP connection"""
+
+    channel = "email"
+
+    def __init__(self, host, port=25, sender="noreply@sytner.co.uk", user=None, password=None,
+                 starttls=False, timeout=10):
+        self.host, self.port, self.sender = host, int(port), sender
+        self.user, self.password, self.starttls, self.timeout = user, password, starttls, timeout
+
+    def send_batch(self, messages):
+        errors = {}
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            if self.starttls:
+                smtp.starttls()
+            if self.user:
+                smtp.login(self.user, self.password)
+            for message in messages:
+                email = EmailMessage()
+                email["From"] = self.sender
+                email["To"] = message["recipient"]
+                email["Subject"] = message["subject"] or ""
+                email.set_content(message["body"])
+                try:
+                    smtp.send_message(email)
+                except smtplib.SMTPException as e:
+                    errors[message["id"]] = str(e)
+        return errors
+
+class HttpSmsTransport:
+    """Sends a batch of texts in one request to an SMS gateway"""
+
+    channel = "sms"
+
+    def __init__(self, url, api_key=None):
+        from providers import ProviderClient
+        self.client = ProviderClient("sms", url, api_key, rate=20, burst=20)
+
+    def send_batch(self, messages):
+        reply = self.client.post_json("/messages", {
+            "messages": [{"to": m["recipient"], "body": m["body"]} for m in messages],
+        }) or {}
+        results = reply.get("results") or []
+        errors = {}
+        for n, message in enumerate(messages):
+            # A message the gateway gave no result for was not confirmed sent
+            result = results[n] if n < len(results) else {"ok": False, "error": "no result from gateway"}
+            if not result.get("ok"):
+                errors[message["id"]] = result.get("error") or "rejected"
+        return errors
+
+def transports_from_env():
+    """Transports configured in the environment, keyed by channel"""
+    transports = {}
+    if os.environ.get("SYTNER_SMTP_HOST"):
+        transports["email"] = SmtpTransport(
+            os.environ["SYTNER_SMTP_HOST"], os.environ.get("SYTNER_SMTP_PORT", 25),
+            os.environ.get("SYTNER_SMTP_FROM", "noreply@sytner.co.uk"),
+            os.environ.get("SYTNER_SMTP_USER"), os.environ.get("SYTNER_SMTP_PASSWORD"),
+            os.environ.get("SYTNER_SMTP_STARTTLS") == "1")
+    if os.environ.get("SYTNER_SMS_URL"):
+        transports["sms"] = HttpSmsTransport(os.environ["SYTNER_SMS_URL"], os.environ.get("SYTNER_SMS_KEY"))
+    return transports
+
+# ============================================================================
+# OUTBOX
+# ============================================================================
+
+def _dedup_key(channel, recipient, subject, body):
+    return hashlib.sha1("\x1f".join([channel, recipient.strip().lower(), subject or "", body]).encode()).hexdigest()
+
+def backoff(attempts):
+    """Seconds before retry number `attempts`, with jitter"""
+    return min(FIRST_RETRY * 2 ** (attempts - 1), BACKOFF_MAX) * random.uniform(0.5, 1.0)
+
+class Outbox:
+    """Persistent message queue with a background delivery worker"""
+
+    def __init__(self, path=OUTBOX_DB, transports=None):
+        self.path = path
+        self.transports = transports_from_env() if transports is None else transports
+        self._local = threading.local()
+        self._wake = {channel: threading.Event() for channel in CHANNELS}
+        self._stop = threading.Event()
+        self._workers = {}
+        path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.executescript(SCHEMA)
+        if "claimed_at" not in {row["name"] for row in conn.execute("PRAGMA table_info(messages)")}:
+            conn.execute("ALTER TABLE messages ADD COLUMN claimed_at REAL")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous = NORMAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, channel, recipient, body, subject=None):
+        """Queue a message; returns its id (the original's id for a duplicate)"""
+        if channel not in CHANNELS:
+            raise ValueError(f"Unknown channel: {channel}")
+        now = time.time()
+        key = _dedup_key(channel, recipient, subject, body)
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT id FROM messages WHERE dedup_key = ? AND created > ?",
+                               (key, now - DEDUP_WINDOW)).fetchone()
+            if row is None:
+                message_id = conn.execute(
+                    "INSERT INTO messages (channel, recipient, subject, body, dedup_key, next_attempt, created) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (channel, recipient.strip(), subject, body, key, now, now)).lastrowid
+            else:
+                message_id = row["id"]
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._wake[channel].set()
+        return message_id
+
+    def status(self, message_id):
+        row = self._conn().execute("SELECT status, attempts, last_error FROM messages WHERE id = ?",
+                                   (message_id,)).fetchone()
+        return dict(row) if row else None
+
+    def counts(self):
+        """Messages by status"""
+        return dict(self._conn().execute("SELECT status, COUNT(*) FROM messages GROUP BY status").fetchall())
+
+    def _claim(self, channel):
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Due messages, plus any whose claim has outlived the lease (its worker died mid-send)
+            rows = conn.execute(
+                "SELECT * FROM messages WHERE channel = ? AND ("
+                "(status = 'pending' AND next_attempt <= ?) OR "
+                "(status = 'sending' AND (claimed_at IS NULL OR claimed_at < ?))"
+                ") ORDER BY next_attempt LIMIT ?", (channel, now, now - CLAIM_LEASE, BATCH_SIZE)).fetchall()
+            conn.executemany("UPDATE messages SET status = 'sending', claimed_at = ? WHERE id = ?",
+                             [(now, r["id"]) for r in rows])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return [dict(r) for r in rows]
+
+    def _deliver(self, channel, batch):
+        transport = self.transports.get(channel)
+        if transport is None:
+            for message in batch:
+                log.info("%s to %s (no transport configured): %s", channel, message["recipient"], message["body"][:80])
+            errors, status = {}, "logged"
+        else:
+            status = "sent"
+            try:
+                errors = transport.send_batch(batch)
+            except Exception as e:
+                errors = {m["id"]: str(e) or type(e).__name__ for m in batch}
+
+        now = time.time()
+        sent, retry, failed = [], [], []
+        for message in batch:
+            error = errors.get(message["id"])
+            attempts = message["attempts"] + 1
+            if error is None:
+                sent.append((status, attempts, now, message["id"]))
+            elif attempts >= MAX_ATTEMPTS:
+                failed.append((attempts, error, message["id"]))
+            else:
+                retry.append((attempts, now + backoff(attempts), error, message["id"]))
+        conn = self._conn()
+        conn.execute("BEGIN")
+        conn.executemany("UPDATE messages SET status = ?, attempts = ?, sent_at = ? WHERE id = ?", sent)
+        conn.executemany("UPDATE messages SET status = 'pending', attempts = ?, next_attempt = ?, last_error = ? "
+                         "WHERE id = ?", retry)
+        conn.executemany("UPDATE messages SET status = 'failed', attempts = ?, last_error = ? WHERE id = ?", failed)
+        conn.execute("COMMIT")
+        return len(sent)
+
+    def drain_once(self, channel):
+        """Deliver one batch for a channel; returns messages delivered"""
+        batch = self._claim(channel)
+        return self._deliver(channel, batch) if batch else 0
+
+    def _run(self, channel, wake):
+        while not self._stop.is_set():
+            try:
+                busy = self.drain_once(channel)
+            except Exception:
+                log.exception("outbox %s worker", channel)
+                busy = 0
+            if not busy:
+                wake.wait(POLL_INTERVAL)
+                wake.clear()
+
+    def start(self):
+        """Start one background worker per channel (idempotent)"""
+        self._stop.clear()
+        for channel in CHANNELS:
+            worker = self._workers.get(channel)
+            if worker is None or not worker.is_alive():
+                worker = threading.Thread(target=self._run, args=(channel, self._wake[channel]),
+                                          name=f"outbox-{channel}", daemon=True)
+                self._workers[channel] = worker
+                worker.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        for channel, worker in self._workers.items():
+            self._wake[channel].set()
+            worker.join()
+
+# ============================================================================
+# LOCAL TEST SERVERS
+# ============================================================================
+
+def _smtp_sink():
+    """Minimal local SMTP server that accepts and counts every message"""
+    import socketserver
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            self.wfile.write(b"220 sink ready\r\n")
+            while True:
+                line = self.rfile.readline()
+                if not line:
+                    return
+                command = line[:4].upper()
+                if command == b"DATA":
+                    self.wfile.write(b"354 end with .\r\n")
+                    while self.rfile.readline() not in (b".\r\n", b""):
+                        pass
+                    time.sleep(self.server.latency)
+                    self.server.received += 1
+                    self.wfile.write(b"250 queued\r\n")
+                elif command == b"QUIT":
+                    self.wfile.write(b"221 bye\r\n")
+                    return
+                elif command == b"EHLO":
+                    self.wfile.write(b"250 sink\r\n")
+                else:
+                    self.wfile.write(b"250 ok\r\n")
+
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    server.received, server.latency = 0, 0.0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def _sms_gateway(failure_rate=0.1, latency=0.05):
+    """Fake batch SMS gateway that rejects a share of messages"""
+    import json
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            messages = json.loads(self.rfile.read(int(self.headers["Content-Length"])))["messages"]
+            time.sleep(self.server.latency)
+            results = [{"ok": random.random() >= self.server.failure_rate} for _ in messages]
+            self.server.delivered += sum(r["ok"] for r in results)
+            body = json.dumps({"results": results}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    server.failure_rate, server.latency, server.delivered = failure_rate, latency, 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+
+    FIRST_RETRY = 0.05    # retry within the benchmark run
+    smtp = _smtp_sink()
+    sms = _sms_gateway()
+    outbox = Outbox(Path(tempfile.mkdtemp()) / "outbox.sqlite", {
+        "email": SmtpTransport("127.0.0.1", smtp.server_address[1]),
+        "sms": HttpSmsTransport(f"http://127.0.0.1:{sms.server_address[1]}"),
+    }).start()
+
+    n = 2_000
+    start = time.perf_counter()
+    for i in range(n):
+        outbox.enqueue("email", f"customer{i}@example.com", f"Track your car: T{i}", "Your tracking link")
+        outbox.enqueue("sms", f"07700{i:06d}", f"Track your car: T{i}")
+    enqueue = (time.perf_counter() - start) / (2 * n)
+    duplicate = outbox.enqueue("sms", "07700000000", "Track your car: T0")
+    while outbox.counts().get("pending", 0) + outbox.counts().get("sending", 0):
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - start
+    outbox.stop()
+    print(f"enqueue: {enqueue * 1e6:.0f} us per message (duplicate returned id {duplicate})")
+    print(f"delivered {smtp.received:,} emails and {sms.delivered:,} texts in {elapsed:.1f}s "
+          f"({(smtp.received + sms.delivered) / elapsed:,.0f}/s), status {outbox.counts()}")
@@ -0,0 +1,75 @@
+# offers.py
+# Network-wide trade-in offers computed for every site concurrently.
+#
+# Each garage's offer is the base valuation plus the bonuses that apply at
+# that site, less the cost of moving the car there from the customer's
+# site. Sites are evaluated on a shared thread pool. The aggregator waits
+# at most a fixed latency budget, ranks whichever offers came back and
+# reports the sites that timed out, so one slow site never blocks the tab.
+# `site_offer` can be swapped for a call to a site's own pricing service.
+import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from config import GARAGE_COORDS
+from logistics import TRANSPORT_COST_PER_MILE, site_distance
+
+LATENCY_BUDGET = 0.5
+
+_pool = ThreadPoolExecutor(max_workers=len(GARAGE_COORDS), thread_name_prefix="offers")
+
+def site_offer(engine, make, model, base_value, garage, customer_site, day):
+    """Offer from one site: base value + site bonuses - transport cost"""
+    bonuses = engine.bonuses(make, model, garage, day)
+    site_stock = engine.context(make, model, garage, day)["site_stock"]
+    distance = site_distance(customer_site, garage) if customer_site in GARAGE_COORDS else 0.0
+    transport = int(round(distance * TRANSPORT_COST_PER_MILE))
+    return {
+        "location": garage,
+        "offer": base_value + sum(b["amount"] for b in bonuses) - transport,
+        "bonuses": bonuses,
+        "site_stock": site_stock,
+        "distance": round(distance, 1),
+        "transport_cost": transport,
+    }
+
+def network_offers(engine, make, model, base_value, customer_site=None, day=None,
+                   budget=LATENCY_BUDGET, offer_fn=site_offer):
+    """Compute every site's offer concurrently within a latency budget"""
+    day = day or datetime.date.today()
+    futures = {
+        _pool.submit(offer_fn, engine, make, model, base_value, garage, customer_site, day): garage
+        for garage in GARAGE_COORDS
+    }
+    done, pending = wait(futures, timeout=budget)
+    for future in pending:
+        future.cancel()
+
+    offers, failed = [], []
+    for future in done:
+        try:
+            offers.append(future.result())
+        except Exception:
+            failed.append(futures[future])
+    offers.sort(key=lambda o: (-o["offer"], o["distance"]))
+    return {
+        "offers": offers,
+        "timed_out": sorted(futures[f] for f in pending),
+        "failed": sorted(failed),
+    }
+
+if __name__ == "__main__":
+    import random
+    from bonuses import BonusEngine
+
+    def slow_site(*args):
+        time.sleep(random.choice([0.01, 0.02, 0.05, 2.0]))
+        return site_offer(*args)
+
+    engine = BonusEngine()
+    start = time.perf_counter()
+    result = network_offers(engine, "BMW", "3 Series", 12_000, "Sytner BMW Coventry", offer_fn=slow_site)
+    print(f"{len(result['offers'])} offers, {len(result['timed_out'])} timed out "
+          f"in {time.perf_counter() - start:.2f}s")
+    for offer in result["offers"][:3]:
+        print(offer["location"], offer["offer"], offer["distance"])
@@ -0,0 +1,315 @@
+# providers.py
+# Shared HTTP clients for the upstream vehicle data providers.
+#
+# One client per provider lives for the whole process, so every Streamlit
+# session shares it:
+#
+#   - a requests.Session with a keep-alive connection pool
+#   - single-flight: concurrent identical requests wait on the one already in
+#     flight and share its response, so ten sessions looking up the same
+#     plate produce one upstream call
+#   - a token bucket per provider; a request that would wait longer than
+#     MAX_QUEUE_WAIT for a token fails with RateLimited instead
+#   - a circuit breaker; after FAILURE_THRESHOLD consecutive failures calls
+#     fail fast with CircuitOpen until RESET_AFTER seconds pass, then a single
+#     probe decides whether to close it again
+#
+# A provider is used only when its base URL is set in the environment
+# (e.g. SYTNER_DVSA_MOT_URL, with an optional SYTNER_DVSA_MOT_KEY sent as
+# x-api-key); otherwise the app keeps its mock data.
+# `python providers.py` exercises a client against local stub servers with
+# injected latency and failures; tests/test_providers.py checks the same
+# behaviour.
+import json
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+TIMEOUT = 5.0
+POOL_SIZE = 32
+MAX_QUEUE_WAIT = 2.0
+FAILURE_THRESHOLD = 5
+RESET_AFTER = 30.0
+
+# name: (requests per second, burst)
+PROVIDERS = {
+    "dvla_ves": (10, 20),
+    "dvsa_mot": (15, 30),
+    "dvsa_recalls": (10, 20),
+    "hpi": (5, 10),
+    "cap": (5, 10),
+}
+
+class ProviderError(Exception):
+    """An upstream provider could not answer"""
+
+class RateLimited(ProviderError):
+    """The provider's request budget is exhausted"""
+
+class CircuitOpen(ProviderError):
+    """The provider is failing and calls are short-circuited"""
+
+# ============================================================================
+# RATE LIMITING, CIRCUIT BREAKING, SINGLE-FLIGHT
+# ============================================================================
+
+class TokenBucket:
+    """Token bucket refilled at `rate` per second up to `burst` tokens"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, max_wait=MAX_QUEUE_WAIT):
+        """Take a token, sleeping for it if it arrives within max_wait"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+            if wait > max_wait:
+                raise RateLimited(f"no request budget for {wait:.1f}s")
+            # Reserve the token now so later callers queue behind this one
+            self.tokens -= 1
+        if wait:
+            time.sleep(wait)
+
+class CircuitBreaker:
+    """Closed -> open after repeated failures -> half-open single probe"""
+
+    def __init__(self, threshold=FAILURE_THRESHOLD, reset_after=RESET_AFTER):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def before(self):
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self.opened_at < self.reset_after:
+                    raise CircuitOpen("provider unavailable")
+                self.state = "half-open"
+            elif self.state == "half-open":
+                raise CircuitOpen("provider probe in progress")
+
+    def success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half-open" or self.failures >= self.threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """Collapses concurrent calls with the same key into one"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+# ============================================================================
+# CLIENT
+# ============================================================================
+
+class ProviderClient:
+    """Pooled, rate-limited, circuit-broken JSON client for one provider"""
+
+    def __init__(self, name, base_url, api_key=None, rate=10, burst=20, timeout=TIMEOUT,
+                 breaker=None):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = breaker or CircuitBreaker()
+        self.flight = SingleFlight()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if api_key:
+            self.session.headers["x-api-key"] = api_key
+
+    def _fetch(self, method, path, params, body):
+        # Take the token first so a rate-limited caller never holds the half-open probe
+        self.bucket.acquire()
+        self.breaker.before()
+        try:
+            response = self.session.request(method, self.base_url + path, params=params, json=body,
+                                            timeout=self.timeout)
+        except requests.RequestException as e:
+            self.breaker.failure()
+            raise ProviderError(f"{self.name}: {e}") from e
+        except Exception:
+            # Anything else must still resolve a half-open probe, or the breaker stays stuck
+            self.breaker.failure()
+            raise
+        if response.status_code >= 500:
+            self.breaker.failure()
+            raise ProviderError(f"{self.name}: HTTP {response.status_code}")
+        self.breaker.success()
+        if response.status_code == 429:
+            raise RateLimited(f"{self.name}: upstream rate limit")
+        if response.status_code == 404:
+            return None
+        if response.status_code >= 400:
+            raise ProviderError(f"{self.name}: HTTP {response.status_code}")
+        return response.content
+
+    def request_json(self, method, path, params=None, body=None):
+        """Decoded JSON response, or None when the provider has no record"""
+        key = (method, path, tuple(sorted((params or {}).items())), json.dumps(body, sort_keys=True))
+        content = self.flight.do(key, lambda: self._fetch(method, path, params, body))
+        # Each caller decodes its own copy, so shared responses are never mutated
+        return json.loads(content) if content else None
+
+    def get_json(self, path, params=None):
+        return self.request_json("GET", path, params=params)
+
+    def post_json(self, path, body):
+        return self.request_json("POST", path, body=body)
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_client(name):
+    """Process-wide client for a provider, or None when it is not configured"""
+    base_url = os.environ.get(f"SYTNER_{name.upper()}_URL")
+    if not base_url:
+        return None
+    with _clients_lock:
+        client = _clients.get(name)
+        if client is None or client.base_url != base_url.rstrip("/"):
+            rate, burst = PROVIDERS[name]
+            client = _clients[name] = ProviderClient(
+                name, base_url, os.environ.get(f"SYTNER_{name.upper()}_KEY"), rate, burst)
+        return client
+
+# ============================================================================
+# STUB SERVERS
+# ============================================================================
+
+def _stub_server(latency=0.0, failure_rate=0.0):
+    """Local HTTP/1.1 JSON server with injected latency and 503 failures"""
+    import random
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            self.server.requests += 1
+            self.server.peers.add(self.client_address)
+            time.sleep(self.server.latency)
+            if random.random() < self.server.failure_rate:
+                status, body = 503, b"{}"
+            else:
+                status, body = 200, json.dumps({"path": self.path}).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    server.latency, server.failure_rate = latency, failure_rate
+    server.requests, server.peers = 0, set()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+if __name__ == "__main__":
+    from concurrent.futures import ThreadPoolExecutor
+
+    # Single-flight: ten sessions, same plate, one upstream call
+    server, url = _stub_server(latency=0.2)
+    client = ProviderClient("stub", url, rate=1000, burst=1000)
+    with ThreadPoolExecutor(10) as pool:
+        results = list(pool.map(lambda _: client.get_json("/vehicles/AB12CDE"), range(10)))
+    print(f"single-flight: 10 lookups -> {server.requests} upstream request")
+
+    # Keep-alive: sequential requests reuse pooled connections
+    server.latency = 0.0
+    start = time.perf_counter()
+    for n in range(200):
+        client.get_json(f"/vehicles/P{n}")
+    print(f"keep-alive: 200 requests over {len(server.peers)} connection(s), "
+          f"{(time.perf_counter() - start) / 200 * 1000:.2f} ms each")
+
+    # Rate limit: 20 callers at once against burst 5 at 10/s; those that would
+    # queue for more than 0.3s are refused
+    bucket = TokenBucket(rate=10, burst=5)
+
+    def take(_):
+        try:
+            bucket.acquire(max_wait=0.3)
+            return True
+        except RateLimited:
+            return False
+
+    with ThreadPoolExecutor(20) as pool:
+        admitted = sum(pool.map(take, range(20)))
+    print(f"rate limit: {admitted} admitted, {20 - admitted} refused")
+
+    # Circuit breaker: a failing provider is cut off and calls fail fast
+    failing, bad_url = _stub_server(latency=0.1, failure_rate=1.0)
+    client = ProviderClient("stub", bad_url, rate=100, burst=100,
+                            breaker=CircuitBreaker(threshold=3, reset_after=0.5))
+    start = time.perf_counter()
+    outcomes = []
+    for n in range(20):
+        try:
+            client.get_json(f"/vehicles/F{n}")
+        except ProviderError as e:
+            outcomes.append(type(e).__name__)
+    print(f"circuit: {outcomes.count('ProviderError')} failures then {outcomes.count('CircuitOpen')} "
+          f"fast rejections in {time.perf_counter() - start:.2f}s ({failing.requests} upstream)")
+    failing.failure_rate = 0.0
+    time.sleep(0.6)
+    client.get_json("/vehicles/RECOVERED")
+    print(f"circuit after recovery: {client.breaker.state}")
@@ -0,0 +1,258 @@
+# recalls.py
+# Recall campaigns indexed by make/model and build-date range.
+#
+# Campaigns come from data/recalls.csv, either in the DVSA recall dataset
+# layout ("Recalls Number", "Make", "Model", "Concern", "Build Start",
+# "Build End", "VIN Start", "VIN End", ...) or with the short headers
+# recall_id, make, model, summary, build_start, build_end, vin_start, vin_end.
+# A blank model applies to every model of the make; blank dates or VINs leave
+# that side of the range open.
+#
+# Each make/model gets a static interval tree over build-date ranges: the
+# campaigns are sorted by start, the sorted array is treated as an implicit
+# balanced tree and every node stores the latest end in its subtree, so a
+# vehicle is matched in O(log n + k) and then filtered on VIN range.
+# check_stock() matches a whole stock list, querying the trees once per
+# distinct make, model and build range rather than once per vehicle.
+#
+# Completed campaigns can be listed per VIN or registration in
+# data/recall_completions.json: {"WBA8B...": ["R/2023/001"]}
+import csv
+import datetime
+import json
+
+from config import DATA_DIR
+
+RECALLS_FILE = DATA_DIR / "recalls.csv"
+COMPLETIONS_FILE = DATA_DIR / "recall_completions.json"
+
+ANY_MODEL = "*"
+OPEN_START = datetime.date.min.toordinal()
+OPEN_END = datetime.date.max.toordinal()
+
+COLUMN_ALIASES = {
+    "recall_id": ("recall_id", "Recalls Number"),
+    "make": ("make", "Make"),
+    "model": ("model", "Model"),
+    "summary": ("summary", "Concern", "Defect"),
+    "remedy": ("remedy", "Remedy"),
+    "launch_date": ("launch_date", "Launch Date"),
+    "build_start": ("build_start", "Build Start"),
+    "build_end": ("build_end", "Build End"),
+    "vin_start": ("vin_start", "VIN Start"),
+    "vin_end": ("vin_end", "VIN End"),
+}
+
+def _field(row, name):
+    for column in COLUMN_ALIASES[name]:
+        value = (row.get(column) or "").strip()
+        if value:
+            return value
+    return ""
+
+def _ordinal(value, default):
+    """Date ordinal from ISO or dd/mm/yyyy text"""
+    if not value:
+        return default
+    if "/" in value:
+        day, month, year = value.split("/")[:3]
+        return datetime.date(int(year[:4]), int(month), int(day)).toordinal()
+    return datetime.date.fromisoformat(value[:10]).toordinal()
+
+def _key(make, model):
+    return ((make or "").upper(), (model or "").upper() or ANY_MODEL)
+
+# ============================================================================
+# INTERVAL TREE
+# ============================================================================
+
+class IntervalTree:
+    """Static interval tree over closed [start, end] integer ranges"""
+
+    def __init__(self, intervals):
+        intervals = sorted(intervals, key=lambda i: i[0])
+        self.starts = [i[0] for i in intervals]
+        self.ends = [i[1] for i in intervals]
+        self.items = [i[2] for i in intervals]
+        self.max_end = [OPEN_START] * len(intervals)
+        self._build(0, len(intervals))
+
+    def __len__(self):
+        return len(self.items)
+
+    def _build(self, lo, hi):
+        if lo >= hi:
+            return OPEN_START
+        mid = (lo + hi) // 2
+        self.max_end[mid] = max(self.ends[mid], self._build(lo, mid), self._build(mid + 1, hi))
+        return self.max_end[mid]
+
+    def overlapping(self, lo, hi):
+        """Items whose range overlaps [lo, hi]"""
+        found = []
+        stack = [(0, len(self.items))]
+        while stack:
+            a, b = stack.pop()
+            if a >= b:
+                continue
+            mid = (a + b) // 2
+            if self.max_end[mid] < lo:
+                continue
+            stack.append((a, mid))
+            if self.starts[mid] <= hi:
+                if self.ends[mid] >= lo:
+                    found.append(self.items[mid])
+                stack.append((mid + 1, b))
+        return found
+
+# ============================================================================
+# RECALL INDEX
+# ============================================================================
+
+def _build_range(vehicle):
+    """Build-date range for a vehicle: its build date, or its whole model year"""
+    if vehicle.get("build_date"):
+        day = _ordinal(vehicle["build_date"], OPEN_START)
+        return day, day
+    if vehicle.get("year"):
+        year = int(vehicle["year"])
+        return datetime.date(year, 1, 1).toordinal(), datetime.date(year, 12, 31).toordinal()
+    return OPEN_START, OPEN_END
+
+def _vin_matches(recall, vin):
+    if not vin or not (recall["vin_start"] or recall["vin_end"]):
+        return True
+    return (not recall["vin_start"] or vin >= recall["vin_start"]) and \
+           (not recall["vin_end"] or vin <= recall["vin_end"])
+
+class RecallIndex:
+    """Recall campaigns with one interval tree per make/model"""
+
+    def __init__(self, campaigns, completions=None):
+        self.completions = {k.upper(): set(v) for k, v in (completions or {}).items()}
+        grouped = {}
+        for recall in campaigns:
+            interval = (recall["build_from"], recall["build_to"], recall)
+            grouped.setdefault(_key(recall["make"], recall["model"]), []).append(interval)
+        self.trees = {key: IntervalTree(intervals) for key, intervals in grouped.items()}
+
+    def __len__(self):
+        return sum(len(tree) for tree in self.trees.values())
+
+    def _entry(self, recall, ids):
+        return {
+            "id": recall["recall_id"],
+            "summary": recall["summary"],
+            "remedy": recall["remedy"],
+            "open": recall["recall_id"] not in ids,
+        }
+
+    def _completed(self, vehicle):
+        ids = set()
+        for ref in (vehicle.get("vin"), vehicle.get("reg")):
+            if ref:
+                ids |= self.completions.get(ref.upper(), set())
+        return ids
+
+    def _candidates(self, make, model, lo, hi):
+        """Campaigns for a make/model (and all models of the make) overlapping a build range"""
+        found = []
+        # dict.fromkeys: a blank model is already (make, ANY_MODEL), so look it up once
+        for key in dict.fromkeys(((make, model), (make, ANY_MODEL))):
+            tree = self.trees.get(key)
+            if tree is not None:
+                found += tree.overlapping(lo, hi)
+        return found
+
+    def _matches(self, vehicle, candidates):
+        vin = (vehicle.get("vin") or "").upper()
+        ids = self._completed(vehicle)
+        return [self._entry(r, ids) for r in candidates if _vin_matches(r, vin)]
+
+    def match(self, vehicle):
+        """Recalls affecting one vehicle ({make, model, year or build_date, vin, reg})"""
+        return self._matches(vehicle, self._candidates(*_key(vehicle.get("make"), vehicle.get("model")),
+                                                       *_build_range(vehicle)))
+
+    def check_stock(self, vehicles):
+        """Recalls for every vehicle in a stock list
+
+        Stock lists repeat the same make, model and year many times over, so
+        each distinct query goes to the trees once and only the VIN and
+        completion checks run per vehicle.
+        """
+        seen = {}
+        results = []
+        for vehicle in vehicles:
+            query = (*_key(vehicle.get("make"), vehicle.get("model")), *_build_range(vehicle))
+            candidates = seen.get(query)
+            if candidates is None:
+                candidates = seen[query] = self._candidates(*query)
+            results.append(self._matches(vehicle, candidates))
+        return results
+
+def read_campaigns(path=RECALLS_FILE):
+    """Parse recall campaigns from a CSV file"""
+    campaigns = []
+    with open(path, "r", newline="", encoding="utf-8-sig") as f:
+        for row in csv.DictReader(f):
+            campaigns.append({
+                "recall_id": _field(row, "recall_id"),
+                "make": _field(row, "make"),
+                "model": _field(row, "model"),
+                "summary": _field(row, "summary"),
+                "remedy": _field(row, "remedy"),
+                "launch_date": _field(row, "launch_date"),
+                "build_from": _ordinal(_field(row, "build_start"), OPEN_START),
+                "build_to": _ordinal(_field(row, "build_end"), OPEN_END),
+                "vin_start": _field(row, "vin_start").upper(),
+                "vin_end": _field(row, "vin_end").upper(),
+            })
+    return campaigns
+
+def load_recalls(path=RECALLS_FILE):
+    """Recall index from the recalls file, or None when there is no file"""
+    if not path.exists():
+        return None
+    completions = {}
+    if COMPLETIONS_FILE.exists():
+        with open(COMPLETIONS_FILE, "r") as f:
+            completions = json.load(f)
+    return RecallIndex(read_campaigns(path), completions)
+
+def recalls_signature(path=RECALLS_FILE):
+    """Cache key that changes whenever the recalls or completions files do"""
+    return tuple(
+        (p.stat().st_size, p.stat().st_mtime_ns) if p.exists() else None
+        for p in (path, COMPLETIONS_FILE)
+    )
+
+if __name__ == "__main__":
+    import random
+    import time
+    models = [f"MODEL {n}" for n in range(400)]
+    base = datetime.date(2005, 1, 1).toordinal()
+    campaigns = []
+    for n in range(50_000):
+        start = base + random.randint(0, 7000)
+        campaigns.append({
+            "recall_id": f"R/{n}", "make": random.choice(["BMW", "MINI", "AUDI"]),
+            "model": random.choice(models + [""]), "summary": "", "remedy": "",
+            "build_from": start, "build_to": start + random.randint(30, 700),
+            "vin_start": "", "vin_end": "",
+        })
+    start = time.perf_counter()
+    index = RecallIndex(campaigns)
+    print(f"indexed {len(index):,} campaigns in {(time.perf_counter() - start) * 1000:.0f} ms")
+    # A group's stock: a few hundred distinct make/model/years, many cars of each
+    stock = [{"make": random.choice(["BMW", "MINI"]), "model": random.choice(models[:50] + [""]),
+              "year": random.randint(2016, 2024)} for _ in range(20_000)]
+    start = time.perf_counter()
+    single = [index.match(v) for v in stock]
+    per_vehicle = time.perf_counter() - start
+    start = time.perf_counter()
+    bulk = index.check_stock(stock)
+    print(f"match: {per_vehicle * 1000:.0f} ms for {len(stock):,} vehicles one at a time, "
+          f"check_stock: {(time.perf_counter() - start) * 1000:.0f} ms")
+    assert all(sorted(r["id"] for r in a) == sorted(r["id"] for r in b) for a, b in zip(single, bulk))
+    assert all(len({r["id"] for r in found}) == len(found) for found in single)
@@ -0,0 +1,287 @@
+# records.py
+# Compact typed record model for the sales check-in data.
+#
+# Each sale in data/sales_records.json decodes into a slotted SaleRecord.
+# Categorical strings (makes, stages, salespeople, payment methods, extras)
+# are interned so every record shares one copy, the pipeline stage is held
+# as its index into SALES_STAGES and ISO timestamps are parsed once into
+# integer microseconds since the epoch.
+import datetime
+import json
+import sys
+import time
+import tracemalloc
+from array import array
+
+from config import SALES_STAGES, SALES_FILE
+
+STAGE_NAMES = tuple(stage["name"] for stage in SALES_STAGES)
+STAGE_INDEX = {name: idx for idx, name in enumerate(STAGE_NAMES)}
+
+NO_TIME = -1
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+_MICROSECOND = datetime.timedelta(microseconds=1)
+
+# ============================================================================
+# TIMESTAMPS
+# ============================================================================
+
+def parse_timestamp(value):
+    """Parse an ISO timestamp into integer microseconds since the epoch"""
+    if not value:
+        return NO_TIME
+    return (datetime.datetime.fromisoformat(value) - _EPOCH) // _MICROSECOND
+
+def format_timestamp(value):
+    """Format integer epoch microseconds back into an ISO timestamp"""
+    if value == NO_TIME:
+        return None
+    return (_EPOCH + datetime.timedelta(microseconds=value)).isoformat()
+
+def now_timestamp():
+    """Current local time as integer epoch microseconds"""
+    return (datetime.datetime.now() - _EPOCH) // _MICROSECOND
+
+def to_datetime(value):
+    """Convert integer epoch microseconds into a naive datetime"""
+    if value == NO_TIME:
+        return None
+    return _EPOCH + datetime.timedelta(microseconds=value)
+
+# ============================================================================
+# RECORD MODEL
+# ============================================================================
+
+class SaleRecord:
+    """A single sale with interned categorical fields and integer timestamps"""
+
+    __slots__ = (
+        "sale_id",
+        "customer_id", "first_name", "last_name", "email", "phone", "postcode",
+        "vin", "registration", "make", "model", "variant", "year", "base_price",
+        "color", "interior",
+        "stage", "stage_times",
+        "salesperson_id", "salesperson", "salesperson_email",
+        "vehicle_price", "extras_total", "total_price", "deposit_paid",
+        "outstanding_balance", "payment_method",
+        "demands", "extras", "notes",
+        "deposit_date", "expected_collection", "last_updated",
+        "is_active", "is_completed", "days_in_current_stage", "needs_attention",
+        "portal_link",
+    )
+
+    @property
+    def stage_name(self):
+        return STAGE_NAMES[self.stage]
+
+    @property
+    def progress_percentage(self):
+        return int((self.stage + 1) / len(STAGE_NAMES) * 100)
+
+    def entered_stage_at(self, stage=None):
+        """Epoch microseconds at which the deal entered a stage (default: current)"""
+        return self.stage_times[self.stage if stage is None else stage]
+
+    def to_dict(self):
+        """Re-encode the record in the sales_records.json schema"""
+        return {
+            "sale_id": self.sale_id,
+            "customer": {
+                "customer_id": self.customer_id,
+                "first_name": self.first_name,
+                "last_name": self.last_name,
+                "email": self.email,
+                "phone": self.phone,
+                "postcode": self.postcode,
+            },
+            "vehicle": {
+                "vin": self.vin,
+                "registration": self.registration,
+                "make": self.make,
+                "model": self.model,
+                "variant": self.variant,
+                "year": self.year,
+                "base_price": self.base_price,
+                "color": self.color,
+                "interior": self.interior,
+            },
+            "pipeline": {
+                "current_stage": self.stage_name,
+                "stage_index": self.stage,
+                "total_stages": len(STAGE_NAMES),
+                "progress_percentage": self.progress_percentage,
+                "stage_history": {
+                    name: format_timestamp(self.stage_times[idx])
+                    for idx, name in enumerate(STAGE_NAMES)
+                },
+            },
+            "salesperson": {
+                "id": self.salesperson_id,
+                "name": self.salesperson,
+                "email": self.salesperson_email,
+            },
+            "financial": {
+                "vehicle_price": self.vehicle_price,
+                "extras_total": self.extras_total,
+                "total_price": self.total_price,
+                "deposit_paid": self.deposit_paid,
+                "outstanding_balance": self.outstanding_balance,
+                "payment_method": self.payment_method,
+            },
+            "demands_and_needs": dict(self.demands),
+            "selected_extras": [{"name": name, "price": price} for name, price in self.extras],
+            "dates": {
+                "deposit_date": format_timestamp(self.deposit_date),
+                "expected_collection": format_timestamp(self.expected_collection),
+                "last_updated": format_timestamp(self.last_updated),
+            },
+            "status": {
+                "is_active": self.is_active,
+                "is_completed": self.is_completed,
+                "days_in_current_stage": self.days_in_current_stage,
+                "needs_attention": self.needs_attention,
+            },
+            "notes": list(self.notes),
+            "customer_portal_link": self.portal_link,
+        }
+
+# ============================================================================
+# DECODER
+# ============================================================================
+
+class SalesDecoder:
+    """Decode sales_records.json dicts into SaleRecords, sharing interned values"""
+
+    def __init__(self):
+        self._pairs = {}
+
+    def _shared(self, pair):
+        """Return a single shared copy of a (name, value) tuple"""
+        return self._pairs.setdefault(pair, pair)
+
+    def decode(self, raw):
+        """Decode one raw sale dict"""
+        intern = sys.intern
+        ts = parse_timestamp
+        shared = self._shared
+
+        customer = raw["customer"]
+        vehicle = raw["vehicle"]
+        pipeline = raw["pipeline"]
+        salesperson = raw["salesperson"]
+        financial = raw["financial"]
+        dates = raw["dates"]
+        status = raw["status"]
+        history = pipeline.get("stage_history") or {}
+
+        rec = SaleRecord()
+        rec.sale_id = raw["sale_id"]
+        rec.customer_id = customer.get("customer_id")
+        rec.first_name = intern(customer.get("first_name", ""))
+        rec.last_name = intern(customer.get("last_name", ""))
+        rec.email = customer.get("email")
+        rec.phone = customer.get("phone")
+        rec.postcode = customer.get("postcode")
+
+        rec.vin = vehicle.get("vin")
+        rec.registration = vehicle.get("registration")
+        rec.make = intern(vehicle.get("make", ""))
+        rec.model = intern(vehicle.get("model", ""))
+        rec.variant = intern(vehicle.get("variant", ""))
+        rec.year = vehicle.get("year")
+        rec.base_price = vehicle.get("base_price")
+        rec.color = intern(vehicle.get("color", ""))
+        rec.interior = intern(vehicle.get("interior", ""))
+
+        rec.stage = STAGE_INDEX.get(pipeline.get("current_stage"), pipeline.get("stage_index", 0))
+        rec.stage_times = array("q", [ts(history.get(name)) for name in STAGE_NAMES])
+
+        rec.salesperson_id = intern(salesperson.get("id", ""))
+        rec.salesperson = intern(salesperson.get("name", ""))
+        rec.salesperson_email = intern(salesperson.get("email", ""))
+
+        rec.vehicle_price = financial.get("vehicle_price", 0)
+        rec.extras_total = financial.get("extras_total", 0)
+        rec.total_price = financial.get("total_price", 0)
+        rec.deposit_paid = financial.get("deposit_paid", 0)
+        rec.outstanding_balance = financial.get("outstanding_balance", 0)
+        rec.payment_method = intern(financial.get("payment_method", ""))
+
+        rec.demands = tuple(
+            shared((intern(k), intern(v))) for k, v in (raw.get("demands_and_needs") or {}).items()
+        )
+        rec.extras = tuple(
+            shared((intern(e["name"]), e["price"])) for e in raw.get("selected_extras") or ()
+        )
+        rec.notes = tuple(intern(n) for n in raw.get("notes") or ())
+
+        rec.deposit_date = ts(dates.get("deposit_date"))
+        rec.expected_collection = ts(dates.get("expected_collection"))
+        rec.last_updated = ts(dates.get("last_updated"))
+
+        rec.is_active = bool(status.get("is_active"))
+        rec.is_completed = bool(status.get("is_completed"))
+        rec.days_in_current_stage = status.get("days_in_current_stage", 0)
+        rec.needs_attention = bool(status.get("needs_attention"))
+        rec.portal_link = raw.get("customer_portal_link")
+        return rec
+
+    def decode_all(self, raw_records):
+        """Decode a list of raw sale dicts"""
+        decode = self.decode
+        return [decode(raw) for raw in raw_records]
+
+def decode_sales(raw_records):
+    """Decode raw sale dicts into SaleRecords"""
+    return SalesDecoder().decode_all(raw_records)
+
+def load_sales_records(path=SALES_FILE):
+    """Load and decode the sales records file"""
+    if not path.exists():
+        return []
+    with open(path, "rb") as f:
+        return decode_sales(json.loads(f.read()))
+
+# ============================================================================
+# MEASUREMENT
+# ============================================================================
+
+def _replicated_json(path, copies):
+    """Build a JSON array text holding every record `copies` times"""
+    with open(path, "r") as f:
+        raw = json.load(f)
+    body = ",".join(json.dumps(rec) for rec in raw)
+    return "[" + ",".join([body] * copies) + "]", len(raw) * copies
+
+def _retained_bytes(fn):
+    """Bytes still allocated by fn's result once it returns"""
+    tracemalloc.start()
+    result = fn()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return retained
+
+def _elapsed(fn):
+    """Wall-clock seconds taken by fn"""
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+def measure(path=SALES_FILE, copies=200):
+    """Compare per-record memory and decode throughput against plain json.loads"""
+    text, count = _replicated_json(path, copies)
+    load_json = lambda: json.loads(text)
+    load_typed = lambda: decode_sales(json.loads(text))
+    return {
+        "records": count,
+        "json_bytes_per_record": _retained_bytes(load_json) / count,
+        "typed_bytes_per_record": _retained_bytes(load_typed) / count,
+        "json_records_per_sec": count / _elapsed(load_json),
+        "typed_records_per_sec": count / _elapsed(load_typed),
+    }
+
+if __name__ == "__main__":
+    for key, value in measure().items():
+        print(f"{key:>24}: {value:,.1f}")
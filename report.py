@@ -0,0 +1,425 @@
+# report.py
+# PDF vehicle reports (vehicle, MOT, recalls, flags, valuation) rendered on
+# a background pool and cached on disk.
+#
+# ReportService takes two callables from the app: gather(reg) returns the
+# same data the summary tabs show, and version() returns a string that
+# changes whenever that data could (the MOT store, recalls and valuation
+# signatures plus the day). A report is cached as
+# data/reports/<REG>-<version hash>.pdf, so a repeat download is a file read,
+# and a reload of any source data quietly invalidates every report built
+# from it. Requests for a report already being rendered share its future,
+# so a double click or two sessions on the same car render it once.
+#
+# The summary page submits its car when it opens, which means the PDF is
+# usually ready before anyone asks for it. batch() and bundle() render a
+# fleet list on the same pool and zip the results.
+#
+# The PDFs are written by PdfDocument below: A4 pages, the standard
+# Helvetica fonts, text, rules and tables, with no third-party dependency.
+# `python report.py` benchmarks rendering, the pool and the cache.
+import datetime
+import hashlib
+import threading
+import zipfile
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+
+from config import DATA_DIR
+from mot import normalise_registration
+
+REPORTS_DIR = DATA_DIR / "reports"
+REPORT_WORKERS = 4
+MAX_CACHED_REPORTS = 2000
+
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842  # A4 in points
+MARGIN = 50
+NAVY = (0.043, 0.231, 0.435)
+GREY = (0.4, 0.4, 0.4)
+SHADE = (0.93, 0.94, 0.96)
+
+# ============================================================================
+# PDF WRITER
+# ============================================================================
+
+def _pdf_text(text):
+    """Literal string bytes in WinAnsi (so £ survives), with PDF escapes"""
+    data = str(text).encode("cp1252", "replace")
+    return b"(" + data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+def _fit(text, width, size):
+    """Text cut to roughly fit `width` points (Helvetica averages about half an em per character)"""
+    text = str(text)
+    limit = max(1, int(width / (size * 0.52)))
+    return text if len(text) <= limit else text[:limit - 1] + "..."
+
+def _wrap(text, width, size):
+    limit = max(1, int(width / (size * 0.52)))
+    lines, line = [], ""
+    for word in str(text).split():
+        if line and len(line) + 1 + len(word) > limit:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}" if line else word
+    return lines + [line] if line else lines
+
+class PdfDocument:
+    """Just enough PDF for text reports: A4 pages, Helvetica, rules and shaded table headers"""
+
+    def __init__(self, title="", footer=""):
+        self.title = title
+        self.footer = footer
+        self.pages = []
+        self.y = 0
+        self.new_page()
+
+    def new_page(self):
+        self._ops = []
+        self.pages.append(self._ops)
+        self.y = PAGE_HEIGHT - MARGIN
+
+    def _room(self, height):
+        if self.y - height < MARGIN + 20:
+            self.new_page()
+
+    def _text_at(self, x, y, text, size=10, bold=False, color=(0, 0, 0), ops=None):
+        (ops if ops is not None else self._ops).append(
+            b"%.3f %.3f %.3f rg BT /%s %d Tf %.1f %.1f Td " % (*color, b"F2" if bold else b"F1", size, x, y)
+            + _pdf_text(text) + b" Tj ET")
+
+    def _rect(self, x, y, width, height, color):
+        self._ops.append(b"%.3f %.3f %.3f rg %.1f %.1f %.1f %.1f re f" % (*color, x, y, width, height))
+
+    def _rule(self, y, color=GREY):
+        self._ops.append(b"%.3f %.3f %.3f RG 0.5 w %.1f %.1f m %.1f %.1f l S"
+                         % (*color, MARGIN, y, PAGE_WIDTH - MARGIN, y))
+
+    # Flowing content, top to bottom
+
+    def title_block(self, title, subtitle=""):
+        self._text_at(MARGIN, self.y - 22, title, size=22, bold=True, color=NAVY)
+        self.y -= 30
+        if subtitle:
+            self._text_at(MARGIN, self.y - 12, subtitle, size=10, color=GREY)
+            self.y -= 18
+        self._rule(self.y - 4, NAVY)
+        self.y -= 14
+
+    def heading(self, text):
+        self._room(40)
+        self.y -= 14
+        self._text_at(MARGIN, self.y - 14, text, size=14, bold=True, color=NAVY)
+        self.y -= 20
+        self._rule(self.y)
+        self.y -= 8
+
+    def paragraph(self, text, size=10, color=(0, 0, 0)):
+        for line in _wrap(text, PAGE_WIDTH - 2 * MARGIN, size):
+            self._room(size * 1.5)
+            self._text_at(MARGIN, self.y - size, line, size=size, color=color)
+            self.y -= size * 1.5
+
+    def fields(self, pairs, label_width=140):
+        """Label/value rows"""
+        for label, value in pairs:
+            self._room(15)
+            self._text_at(MARGIN, self.y - 10, label, size=10, bold=True)
+            self._text_at(MARGIN + label_width, self.y - 10,
+                          _fit(value, PAGE_WIDTH - 2 * MARGIN - label_width, 10), size=10)
+            self.y -= 15
+
+    def table(self, headers, rows, widths):
+        """Rows under a shaded header, repeated on each new page"""
+        def header():
+            self._rect(MARGIN, self.y - 16, PAGE_WIDTH - 2 * MARGIN, 16, SHADE)
+            x = MARGIN + 4
+            for text, width in zip(headers, widths):
+                self._text_at(x, self.y - 12, _fit(text, width - 8, 9), size=9, bold=True)
+                x += width
+            self.y -= 18
+
+        self._room(34)
+        header()
+        for row in rows:
+            if self.y - 14 < MARGIN + 20:
+                self.new_page()
+                header()
+            x = MARGIN + 4
+            for text, width in zip(row, widths):
+                self._text_at(x, self.y - 11, _fit(text, width - 8, 9), size=9)
+                x += width
+            self.y -= 14
+
+    def render(self):
+        """The finished document as bytes"""
+        objects = [
+            b"<< /Type /Catalog /Pages 2 0 R >>",
+            None,  # page tree, once the page objects are numbered
+            b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+            b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>",
+            b"<< /Title " + _pdf_text(self.title) + b" /Producer (TradeSnap) >>",
+        ]
+        kids = []
+        for number, ops in enumerate(self.pages, 1):
+            footer = []
+            self._text_at(MARGIN, MARGIN - 20, self.footer, size=8, color=GREY, ops=footer)
+            self._text_at(PAGE_WIDTH - MARGIN - 60, MARGIN - 20, f"Page {number} of {len(self.pages)}",
+                          size=8, color=GREY, ops=footer)
+            stream = zlib.compress(b"\n".join(ops + footer))
+            objects.append(b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(stream) + stream
+                           + b"\nendstream")
+            kids.append(len(objects) + 1)
+            objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Contents %d 0 R "
+                           b"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> >>"
+                           % (PAGE_WIDTH, PAGE_HEIGHT, len(objects)))
+        objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+            b" ".join(b"%d 0 R" % kid for kid in kids), len(kids))
+
+        out = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        offsets = []
+        for number, body in enumerate(objects, 1):
+            offsets.append(len(out))
+            out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+        xref = len(out)
+        out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+        out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+        out += b"trailer\n<< /Size %d /Root 1 0 R /Info 5 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+            len(objects) + 1, xref)
+        return bytes(out)
+
+# ============================================================================
+# VEHICLE REPORT
+# ============================================================================
+
+def _money(value):
+    return f"£{value:,}" if value is not None else "-"
+
+def vehicle_report(registration, data, generated=None):
+    """PDF bytes for one car from the summary data:
+
+    {"vehicle", "mot_tax", "recalls", "history_flags", "valuation"} as the
+    summary page builds them, plus an optional "market" stats dict.
+    """
+    generated = generated or datetime.datetime.now()
+    vehicle, mot_tax = data["vehicle"], data["mot_tax"]
+    flags, valuation = data["history_flags"], data["valuation"]
+    doc = PdfDocument(title=f"Vehicle report {registration}",
+                      footer=f"Sytner TradeSnap - generated {generated:%d %b %Y %H:%M}")
+    doc.title_block(f"Vehicle Report - {registration}",
+                    f"{vehicle['year']} {vehicle['make']} {vehicle['model']}")
+
+    doc.heading("Vehicle")
+    doc.fields([
+        ("Registration", registration),
+        ("Make & Model", f"{vehicle['make']} {vehicle['model']}"),
+        ("Year", vehicle["year"]),
+        ("Mileage", f"{vehicle['mileage']:,} miles" if vehicle.get("mileage") is not None else "-"),
+        ("VIN", vehicle.get("vin") or "-"),
+    ])
+
+    doc.heading("Status Flags")
+    open_recalls = sum(1 for r in data["recalls"] if r["open"])
+    doc.fields([
+        ("Write-off", "Yes" if flags.get("write_off") else "No"),
+        ("Theft record", "Yes" if flags.get("theft") else "No"),
+        ("Mileage anomaly", "Yes" if flags.get("mileage_anomaly") else "No"),
+        ("Open recalls", open_recalls),
+    ])
+    if flags.get("note"):
+        doc.paragraph(flags["note"], size=9, color=GREY)
+
+    doc.heading("Trade-In Valuation")
+    band = (f"{_money(valuation['low'])} - {_money(valuation['high'])}"
+            if valuation.get("low") is not None else "Formula estimate (no comparable sales)")
+    doc.fields([
+        ("Estimated value", _money(valuation["value"])),
+        ("Range", band),
+        ("Comparable sales", valuation.get("comparables") or 0),
+    ])
+    market = data.get("market")
+    if market:
+        doc.fields([
+            ("Demand", market["demand"]),
+            ("Days to sell", market["days_to_sell"]),
+            ("Vehicle share", f"{market['vehicle_share_pct']}% of deal price"),
+        ])
+
+    doc.heading("MOT & Tax")
+    doc.fields([("Next MOT due", mot_tax["mot_next_due"]), ("Tax expiry", mot_tax["tax_expiry"])])
+    if mot_tax["mot_history"]:
+        doc.y -= 6
+        doc.table(["Test date", "Result", "Mileage"],
+                  [(t["date"], t["result"], f"{t['mileage']:,}" if t.get("mileage") is not None else "Not recorded")
+                   for t in mot_tax["mot_history"]],
+                  [130, 130, 235])
+    else:
+        doc.paragraph("No MOT tests on record.", size=9, color=GREY)
+
+    doc.heading("Safety Recalls")
+    if data["recalls"]:
+        doc.table(["Recall", "Summary", "Status"],
+                  [(r["id"], r["summary"], "Open" if r["open"] else "Completed") for r in data["recalls"]],
+                  [95, 330, 70])
+    else:
+        doc.paragraph("No recalls found for this vehicle.", size=9, color=GREY)
+    return doc.render()
+
+# ============================================================================
+# SERVICE
+# ============================================================================
+
+class ReportService:
+    """Background report rendering with an on-disk cache keyed by (registration, data version)"""
+
+    def __init__(self, gather, version, directory=REPORTS_DIR, workers=REPORT_WORKERS,
+                 max_files=MAX_CACHED_REPORTS, initializer=None):
+        self.gather = gather
+        self.version = version
+        self.directory = directory
+        self.max_files = max_files
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="report", initializer=initializer)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._written = 0
+
+    def _key(self, registration):
+        version = hashlib.blake2b(str(self.version()).encode(), digest_size=6).hexdigest()
+        return normalise_registration(registration), version
+
+    def _path(self, key):
+        return self.directory / f"{key[0]}-{key[1]}.pdf"
+
+    def cached(self, registration):
+        """Report bytes if already rendered for the current data, else None"""
+        try:
+            return self._path(self._key(registration)).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def submit(self, registration, data=None):
+        """Future for a report's bytes; resolved at once when cached
+
+        `data` is the report's data when the caller has already looked it
+        up (the summary page has), saving gather() fetching it again.
+        """
+        key = self._key(registration)
+        path = self._path(key)
+        with self._lock:
+            future = self._pending.get(key)
+            if future is None and not path.exists():
+                future = self._pending[key] = self._pool.submit(self._render, key, data)
+        if future is None:
+            future = Future()
+            try:
+                future.set_result(path.read_bytes())
+            except FileNotFoundError:
+                # Evicted between the check and the read
+                return self.submit(registration, data)
+        return future
+
+    def report(self, registration, timeout=None):
+        """Report bytes, waiting for the render if needed"""
+        return self.submit(registration).result(timeout)
+
+    def _render(self, key, data=None):
+        try:
+            registration = key[0]
+            pdf = vehicle_report(registration, data or self.gather(registration))
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp = self.directory / f".{key[0]}-{key[1]}.{threading.get_ident()}.tmp"
+            tmp.write_bytes(pdf)
+            tmp.replace(self._path(key))
+            with self._lock:
+                self._written += 1
+                prune = self._written % 100 == 0
+            if prune:
+                self.evict()
+            return pdf
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def evict(self):
+        """Drop the oldest cached reports beyond max_files; returns how many"""
+        reports = sorted(self.directory.glob("*.pdf"), key=lambda p: p.stat().st_mtime)
+        stale = reports[:max(0, len(reports) - self.max_files)]
+        for path in stale:
+            path.unlink(missing_ok=True)
+        return len(stale)
+
+    def batch(self, registrations):
+        """Yield (index, registration, pdf or None, error or None) as reports complete"""
+        futures = {self.submit(reg): (idx, reg) for idx, reg in enumerate(registrations)}
+        for future in as_completed(futures):
+            idx, reg = futures[future]
+            try:
+                yield idx, reg, future.result(), None
+            except Exception as e:
+                yield idx, reg, None, str(e) or type(e).__name__
+
+    def bundle(self, registrations, out):
+        """Zip every report into a binary file object; returns {registration: error} for failures"""
+        failed = {}
+        # PDF content streams are already deflated, so the archive only stores them
+        with zipfile.ZipFile(out, "w", zipfile.ZIP_STORED) as archive:
+            for _, reg, pdf, error in self.batch(registrations):
+                if pdf is None:
+                    failed[reg] = error
+                else:
+                    archive.writestr(f"{normalise_registration(reg)}.pdf", pdf)
+        return failed
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+if __name__ == "__main__":
+    import io
+    import re
+    import tempfile
+    import time
+    from pathlib import Path
+
+    def gather(reg):
+        # Provider lookups dominate a real report; stand in for them with a short wait
+        time.sleep(0.05)
+        return {
+            "vehicle": {"make": "BMW", "model": "3 Series", "year": 2018, "mileage": 54_000, "vin": "WBA8B" + reg},
+            "mot_tax": {"mot_next_due": "2026-03-01", "tax_expiry": "2026-01-01",
+                        "mot_history": [{"date": f"{2024 - n}-08-17", "result": "Pass", "mileage": 52_000 - n * 6000}
+                                        for n in range(60)]},
+            "recalls": [{"id": "R-2023-001", "summary": "Airbag inflator recall (replace module)", "open": True}],
+            "history_flags": {"write_off": False, "theft": False, "mileage_anomaly": False, "note": None},
+            "valuation": {"value": 14_250, "low": 13_100, "high": 15_400, "comparables": 38},
+        }
+
+    data = gather("AB12CDE")
+    pdf = vehicle_report("AB12CDE", data)
+    # Every xref offset must land on its object
+    xref = int(pdf.rsplit(b"startxref\n", 1)[1].split()[0])
+    entries = re.findall(rb"(\d{10}) 00000 n", pdf[xref:])
+    assert all(pdf[int(o):].startswith(b"%d 0 obj" % n) for n, o in enumerate(entries, 1))
+    start = time.perf_counter()
+    for _ in range(200):
+        vehicle_report("AB12CDE", data)
+    print(f"render: {(time.perf_counter() - start) / 200 * 1000:.1f} ms per report, "
+          f"{len(pdf) / 1000:.1f} KB, {pdf.count(b'/Type /Page ')} pages")
+
+    regs = [f"FL{n:03d}ABC" for n in range(200)]
+    tmp = Path(tempfile.mkdtemp())
+    service = ReportService(gather, lambda: "v1", directory=tmp, workers=8)
+    start = time.perf_counter()
+    failed = service.bundle(regs, io.BytesIO())
+    print(f"fleet of {len(regs)}: {time.perf_counter() - start:.2f}s on 8 workers "
+          f"(sequential ~{len(regs) * 0.05 + len(regs) * 0.005:.0f}s), {len(failed)} failed")
+
+    start = time.perf_counter()
+    for reg in regs:
+        service.report(reg)
+    print(f"cached repeat: {(time.perf_counter() - start) / len(regs) * 1000:.2f} ms per report")
+
+    same = [service.submit("NEW1ABC") for _ in range(10)]
+    assert len({id(f) for f in same}) == 1
+    service.version = lambda: "v2"
+    assert service.cached(regs[0]) is None
+    service.shutdown()
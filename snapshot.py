@@ -0,0 +1,242 @@
+# snapshot.py
+# Columnar binary snapshots of the sales and journey JSON files.
+#
+# The JSON files stay the source of truth. Each snapshot generation is a
+# directory of NumPy .npy columns plus one shared string dictionary; string
+# columns are stored as int32 codes into that dictionary. Readers map the
+# columns read-only, so a cold start touches almost no Python objects and
+# every worker process shares the same pages through the OS page cache.
+# A generation is keyed by the source file's size and mtime (plus the column
+# layout version) and is rebuilt automatically the first time a reader sees
+# the source change.
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from config import DATA_DIR, SALES_FILE, JOURNEYS_FILE
+from records import STAGE_NAMES, NO_TIME, load_sales_records, parse_timestamp
+
+SNAPSHOT_DIR = DATA_DIR / ".snapshot"
+
+# Bump when the column layout changes so older generations are rebuilt
+SNAPSHOT_VERSION = 2
+
+_open_snapshots = {}
+
+# ============================================================================
+# WRITER
+# ============================================================================
+
+def source_signature(source):
+    """Identify a version of a source file by size and modification time"""
+    stat = source.stat()
+    return f"v{SNAPSHOT_VERSION}-{stat.st_size}-{stat.st_mtime_ns}"
+
+def _encode_column(values, strings, string_codes):
+    """Encode a list of python values as a numpy array, returning (kind, array)"""
+    sample = next((v for v in values if v is not None), None)
+    if isinstance(sample, str) or sample is None:
+        codes = np.empty(len(values), dtype=np.int32)
+        for idx, value in enumerate(values):
+            if value is None:
+                codes[idx] = -1
+                continue
+            code = string_codes.get(value)
+            if code is None:
+                code = string_codes[value] = len(strings)
+                strings.append(value)
+            codes[idx] = code
+        return "str", codes
+    if isinstance(sample, bool):
+        return "bool", np.asarray(values, dtype=np.bool_)
+    if isinstance(sample, float):
+        return "float", np.asarray([np.nan if v is None else v for v in values], dtype=np.float64)
+    if isinstance(sample, int):
+        return "int", np.asarray([NO_TIME if v is None else v for v in values], dtype=np.int64)
+    return "int", np.asarray(values, dtype=np.int64)
+
+def write_snapshot(name, source, columns, signature):
+    """Write a snapshot generation for `source` from a dict of column lists
+
+    `signature` is the source's signature taken before `columns` were read
+    from it, so a rewrite in between leaves the snapshot stale, not mislabelled.
+    """
+    root = SNAPSHOT_DIR / name
+    root.mkdir(parents=True, exist_ok=True)
+    generation = root / signature
+    if generation.exists():
+        return generation
+
+    tmp = Path(tempfile.mkdtemp(prefix=".build-", dir=root))
+    strings, string_codes, schema = [], {}, {}
+    rows = 0
+    for column, values in columns.items():
+        kind, array = _encode_column(values, strings, string_codes)
+        np.save(tmp / f"{column}.npy", array)
+        schema[column] = kind
+        rows = len(array)
+    with open(tmp / "strings.json", "w") as f:
+        json.dump(strings, f)
+    with open(tmp / "manifest.json", "w") as f:
+        json.dump({"source": str(source), "signature": signature, "rows": rows, "columns": schema}, f)
+
+    try:
+        os.rename(tmp, generation)
+    except OSError:
+        # Another process published the same generation first
+        shutil.rmtree(tmp, ignore_errors=True)
+    _prune(root, keep=generation.name)
+    return generation
+
+def _prune(root, keep):
+    """Remove superseded generations (open maps keep their pages until closed)"""
+    for entry in root.iterdir():
+        if entry.name != keep and not entry.name.startswith(".build-"):
+            shutil.rmtree(entry, ignore_errors=True)
+
+# ============================================================================
+# READER
+# ============================================================================
+
+class Snapshot:
+    """Read-only view over one snapshot generation"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(directory / "manifest.json", "r") as f:
+            manifest = json.load(f)
+        with open(directory / "strings.json", "r") as f:
+            self.strings = json.load(f)
+        self.signature = manifest["signature"]
+        self.rows = manifest["rows"]
+        self.schema = manifest["columns"]
+        self._columns = {}
+
+    def __len__(self):
+        return self.rows
+
+    def column(self, name):
+        """Return the memory-mapped array for a column"""
+        array = self._columns.get(name)
+        if array is None:
+            array = self._columns[name] = np.load(self.directory / f"{name}.npy", mmap_mode="r")
+        return array
+
+    def values(self, name, rows=None):
+        """Return decoded python values for a column, optionally for selected rows"""
+        array = self.column(name)
+        if rows is not None:
+            array = array[rows]
+        if self.schema[name] == "str":
+            strings = self.strings
+            return [strings[code] if code >= 0 else None for code in array.tolist()]
+        return array.tolist()
+
+    def row(self, idx):
+        """Return one row as a flat dict of python values"""
+        out = {}
+        for name, kind in self.schema.items():
+            value = self.column(name)[idx]
+            if kind == "str":
+                out[name] = self.strings[value] if value >= 0 else None
+            else:
+                out[name] = value.tolist()
+        return out
+
+def open_snapshot(name, source, build):
+    """Open the current snapshot for `source`, rebuilding it with `build` if stale"""
+    if not source.exists():
+        return None
+    signature = source_signature(source)
+    cached = _open_snapshots.get(name)
+    if cached is not None and cached.signature == signature:
+        return cached
+    generation = SNAPSHOT_DIR / name / signature
+    if not (generation / "manifest.json").exists():
+        generation = write_snapshot(name, source, build(source), signature)
+    snapshot = _open_snapshots[name] = Snapshot(generation)
+    return snapshot
+
+# ============================================================================
+# SALES AND JOURNEY SNAPSHOTS
+# ============================================================================
+
+def sales_columns(source=SALES_FILE):
+    """Flatten decoded sales records into snapshot columns"""
+    records = load_sales_records(source)
+    return {
+        "sale_id": [r.sale_id for r in records],
+        "first_name": [r.first_name for r in records],
+        "last_name": [r.last_name for r in records],
+        "registration": [r.registration for r in records],
+        "vin": [r.vin for r in records],
+        "make": [r.make for r in records],
+        "model": [r.model for r in records],
+        "variant": [r.variant for r in records],
+        "year": [r.year for r in records],
+        "base_price": [r.base_price for r in records],
+        "stage": [r.stage for r in records],
+        "stage_times": [list(r.stage_times) for r in records],
+        "salesperson": [r.salesperson for r in records],
+        "payment_method": [r.payment_method for r in records],
+        "vehicle_price": [r.vehicle_price for r in records],
+        "total_price": [r.total_price for r in records],
+        "deposit_paid": [r.deposit_paid for r in records],
+        "outstanding_balance": [r.outstanding_balance for r in records],
+        "deposit_date": [r.deposit_date for r in records],
+        "expected_collection": [r.expected_collection for r in records],
+        "last_updated": [r.last_updated for r in records],
+        "is_active": [r.is_active for r in records],
+        "is_completed": [r.is_completed for r in records],
+        "days_in_current_stage": [r.days_in_current_stage for r in records],
+        "needs_attention": [r.needs_attention for r in records],
+    }
+
+def journey_fields(journey):
+    """Snapshot column values for one customer journey"""
+    vehicle = journey.get("vehicle") or {}
+    return {
+        "tracking_id": journey.get("tracking_id"),
+        "created_date": parse_timestamp(journey.get("created_date")),
+        "customer_name": (journey.get("customer") or {}).get("name"),
+        "registration": vehicle.get("reg"),
+        "vin": vehicle.get("vin"),
+        "make": vehicle.get("make"),
+        "model": vehicle.get("model"),
+        "year": vehicle.get("year", 0),
+        "garage": journey.get("garage"),
+        "salesperson": journey.get("salesperson"),
+        "current_stage": journey.get("current_stage", 0),
+        "stage_times": [parse_timestamp((journey.get("stage_history") or {}).get(name)) for name in STAGE_NAMES],
+        "collection_date": parse_timestamp(journey.get("collection_date")),
+        "deposit": (journey.get("financial") or {}).get("deposit", 0),
+        "trade_in_value": (journey.get("financial") or {}).get("trade_in_value", 0),
+    }
+
+def journey_columns(source=JOURNEYS_FILE):
+    """Flatten customer journeys into snapshot columns"""
+    with open(source, "rb") as f:
+        rows = [journey_fields(j) for j in json.loads(f.read())]
+    return {name: [row[name] for row in rows] for name in journey_fields({})}
+
+def sales_snapshot():
+    """Open the sales snapshot, rebuilding it if sales_records.json changed"""
+    return open_snapshot("sales", SALES_FILE, sales_columns)
+
+def journeys_snapshot():
+    """Open the journeys snapshot, rebuilding it if customer_journeys.json changed"""
+    return open_snapshot("journeys", JOURNEYS_FILE, journey_columns)
+
+if __name__ == "__main__":
+    import time
+    start = time.perf_counter()
+    snap = sales_snapshot()
+    print(f"sales snapshot: {len(snap)} rows in {snap.directory} ({time.perf_counter() - start:.4f}s)")
+    _open_snapshots.clear()
+    start = time.perf_counter()
+    snap = sales_snapshot()
+    print(f"warm open: {time.perf_counter() - start:.6f}s")
@@ -0,0 +1,145 @@
+# stock.py
+# Upgrade recommender over the group's available stock.
+#
+# Stock units are held as NumPy columns sorted by price, so the affordable
+# price range for a trade-in value and monthly budget is found with two
+# binary searches. Body type and distance from the customer's site are then
+# applied as vectorised masks over that slice, and the best-covered units
+# are picked with a partial sort. Results are cached per (trade-in value
+# band, garage, budget, body type).
+#
+# Stock comes from data/stock_units.json, a list of units such as:
+#   {"stock_id": "STK1", "make": "BMW", "model": "X3", "variant": "xDrive20d M Sport",
+#    "year": 2023, "price": 48000, "body_type": "SUV", "garage": "Sytner BMW Luton",
+#    "arrived": "2025-11-02"}
+# Without that file the three showroom defaults below are offered network-wide.
+import datetime
+import json
+from functools import lru_cache
+
+import numpy as np
+
+from config import DATA_DIR
+from finance import max_financed
+from logistics import SITE_DISTANCES, SITE_INDEX, SITE_NAMES
+
+STOCK_FILE = DATA_DIR / "stock_units.json"
+
+VALUE_BAND = 1000
+
+DEFAULT_STOCK = [
+    {"stock_id": "DEFAULT-1", "make": "BMW", "model": "3 Series", "variant": "320d M Sport",
+     "year": 2023, "price": 38000, "body_type": "Saloon", "garage": None},
+    {"stock_id": "DEFAULT-2", "make": "BMW", "model": "X3", "variant": "xDrive20d M Sport",
+     "year": 2023, "price": 48000, "body_type": "SUV", "garage": None},
+    {"stock_id": "DEFAULT-3", "make": "BMW", "model": "5 Series", "variant": "530e M Sport",
+     "year": 2024, "price": 52000, "body_type": "Saloon", "garage": None},
+]
+
+def affordable_price(trade_in_value, monthly_budget):
+    """Highest vehicle price a trade-in plus monthly budget covers on standard HP"""
+    return trade_in_value + max_financed(monthly_budget)
+
+class StockIndex:
+    """Price-sorted stock columns with body type and site lookups"""
+
+    def __init__(self, units):
+        units = sorted(units, key=lambda u: u["price"])
+        self.units = units
+        self.prices = np.array([u["price"] for u in units], dtype=np.int64)
+        self.body_types = sorted({u.get("body_type") or "Other" for u in units})
+        body_codes = {body: idx for idx, body in enumerate(self.body_types)}
+        self.body = np.array([body_codes[u.get("body_type") or "Other"] for u in units], dtype=np.int16)
+        # -1 marks units that can be supplied to any site
+        self.site = np.array([SITE_INDEX.get(u.get("garage"), -1) for u in units], dtype=np.int16)
+        self.distances = SITE_DISTANCES
+        self.recommend = lru_cache(maxsize=4096)(self._recommend)
+        self._site_stock = {}
+        for unit in units:
+            if unit.get("garage"):
+                key = (unit["make"], unit["model"], unit["garage"])
+                self._site_stock.setdefault(key, []).append(unit.get("arrived"))
+
+    def __len__(self):
+        return len(self.units)
+
+    def site_stock(self, make, model, garage, today=None):
+        """(units in stock, days the oldest has been in stock) for a model at one site"""
+        arrivals = self._site_stock.get((make, model, garage), [])
+        dated = [a for a in arrivals if a]
+        if not dated:
+            return len(arrivals), None
+        today = today or datetime.date.today()
+        return len(arrivals), (today - datetime.date.fromisoformat(min(dated)[:10])).days
+
+    def _recommend(self, value_band, garage, monthly_budget, body_type, max_miles, limit):
+        trade_in_value = value_band * VALUE_BAND
+        ceiling = affordable_price(trade_in_value, monthly_budget)
+        lo = int(np.searchsorted(self.prices, trade_in_value, side="right"))
+        hi = int(np.searchsorted(self.prices, ceiling, side="right"))
+
+        site = SITE_INDEX.get(garage)
+        sites = self.site
+        if site is None:
+            miles = np.zeros(len(sites))
+        else:
+            miles = np.where(sites >= 0, self.distances[site][np.maximum(sites, 0)], 0.0)
+        mask = np.ones(len(self.prices), dtype=bool)
+        if body_type is not None:
+            mask &= self.body == (self.body_types.index(body_type) if body_type in self.body_types else -1)
+        if max_miles is not None:
+            mask &= miles <= max_miles
+
+        picks = []
+        within = lo + np.flatnonzero(mask[lo:hi])
+        if len(within):
+            # Best coverage = cheapest; break ties by distance
+            order = np.lexsort((miles[within], self.prices[within]))[:limit]
+            picks += [(int(i), False) for i in within[order]]
+        if len(picks) < limit:
+            # Fill with the nearest-priced units just above budget
+            above = hi + np.flatnonzero(mask[hi:])[: limit - len(picks)]
+            picks += [(int(i), True) for i in above]
+        return tuple(
+            {**self.units[i], "distance": round(float(miles[i]), 1), "over_budget": over}
+            for i, over in picks
+        )
+
+    def recommend_for(self, trade_in_value, monthly_budget, garage=None, body_type=None,
+                      max_miles=None, limit=3):
+        """Best-covered upgrade options for a trade-in value and monthly budget"""
+        return self.recommend(int(trade_in_value) // VALUE_BAND, garage, int(monthly_budget),
+                              body_type, max_miles, limit)
+
+def load_stock(path=STOCK_FILE):
+    """Build a stock index from the stock file, or the showroom defaults"""
+    if path.exists():
+        with open(path, "r") as f:
+            return StockIndex(json.load(f))
+    return StockIndex(DEFAULT_STOCK)
+
+def stock_signature(path=STOCK_FILE):
+    """Cache key that changes whenever the stock file does"""
+    if not path.exists():
+        return None
+    stat = path.stat()
+    return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+if __name__ == "__main__":
+    import random
+    import time
+    bodies = ["Saloon", "SUV", "Estate", "Coupe", "Hatchback"]
+    units = [
+        {"stock_id": f"STK{n}", "make": "BMW", "model": "X", "variant": "", "year": 2023,
+         "price": random.randint(15_000, 120_000), "body_type": random.choice(bodies),
+         "garage": random.choice(SITE_NAMES)}
+        for n in range(50_000)
+    ]
+    start = time.perf_counter()
+    index = StockIndex(units)
+    print(f"indexed {len(index):,} units in {(time.perf_counter() - start) * 1000:.0f} ms")
+    start = time.perf_counter()
+    for n in range(2_000):
+        index.recommend_for(random.randint(2_000, 30_000), random.choice([300, 500, 800]),
+                            random.choice(SITE_NAMES), random.choice([None, "SUV"]), 60)
+    print(f"recommend (uncached): {(time.perf_counter() - start) / 2_000 * 1000:.2f} ms")
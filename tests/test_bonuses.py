@@ -0,0 +1,20 @@
+# Bonus rules evaluated against site stock for a given day.
+import datetime
+
+from bonuses import BonusEngine
+from stock import StockIndex
+
+GARAGE = "Sytner BMW Cardiff"
+FAST_SELLER = {"id": "fast-seller", "label": "Fast Seller", "amount": 150,
+               "min_site_stock": 1, "max_stock_age_days": 21}
+
+def _engine(arrived):
+    stock = StockIndex([{"stock_id": "S1", "make": "BMW", "model": "X5", "price": 60_000,
+                         "body_type": "SUV", "garage": GARAGE, "arrived": arrived}])
+    return BonusEngine([FAST_SELLER], stock)
+
+def test_stock_age_is_measured_on_the_day_asked_about():
+    engine = _engine("2026-03-01")
+    assert engine.context("BMW", "X5", GARAGE, datetime.date(2026, 3, 11))["stock_age_days"] == 10
+    assert engine.total("BMW", "X5", GARAGE, datetime.date(2026, 3, 11)) == 150
+    assert engine.total("BMW", "X5", GARAGE, datetime.date(2026, 4, 1)) == 0
@@ -0,0 +1,41 @@
+# Exports read live rows from the snapshot and cold rows from the archive.
+import datetime
+import json
+
+import pytest
+
+import archive
+import snapshot
+from export import iter_rows
+from snapshot import Snapshot, journey_columns, source_signature, write_snapshot
+
+@pytest.fixture
+def journeys_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, "ARCHIVE_DIR", tmp_path / "archive")
+    monkeypatch.setattr(archive, "MANIFEST_FILE", tmp_path / "archive" / "manifest.json")
+    monkeypatch.setattr(snapshot, "SNAPSHOT_DIR", tmp_path / "snapshots")
+    path = tmp_path / "journeys.json"
+    monkeypatch.setitem(archive.TIERS["journeys"], "source", path)
+    return path
+
+def test_missing_ints_export_blank_from_live_and_archived_rows(journeys_file):
+    now = datetime.datetime.now()
+    # Two live journeys, one with no deposit, and an old one that tiering archives
+    created_and_deposit = [(now, 500), (now, None), (now - datetime.timedelta(days=400), None)]
+    journeys = [{
+        "tracking_id": f"J{n}",
+        "created_date": created.isoformat(),
+        "customer": {"name": f"Customer {n}"},
+        "vehicle": {"reg": f"AB{n}CDE", "make": "BMW", "model": "X5"},
+        "financial": {"deposit": deposit, "trade_in_value": 12_000},
+        "current_stage": 0,
+    } for n, (created, deposit) in enumerate(created_and_deposit)]
+    journeys_file.write_text(json.dumps(journeys))
+    assert archive.tier("journeys", now=now)["moved"] == 1
+
+    signature = source_signature(journeys_file)
+    live = Snapshot(write_snapshot("journeys", journeys_file, journey_columns(journeys_file), signature))
+    for text in (False, True):
+        rows = list(iter_rows("journeys", ["Tracking ID", "Deposit", "Trade-in Value"],
+                              include_archive=True, snapshot=live, text=text))
+        assert rows == [("J0", 500, 12_000), ("J1", None, 12_000), ("J2", None, 12_000)]
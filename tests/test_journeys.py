@@ -0,0 +1,85 @@
+# Journey event log: materialised file, catch-up and archive tiering.
+import datetime
+import json
+
+import pytest
+
+import archive
+from journeys import DuplicateVehicle, InvalidTransition, JourneyStore
+
+def _journey(i, created, stage=0):
+    return {
+        "tracking_id": f"J{i:07d}",
+        "created_date": created.isoformat(),
+        "customer": {"name": f"Customer {i}", "email": f"c{i}@example.com", "phone": "07700900000"},
+        "vehicle": {"reg": f"AB{i:02d}CDE", "make": "BMW", "model": "3 Series", "year": 2021},
+        "current_stage": stage,
+    }
+
+@pytest.fixture
+def paths(tmp_path, monkeypatch):
+    journeys_file = tmp_path / "journeys.json"
+    monkeypatch.setattr(archive, "ARCHIVE_DIR", tmp_path / "archive")
+    monkeypatch.setattr(archive, "MANIFEST_FILE", tmp_path / "archive" / "manifest.json")
+    monkeypatch.setitem(archive.TIERS["journeys"], "source", journeys_file)
+    return tmp_path / "events.sqlite", journeys_file
+
+def _file_ids(path):
+    with open(path) as f:
+        return {j["tracking_id"] for j in json.load(f)}
+
+def test_events_from_another_store_are_caught_up(paths):
+    now = datetime.datetime.now()
+    first, second = JourneyStore(*paths), JourneyStore(*paths)
+    first.create(_journey(1, now))
+    first.advance("J0000001", 2)
+    assert second.get("J0000001")["current_stage"] == 2
+    assert second.audit() == []
+
+def test_tiered_journeys_stay_archived_after_refresh(paths):
+    events, journeys_file = paths
+    now = datetime.datetime.now()
+    store = JourneyStore(events, journeys_file)
+    old = now - datetime.timedelta(days=400)
+    for i in range(3):
+        store.create(_journey(i, old))
+    store.create(_journey(3, now))
+    store.advance("J0000000", 1)
+
+    assert archive.tier("journeys", now=now)["moved"] == 3
+    assert {j["tracking_id"] for j in store.all()} == {"J0000003"}
+    assert _file_ids(journeys_file) == {"J0000003"}
+
+    # New events after tiering are written out without the archived journeys
+    store.advance("J0000003", 1)
+    assert _file_ids(journeys_file) == {"J0000003"}
+    reopened = JourneyStore(events, journeys_file)
+    assert {j["tracking_id"] for j in reopened.all()} == {"J0000003"}
+    with pytest.raises(InvalidTransition):
+        store.create(_journey(1, now))
+
+def test_file_seq_survives_the_newest_journey_being_archived(paths):
+    events, journeys_file = paths
+    now = datetime.datetime.now()
+    store = JourneyStore(events, journeys_file)
+    store.create(_journey(1, now))
+    store.create(_journey(2, now - datetime.timedelta(days=400)))
+    archive.tier("journeys", now=now)
+    store.all()
+    # A store opening the file it wrote starts from the recorded sequence, not the newest journey left
+    reopened = JourneyStore(events, journeys_file)
+    assert reopened.seq == store.seq
+    assert {j["tracking_id"] for j in reopened.all()} == {"J0000001"}
+
+def test_second_journey_for_the_same_car_is_rejected(paths):
+    now = datetime.datetime.now()
+    first, second = JourneyStore(*paths), JourneyStore(*paths)
+    first.create(_journey(1, now))
+    same_car = dict(_journey(2, now), vehicle={"reg": "ab01 cde"})
+    with pytest.raises(DuplicateVehicle):
+        second.create(same_car)
+    same_vin = dict(_journey(3, now), vehicle={"reg": "XY99ZZZ", "vin": "WBA12345678901234"})
+    second.create(same_vin)
+    with pytest.raises(DuplicateVehicle):
+        first.create(dict(_journey(4, now), vehicle={"vin": "wba-12345678901234"}))
+    assert {j["tracking_id"] for j in first.all()} == {"J0000001", "J0000003"}
@@ -0,0 +1,46 @@
+# Rolling market statistics.
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from market import DAY_US, MarketStats
+
+# Mid-year, so every sale in the window has the same age band
+NOW = int(datetime.datetime(2026, 7, 1).timestamp()) * 1_000_000
+SALES = 2000
+
+def _closed_at(i):
+    # One sale every 1.2 hours for 100 days up to NOW
+    return NOW - (SALES - i) * DAY_US // 20
+
+def _market():
+    market = MarketStats(window_days=30)
+    for i in range(SALES):
+        model = "X5" if i % 2 else "3 Series"
+        market.record_sale("BMW", model, 2020, _closed_at(i), 10 + i % 20, 0.9)
+    return market
+
+def _x5_sales_since(cutoff):
+    return sum(1 for i in range(1, SALES, 2) if _closed_at(i) >= cutoff)
+
+def test_falls_back_to_broader_segments():
+    market = _market()
+    assert market.stats("BMW", "X5", 2020, NOW)["basis"] == "BMW X5 (4-6 yrs)"
+    assert market.stats("BMW", "i4", 2020, NOW)["basis"] == "BMW"
+    assert market.stats("Audi", "A4", 2020, NOW)["basis"] == "All makes"
+
+def test_old_sales_age_out_of_the_window():
+    market = _market()
+    assert market.stats("BMW", "X5", 2020, NOW)["sales"] == _x5_sales_since(NOW - 30 * DAY_US)
+    assert market.stats("BMW", "X5", 2020, NOW + 10 * DAY_US)["sales"] == _x5_sales_since(NOW - 20 * DAY_US)
+    assert market.stats("BMW", "X5", 2020, NOW + 31 * DAY_US) is None
+
+def test_concurrent_queries_expire_each_sale_once():
+    market = _market()
+    moments = [NOW + (i % 200) * DAY_US // 10 for i in range(4000)]
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(lambda now: market.stats("BMW", "X5", 2020, now), moments))
+    latest = max(moments)
+    assert market.stats("BMW", "X5", 2020, latest)["sales"] == _x5_sales_since(latest - 30 * DAY_US)
+    window = market._windows[("BMW", "X5")]
+    assert window.count == len(window.events)
+    assert abs(window.days - sum(days for _, days, _ in window.events)) < 1e-6
@@ -0,0 +1,47 @@
+# Outbox delivery bookkeeping.
+import time
+
+import notify
+from notify import HttpSmsTransport, Outbox
+
+class FakeGateway:
+    def __init__(self, results):
+        self.results = results
+
+    def post_json(self, path, body):
+        return {"results": self.results}
+
+def sms_transport(results):
+    transport = HttpSmsTransport.__new__(HttpSmsTransport)
+    transport.client = FakeGateway(results)
+    return transport
+
+def test_messages_without_a_gateway_result_are_failed():
+    messages = [{"id": n, "recipient": f"0770000000{n}", "body": "hi"} for n in range(3)]
+    errors = sms_transport([{"ok": True}]).send_batch(messages)
+    assert set(errors) == {1, 2}
+
+def test_rejected_messages_are_retried(tmp_path):
+    outbox = Outbox(tmp_path / "outbox.sqlite", {"sms": sms_transport([{"ok": True}])})
+    first = outbox.enqueue("sms", "07700000001", "one")
+    second = outbox.enqueue("sms", "07700000002", "two")
+    assert outbox.drain_once("sms") == 1
+    assert outbox.status(first)["status"] == "sent"
+    assert outbox.status(second)["status"] == "pending"
+    assert outbox.status(second)["attempts"] == 1
+
+def test_live_claims_survive_another_process_starting(tmp_path, monkeypatch):
+    path = tmp_path / "outbox.sqlite"
+    worker = Outbox(path, {})
+    message = worker.enqueue("sms", "07700000001", "hello")
+    assert worker._claim("sms")
+
+    # A second process opening the outbox must not take over the live claim
+    other = Outbox(path, {})
+    assert other.status(message)["status"] == "sending"
+    assert other._claim("sms") == []
+
+    # Once the lease runs out the message is claimed again
+    monkeypatch.setattr(notify, "CLAIM_LEASE", 0.0)
+    time.sleep(0.01)
+    assert [m["id"] for m in other._claim("sms")] == [message]
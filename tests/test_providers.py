@@ -0,0 +1,113 @@
+# Provider clients against local stub servers (see providers._stub_server).
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+import pytest
+
+from providers import (CircuitBreaker, CircuitOpen, POOL_SIZE, ProviderClient, ProviderError,
+                       RateLimited, TokenBucket, _stub_server, get_client)
+
+@pytest.fixture
+def stub():
+    servers = []
+
+    def start(latency=0.0, failure_rate=0.0):
+        server, url = _stub_server(latency, failure_rate)
+        servers.append(server)
+        return server, url
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+def test_single_flight_collapses_concurrent_lookups(stub):
+    server, url = stub(latency=0.2)
+    client = ProviderClient("stub", url, rate=1000, burst=1000)
+    with ThreadPoolExecutor(10) as pool:
+        results = list(pool.map(lambda _: client.get_json("/vehicles/AB12CDE"), range(10)))
+    assert server.requests == 1
+    assert all(r == {"path": "/vehicles/AB12CDE"} for r in results)
+    # Each caller gets its own decoded copy
+    assert len({id(r) for r in results}) == 10
+
+def test_sequential_requests_reuse_pooled_connections(stub):
+    server, url = stub()
+    client = ProviderClient("stub", url, rate=1000, burst=1000)
+    for n in range(50):
+        client.get_json(f"/vehicles/P{n}")
+    assert server.requests == 50
+    assert len(server.peers) <= POOL_SIZE
+    assert len(server.peers) == 1
+
+def test_token_bucket_refuses_callers_that_would_queue_too_long():
+    bucket = TokenBucket(rate=10, burst=5)
+
+    def take(_):
+        try:
+            bucket.acquire(max_wait=0.3)
+            return True
+        except RateLimited:
+            return False
+
+    with ThreadPoolExecutor(20) as pool:
+        admitted = sum(pool.map(take, range(20)))
+    # The burst plus what refills within max_wait, never everyone
+    assert 5 <= admitted <= 9
+
+def test_circuit_opens_after_repeated_failures_and_recovers(stub):
+    server, url = stub(failure_rate=1.0)
+    client = ProviderClient("stub", url, rate=1000, burst=1000,
+                            breaker=CircuitBreaker(threshold=3, reset_after=0.3))
+    outcomes = []
+    for n in range(10):
+        with pytest.raises(ProviderError) as caught:
+            client.get_json(f"/vehicles/F{n}")
+        outcomes.append(type(caught.value))
+    assert outcomes[:3] == [ProviderError] * 3
+    assert outcomes[3:] == [CircuitOpen] * 7
+    assert server.requests == 3
+
+    server.failure_rate = 0.0
+    time.sleep(0.35)
+    assert client.get_json("/vehicles/RECOVERED") == {"path": "/vehicles/RECOVERED"}
+    assert client.breaker.state == "closed"
+
+def test_half_open_probe_failure_reopens_the_circuit(stub):
+    server, url = stub(failure_rate=1.0)
+    client = ProviderClient("stub", url, rate=1000, burst=1000,
+                            breaker=CircuitBreaker(threshold=1, reset_after=0.2))
+    with pytest.raises(ProviderError):
+        client.get_json("/vehicles/A")
+    time.sleep(0.25)
+    with pytest.raises(ProviderError) as caught:
+        client.get_json("/vehicles/B")
+    assert type(caught.value) is ProviderError
+    assert client.breaker.state == "open"
+    assert server.requests == 2
+
+def test_unexpected_probe_error_does_not_leave_the_circuit_half_open(stub, monkeypatch):
+    server, url = stub(failure_rate=1.0)
+    client = ProviderClient("stub", url, rate=1000, burst=1000,
+                            breaker=CircuitBreaker(threshold=1, reset_after=0.2))
+    with pytest.raises(ProviderError):
+        client.get_json("/vehicles/A")
+    time.sleep(0.25)
+    request = client.session.request
+
+    def broken(*args, **kwargs):
+        raise ValueError("adapter error")
+    monkeypatch.setattr(client.session, "request", broken)
+    with pytest.raises(ValueError):
+        client.get_json("/vehicles/B")
+    assert client.breaker.state == "open"
+
+    monkeypatch.setattr(client.session, "request", request)
+    server.failure_rate = 0.0
+    time.sleep(0.25)
+    assert client.get_json("/vehicles/C") == {"path": "/vehicles/C"}
+    assert client.breaker.state == "closed"
+
+def test_unconfigured_provider_has_no_client(monkeypatch):
+    monkeypatch.delenv("SYTNER_DVSA_MOT_URL", raising=False)
+    assert get_client("dvsa_mot") is None
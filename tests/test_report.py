@@ -0,0 +1,95 @@
+# Vehicle report PDFs and the background report service.
+import io
+import re
+import threading
+import zipfile
+
+import pytest
+
+from report import ReportService, vehicle_report
+
+def _data(reg, history=3):
+    return {
+        "vehicle": {"make": "BMW", "model": "3 Series", "year": 2018, "mileage": 54_000, "vin": "WBA8B" + reg},
+        "mot_tax": {"mot_next_due": "2026-03-01", "tax_expiry": "2026-01-01",
+                    "mot_history": [{"date": f"{2024 - n}-08-17", "result": "Pass", "mileage": 52_000 - n * 600}
+                                    for n in range(history)]},
+        "recalls": [{"id": "R-2023-001", "summary": "Airbag inflator recall (replace module)", "open": True}],
+        "history_flags": {"write_off": False, "theft": False, "mileage_anomaly": False, "note": None},
+        "valuation": {"value": 14_250, "low": 13_100, "high": 15_400, "comparables": 38},
+    }
+
+class Gather:
+    """Counts lookups; registrations starting BAD fail"""
+
+    def __init__(self):
+        self.calls = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, reg):
+        self.calls.append(reg)
+        self.release.wait(5)
+        if reg.startswith("BAD"):
+            raise LookupError(f"No record for {reg}")
+        return _data(reg)
+
+@pytest.fixture
+def service(tmp_path):
+    gather = Gather()
+    service = ReportService(gather, lambda: "v1", directory=tmp_path, workers=4)
+    yield service
+    service.shutdown()
+
+@pytest.mark.parametrize("history", [3, 60])
+def test_xref_offsets_land_on_their_objects(history):
+    pdf = vehicle_report("AB12CDE", _data("AB12CDE", history))
+    assert pdf.startswith(b"%PDF-") and pdf.rstrip().endswith(b"%%EOF")
+    xref = int(pdf.rsplit(b"startxref\n", 1)[1].split()[0])
+    entries = re.findall(rb"(\d{10}) 00000 n", pdf[xref:])
+    assert entries and all(pdf[int(o):].startswith(b"%d 0 obj" % n) for n, o in enumerate(entries, 1))
+
+def test_long_mot_history_runs_onto_more_pages():
+    short = vehicle_report("AB12CDE", _data("AB12CDE", 3))
+    long = vehicle_report("AB12CDE", _data("AB12CDE", 60))
+    assert long.count(b"/Type /Page ") > short.count(b"/Type /Page ") == 1
+
+def test_repeat_reports_come_from_the_cache(service):
+    first = service.report("AB12 CDE")
+    assert service.report("ab12cde") == first == service.cached("AB12CDE")
+    assert service.gather.calls == ["AB12CDE"]
+
+def test_new_data_version_renders_again(service):
+    service.report("AB12CDE")
+    service.version = lambda: "v2"
+    assert service.cached("AB12CDE") is None
+    service.report("AB12CDE")
+    assert service.gather.calls == ["AB12CDE", "AB12CDE"]
+
+def test_in_flight_render_is_shared(service):
+    service.gather.release.clear()
+    futures = [service.submit("AB12CDE") for _ in range(10)]
+    service.gather.release.set()
+    assert len({id(f) for f in futures}) == 1
+    futures[0].result(5)
+    assert service.gather.calls == ["AB12CDE"]
+
+def test_data_passed_in_skips_gather(service):
+    pdf = service.submit("AB12CDE", _data("AB12CDE")).result(5)
+    assert service.gather.calls == []
+    assert service.report("AB12CDE") == pdf
+
+def test_bundle_zips_reports_and_returns_failures(service):
+    out = io.BytesIO()
+    failed = service.bundle(["AB12CDE", "BAD1ABC", "KT68XYZ"], out)
+    assert list(failed) == ["BAD1ABC"] and "No record" in failed["BAD1ABC"]
+    with zipfile.ZipFile(out) as archive:
+        assert sorted(archive.namelist()) == ["AB12CDE.pdf", "KT68XYZ.pdf"]
+        assert archive.read("KT68XYZ.pdf") == service.cached("KT68XYZ")
+
+def test_evict_keeps_the_newest_reports(service):
+    service.max_files = 2
+    for reg in ["AA11AAA", "BB22BBB", "CC33CCC"]:
+        service.report(reg)
+    assert service.evict() == 1
+    assert len(list(service.directory.glob("*.pdf"))) == 2
@@ -0,0 +1,30 @@
+# Snapshot generations follow the source file they were built from.
+import json
+import os
+
+import pytest
+
+import snapshot
+from snapshot import open_snapshot
+
+@pytest.fixture
+def source(tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshot, "SNAPSHOT_DIR", tmp_path / "snapshots")
+    monkeypatch.setattr(snapshot, "_open_snapshots", {})
+    path = tmp_path / "records.json"
+    path.write_text(json.dumps([{"id": "A"}]))
+    return path
+
+def _columns(path):
+    return {"id": [r["id"] for r in json.loads(path.read_text())]}
+
+def test_rewrite_during_build_is_picked_up_next_open(source):
+    def build(path):
+        columns = _columns(path)
+        # Another process saves the file after it was read
+        path.write_text(json.dumps([{"id": "A"}, {"id": "B"}]))
+        os.utime(path, ns=(1, 1))
+        return columns
+
+    assert open_snapshot("records", source, build).values("id") == ["A"]
+    assert open_snapshot("records", source, _columns).values("id") == ["A", "B"]
@@ -0,0 +1,29 @@
+# Tracking ID format, check character and ordering.
+import pytest
+
+from tracking import ALPHABET, ID_LENGTH, VALUES, InvalidTrackingId, TrackingIdAllocator, parse_tracking_id
+
+def test_new_ids_parse_and_sort_by_creation():
+    allocator = TrackingIdAllocator(node=0)
+    ids = [allocator.new_id() for _ in range(1000)]
+    assert ids == sorted(ids) and len(set(ids)) == len(ids)
+    assert all(len(i) == ID_LENGTH and parse_tracking_id(i) == i for i in ids)
+
+def test_customer_input_is_normalised():
+    tracking_id = TrackingIdAllocator(node=0).new_id()
+    typed = " " + tracking_id[:7].lower() + "-" + tracking_id[7:].lower() + " "
+    assert parse_tracking_id(typed) == tracking_id
+
+def test_single_character_typo_is_rejected():
+    tracking_id = TrackingIdAllocator(node=0).new_id()
+    typo = tracking_id[:5] + ALPHABET[(VALUES[tracking_id[5]] + 1) % 32] + tracking_id[6:]
+    with pytest.raises(InvalidTrackingId):
+        parse_tracking_id(typo)
+
+@pytest.mark.parametrize("text", ["short", "01JB8ZK3QX0A00H4M2TVRG", ""])
+def test_wrong_length_is_rejected(text):
+    with pytest.raises(InvalidTrackingId):
+        parse_tracking_id(text)
+
+def test_legacy_ids_are_still_accepted():
+    assert parse_tracking_id("abc123xyz456") == "ABC123XYZ456"
@@ -0,0 +1,244 @@
+# tracking.py
+# Time-sortable, collision-checked customer journey tracking IDs.
+#
+# An ID is 21 Crockford base32 characters (0-9 and A-Z without I, L, O, U),
+# so it is URL-safe and survives being read out over the phone:
+#
+#   TTTTTTTTTT NN SS RRRRRR C
+#   |          |  |  |      check character (Luhn mod 32) to catch typos
+#   |          |  |  30 random bits so IDs cannot be guessed from their neighbours
+#   |          |  per-node sequence within the millisecond
+#   |          node number leased by this process (see _lease_node)
+#   milliseconds since the epoch
+#
+# IDs sort by creation time, so journey stores and archives append in key
+# order and "journeys since T" is a range scan from id_floor(T) rather than
+# a full sort. Time, node and sequence together make an ID unique across
+# every process sharing the data directory; allocate() also checks it
+# against the caller's store before handing it out. The 12-character IDs
+# issued before this scheme are still accepted by parse_tracking_id().
+# `python tracking.py` benchmarks inserts and recent-journey range queries
+# against the old random IDs.
+import datetime
+import os
+import random
+import re
+import socket
+import threading
+import time
+import zlib
+
+from config import DATA_DIR
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to a random node number
+    fcntl = None
+
+ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+VALUES = {ch: idx for idx, ch in enumerate(ALPHABET)}
+# Characters a customer is likely to type for the ones the alphabet leaves out
+TYPOS = str.maketrans("ILO", "110")
+
+TIME_CHARS, NODE_CHARS, SEQ_CHARS, RANDOM_CHARS = 10, 2, 2, 6
+ID_LENGTH = TIME_CHARS + NODE_CHARS + SEQ_CHARS + RANDOM_CHARS + 1
+MAX_NODES = 32 ** NODE_CHARS
+MAX_SEQUENCE = 32 ** SEQ_CHARS
+
+NODES_DIR = DATA_DIR / "tracking_nodes"
+LEGACY_ID = re.compile(r"^[A-Z0-9]{12}$")
+
+class InvalidTrackingId(ValueError):
+    """A tracking ID is malformed or fails its check character"""
+
+# ============================================================================
+# ENCODING
+# ============================================================================
+
+def _encode(value, width):
+    chars = []
+    for _ in range(width):
+        value, digit = divmod(value, 32)
+        chars.append(ALPHABET[digit])
+    return "".join(reversed(chars))
+
+def _decode(text):
+    value = 0
+    for ch in text:
+        value = value * 32 + VALUES[ch]
+    return value
+
+def check_character(body):
+    """Luhn mod 32 check character: catches any single-character slip and most transpositions"""
+    total, factor = 0, 2
+    for ch in reversed(body):
+        addend = factor * VALUES[ch]
+        total += addend // 32 + addend % 32
+        factor = 3 - factor
+    return ALPHABET[-total % 32]
+
+def id_floor(when):
+    """Smallest ID that could be issued at or after `when` (datetime or epoch ms)"""
+    if isinstance(when, datetime.datetime):
+        when = int(when.timestamp() * 1000)
+    return _encode(when, TIME_CHARS)
+
+def created_at(tracking_id):
+    """Creation time encoded in a tracking ID, or None for a legacy ID"""
+    if len(tracking_id) != ID_LENGTH:
+        return None
+    return datetime.datetime.fromtimestamp(_decode(tracking_id[:TIME_CHARS]) / 1000)
+
+def parse_tracking_id(text):
+    """Canonical tracking ID from user input; raises InvalidTrackingId"""
+    cleaned = re.sub(r"[\s-]", "", text or "").upper()
+    if LEGACY_ID.match(cleaned):
+        return cleaned
+    cleaned = cleaned.translate(TYPOS)
+    if len(cleaned) != ID_LENGTH or any(ch not in VALUES for ch in cleaned):
+        raise InvalidTrackingId("Tracking IDs are 21 characters of letters and numbers")
+    if check_character(cleaned[:-1]) != cleaned[-1]:
+        raise InvalidTrackingId("That tracking ID has a typo - please check it against your confirmation")
+    return cleaned
+
+# ============================================================================
+# ALLOCATION
+# ============================================================================
+
+def _lease_node(directory=NODES_DIR):
+    """Claim a node number no other live process holds
+
+    Each node is a lock file held with flock for the life of the process, so
+    a crashed process releases its number automatically. SYTNER_NODE_ID pins
+    the number for processes on different hosts that do not share the data
+    directory.
+    """
+    pinned = os.environ.get("SYTNER_NODE_ID")
+    if pinned is not None:
+        return int(pinned) % MAX_NODES, None
+    if fcntl is None:
+        return random.randrange(MAX_NODES), None
+    directory.mkdir(parents=True, exist_ok=True)
+    start = zlib.crc32(f"{socket.gethostname()}:{os.getpid()}".encode()) % MAX_NODES
+    for offset in range(MAX_NODES):
+        node = (start + offset) % MAX_NODES
+        handle = open(directory / f"{node}.lock", "a")
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            continue
+        return node, handle
+    raise RuntimeError("every tracking ID node is in use")
+
+class TrackingIdAllocator:
+    """Monotonic ID source for one process"""
+
+    def __init__(self, node=None):
+        if node is None:
+            node, self._lease = _lease_node()
+        else:
+            self._lease = None
+        self.node = node
+        self._node_chars = _encode(node, NODE_CHARS)
+        self._last_ms = 0
+        self._sequence = 0
+        self._random = random.SystemRandom()
+        self._lock = threading.Lock()
+
+    def _tick(self):
+        """(milliseconds, sequence), never repeating and never going backwards"""
+        with self._lock:
+            now = time.time_ns() // 1_000_000
+            if now > self._last_ms:
+                self._last_ms, self._sequence = now, 0
+            else:
+                # Same millisecond, or the clock stepped back: carry on from the last one
+                self._sequence += 1
+                if self._sequence == MAX_SEQUENCE:
+                    self._last_ms, self._sequence = self._last_ms + 1, 0
+            return self._last_ms, self._sequence
+
+    def new_id(self):
+        ms, sequence = self._tick()
+        body = (_encode(ms, TIME_CHARS) + self._node_chars + _encode(sequence, SEQ_CHARS)
+                + _encode(self._random.getrandbits(5 * RANDOM_CHARS), RANDOM_CHARS))
+        return body + check_character(body)
+
+    def allocate(self, exists=None, attempts=5):
+        """New ID that `exists(id)` confirms is not already in the store"""
+        for _ in range(attempts):
+            tracking_id = self.new_id()
+            if exists is None or not exists(tracking_id):
+                return tracking_id
+        raise RuntimeError("could not allocate an unused tracking ID")
+
+_allocator = None
+_allocator_lock = threading.Lock()
+
+def get_allocator():
+    """Process-wide allocator (leases its node on first use)"""
+    global _allocator
+    with _allocator_lock:
+        if _allocator is None:
+            _allocator = TrackingIdAllocator()
+        return _allocator
+
+if __name__ == "__main__":
+    import bisect
+    import sqlite3
+    import string
+    import tempfile
+    from pathlib import Path
+
+    n = 200_000
+    allocator = TrackingIdAllocator(node=0)
+    ids = [allocator.new_id() for _ in range(n)]
+    assert len(set(ids)) == n and ids == sorted(ids)
+    assert all(parse_tracking_id(i) == i for i in ids[:1000])
+    typo = ids[0][:5] + ALPHABET[(VALUES[ids[0][5]] + 1) % 32] + ids[0][6:]
+    try:
+        parse_tracking_id(typo)
+        raise AssertionError("typo accepted")
+    except InvalidTrackingId:
+        pass
+
+    rng = random.Random(1)
+    legacy = ["".join(rng.choices(string.ascii_uppercase + string.digits, k=12)) for _ in range(n)]
+    # Spread creation times over the last year, one journey every ~158 seconds
+    base = int(time.time() * 1000) - 365 * 86_400_000
+    created = [base + i * 157_680 for i in range(n)]
+    timed = [_encode(ms, TIME_CHARS) + i[TIME_CHARS:] for ms, i in zip(created, ids)]
+    since = datetime.datetime.fromtimestamp((base + 358 * 86_400_000) / 1000)
+    since_ms = int(since.timestamp() * 1000)
+
+    tmp = Path(tempfile.mkdtemp())
+    for label, keys in (("random", legacy), ("time-sorted", timed)):
+        conn = sqlite3.connect(tmp / f"{label}.sqlite")
+        conn.execute("CREATE TABLE journeys (tracking_id TEXT PRIMARY KEY, created INTEGER, body TEXT)"
+                     " WITHOUT ROWID")
+        start = time.perf_counter()
+        for offset in range(0, n, 100):
+            with conn:
+                conn.executemany("INSERT INTO journeys VALUES (?, ?, ?)",
+                                 [(k, c, "x" * 200) for k, c in
+                                  zip(keys[offset:offset + 100], created[offset:offset + 100])])
+        insert = time.perf_counter() - start
+        size = (tmp / f"{label}.sqlite").stat().st_size
+        if label == "random":
+            sql, arg = "SELECT tracking_id FROM journeys WHERE created >= ? ORDER BY created", since_ms
+        else:
+            sql, arg = "SELECT tracking_id FROM journeys WHERE tracking_id >= ? ORDER BY tracking_id", id_floor(since)
+        start = time.perf_counter()
+        for _ in range(50):
+            recent = conn.execute(sql, (arg,)).fetchall()
+        query = (time.perf_counter() - start) / 50
+        conn.close()
+        print(f"{label:>11}: insert {n:,} in {insert:.2f}s, {size / 1e6:.1f} MB, "
+              f"last 7 days ({len(recent):,} rows) in {query * 1000:.2f} ms")
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        recent = timed[bisect.bisect_left(timed, id_floor(since)):]
+    print(f"in-memory range scan over sorted IDs: {(time.perf_counter() - start):.3f} ms "
+          f"({len(recent):,} rows)")
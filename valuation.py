@@ -0,0 +1,162 @@
+# valuation.py
+# Comparable-sales valuation engine behind estimate_value().
+#
+# Historical trade-in sales are indexed into (make, model, year) buckets,
+# each holding mileage-sorted NumPy arrays of mileage and sale price. A
+# quote binary-searches the bucket for the vehicle's mileage and takes the
+# k nearest comparables from the surrounding window, widening to adjacent
+# model years when a bucket is thin. Comparable prices are adjusted for the
+# mileage and year difference, and the spread of the adjusted prices gives
+# a confidence band. With no comparables the original formula is used.
+import csv
+import datetime
+import time
+
+import numpy as np
+
+from config import DATA_DIR
+
+HISTORY_FILE = DATA_DIR / "valuation_history.csv"
+
+CONDITION_MULTIPLIERS = {"excellent": 1.05, "good": 1.0, "fair": 0.9, "poor": 0.8}
+
+K_NEAREST = 8
+MIN_COMPARABLES = 3
+MAX_YEAR_SPREAD = 2
+PRICE_PER_MILE = 0.10
+YEARLY_DEPRECIATION = 0.08
+
+def formula_value(year, mileage):
+    """Fallback linear valuation used when there are no comparables"""
+    age = datetime.date.today().year - year
+    return 25000 - (age * 2000) - (mileage / 10)
+
+class ValuationIndex:
+    """Bucketed index of historical sales for k-nearest comparable lookups"""
+
+    def __init__(self):
+        self._buckets = {}  # (make, model, year) -> (mileages, prices), sorted by mileage
+
+    def __len__(self):
+        return sum(len(m) for m, _ in self._buckets.values())
+
+    @staticmethod
+    def _key(make, model, year):
+        return (make.strip().upper(), model.strip().upper(), int(year))
+
+    @classmethod
+    def build(cls, rows):
+        """Build from (make, model, year, mileage, price) rows in one sort"""
+        index = cls()
+        grouped = {}
+        for make, model, year, mileage, price in rows:
+            grouped.setdefault(cls._key(make, model, year), []).append((mileage, price))
+        for key, sales in grouped.items():
+            data = np.asarray(sales, dtype=np.int64)
+            order = np.argsort(data[:, 0], kind="stable")
+            index._buckets[key] = (np.ascontiguousarray(data[order, 0]), np.ascontiguousarray(data[order, 1]))
+        return index
+
+    def add(self, make, model, year, mileage, price):
+        """Insert one sale, keeping its bucket sorted"""
+        key = self._key(make, model, year)
+        mileages, prices = self._buckets.get(key, (np.empty(0, np.int64), np.empty(0, np.int64)))
+        pos = int(np.searchsorted(mileages, mileage))
+        self._buckets[key] = (np.insert(mileages, pos, mileage), np.insert(prices, pos, price))
+
+    def _nearest(self, key, mileage, k):
+        """Up to k (mileage, price) comparables nearest in mileage within one bucket"""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return None
+        mileages, prices = bucket
+        pos = int(np.searchsorted(mileages, mileage))
+        lo, hi = max(0, pos - k), min(len(mileages), pos + k)
+        window = mileages[lo:hi]
+        if len(window) > k:
+            pick = np.argpartition(np.abs(window - mileage), k - 1)[:k]
+            return window[pick], prices[lo:hi][pick]
+        return window, prices[lo:hi]
+
+    def comparables(self, make, model, year, mileage, k=K_NEAREST):
+        """Nearest comparables with prices adjusted to the subject vehicle"""
+        found_miles, found_prices = [], []
+        base = self._key(make, model, year)
+        for spread in range(MAX_YEAR_SPREAD + 1):
+            for offset in ((0,) if spread == 0 else (-spread, spread)):
+                nearest = self._nearest((base[0], base[1], base[2] + offset), mileage, k)
+                if nearest is None:
+                    continue
+                miles, prices = nearest
+                year_factor = (1 - YEARLY_DEPRECIATION) ** offset
+                found_miles.append(miles)
+                found_prices.append(prices * year_factor + (miles - mileage) * PRICE_PER_MILE)
+            if sum(len(m) for m in found_miles) >= k:
+                break
+        if not found_miles:
+            return np.empty(0), np.empty(0)
+        miles, prices = np.concatenate(found_miles), np.concatenate(found_prices)
+        if len(miles) > k:
+            pick = np.argpartition(np.abs(miles - mileage), k - 1)[:k]
+            miles, prices = miles[pick], prices[pick]
+        return miles, prices
+
+    def quote(self, make, model, year, mileage, condition="good"):
+        """Comparable-based estimate with a confidence band, or None if too few comparables"""
+        miles, prices = self.comparables(make, model, year, mileage)
+        if len(prices) < MIN_COMPARABLES:
+            return None
+        weights = 1.0 / (1.0 + np.abs(miles - mileage) / 5000.0)
+        multiplier = CONDITION_MULTIPLIERS.get(condition, 1.0)
+        low, high = np.percentile(prices, [10, 90])
+        return {
+            "value": max(100, int(np.average(prices, weights=weights) * multiplier)),
+            "low": max(100, int(low * multiplier)),
+            "high": max(100, int(high * multiplier)),
+            "comparables": int(len(prices)),
+        }
+
+def load_history(path=HISTORY_FILE):
+    """Build an index from a make,model,year,mileage,price CSV of past trade-ins"""
+    if not path.exists():
+        return ValuationIndex()
+    with open(path, newline="") as f:
+        rows = (
+            (r["make"], r["model"], int(r["year"]), int(float(r["mileage"])), int(float(r["price"])))
+            for r in csv.DictReader(f)
+        )
+        return ValuationIndex.build(rows)
+
+def history_signature(path=HISTORY_FILE):
+    """Cache key that changes whenever the history file does"""
+    if not path.exists():
+        return None
+    stat = path.stat()
+    return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+def estimate(index, make, model, year, mileage, condition="good"):
+    """Quote from comparables, falling back to the formula valuation"""
+    quote = index.quote(make, model, year, mileage, condition) if index is not None else None
+    if quote is not None:
+        return quote
+    value = max(100, int(formula_value(year, mileage) * CONDITION_MULTIPLIERS.get(condition, 1.0)))
+    return {"value": value, "low": None, "high": None, "comparables": 0}
+
+if __name__ == "__main__":
+    import random
+    models = [("BMW", m) for m in ("1 Series", "3 Series", "5 Series", "X1", "X3", "X5")] + \
+             [("Audi", m) for m in ("A3", "A4", "Q5")] + [("Mercedes-Benz", m) for m in ("C-Class", "GLC")]
+    rows = []
+    for _ in range(2_000_000):
+        make, model = random.choice(models)
+        year = random.randint(2008, 2024)
+        mileage = random.randint(1_000, 150_000)
+        rows.append((make, model, year, mileage, int(40_000 * 0.88 ** (2025 - year) - mileage * 0.1)))
+    start = time.perf_counter()
+    index = ValuationIndex.build(rows)
+    print(f"indexed {len(index):,} sales in {time.perf_counter() - start:.1f}s")
+    start = time.perf_counter()
+    for _ in range(10_000):
+        index.quote("BMW", "3 Series", 2018, random.randint(10_000, 120_000))
+    print(f"quote: {(time.perf_counter() - start) / 10_000 * 1000:.3f} ms")
+    print(index.quote("BMW", "3 Series", 2018, 54_000))